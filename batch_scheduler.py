@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+动态微批处理调度器
+把并发到达的检测请求合并成一次批量 predict 调用
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# 默认配置（可通过环境变量覆盖）
+MAX_BATCH_SIZE = int(os.environ.get('YOLO_MAX_BATCH_SIZE', 8))
+MAX_WAIT_MS = float(os.environ.get('YOLO_MAX_WAIT_MS', 5))
+MAX_QUEUE_SIZE = int(os.environ.get('YOLO_MAX_QUEUE', 64))
+
+
+class QueueFullError(Exception):
+    """待处理请求数达到上限"""
+
+
+class BatchScheduler:
+    """
+    请求合并调度器
+
+    后台线程从队列中收集请求，直到凑满 max_batch_size 或距第一个请求
+    超过 max_wait_ms，然后按参数分组，每组调用一次
+    predict_fn(images, *params)，并返回与 images 等长的结果列表。
+
+    若提供 executor（需实现 submit(fn, *args) -> Future），批次会交给它执行，
+    同时最多有 concurrency 个批次在运行；其余请求留在队列里继续合并。
+    待处理请求超过 max_queue 时 submit 抛出 QueueFullError（0 表示不限制）。
+    """
+
+    def __init__(self, predict_fn, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                 max_queue=MAX_QUEUE_SIZE, executor=None, concurrency=1):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self.max_queue = max(0, int(max_queue))
+        self.executor = executor
+        self._queue = queue.Queue()
+        self._slots = threading.Semaphore(max(1, int(concurrency)))
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._thread = None
+
+    @property
+    def pending(self):
+        """已提交但尚未完成的请求数"""
+        return self._pending
+
+    def start(self):
+        """启动后台调度线程"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='batch-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """停止调度线程（已入队的请求会先处理完）"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, image, *params):
+        """提交单张图片，返回 concurrent.futures.Future"""
+        return self.submit_many([image], *params)[0]
+
+    def submit_many(self, images, *params):
+        """
+        一次提交多张图片（同一组参数），返回 Future 列表
+
+        容量检查是整体进行的：要么全部入队，要么抛出 QueueFullError
+        """
+        with self._lock:
+            if self.max_queue and self._pending + len(images) > self.max_queue:
+                raise QueueFullError(f'待处理请求已达上限 ({self.max_queue})')
+            self._pending += len(images)
+
+        futures = []
+        for image in images:
+            future = Future()
+            future.add_done_callback(self._release)
+            self._queue.put((image, params, future))
+            futures.append(future)
+        return futures
+
+    async def predict(self, image, *params):
+        """在 asyncio 中等待单张图片的检测结果"""
+        return await asyncio.wrap_future(self.submit(image, *params))
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def _collect(self):
+        """收集一个批次，收到停止信号时返回 None"""
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # 处理完当前批次后再退出
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            # 等待空闲的执行槽位，忙碌期间请求会在队列中累积成更大的批次
+            self._slots.acquire()
+            batch = self._collect()
+            if batch is None:
+                self._slots.release()
+                return
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        """按参数分组后批量推理，并把结果分发给各个 Future"""
+        groups = {}
+        for image, params, future in batch:
+            if future.set_running_or_notify_cancel():
+                groups.setdefault(params, []).append((image, future))
+
+        if not groups:
+            self._slots.release()
+            return
+
+        remaining = [len(groups)]
+
+        def finish(items, task):
+            try:
+                results = task.result() if isinstance(task, Future) else task
+                for (_, future), result in zip(items, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+            finally:
+                with self._lock:
+                    remaining[0] -= 1
+                    done = remaining[0] == 0
+                if done:
+                    self._slots.release()
+
+        for params, items in groups.items():
+            images = [image for image, _ in items]
+            if self.executor is None:
+                try:
+                    task = self.predict_fn(images, *params)
+                except Exception as e:
+                    task = Future()
+                    task.set_exception(e)
+                finish(items, task)
+            else:
+                try:
+                    task = self.executor.submit(self.predict_fn, images, *params)
+                except Exception as e:
+                    task = Future()
+                    task.set_exception(e)
+                    finish(items, task)
+                else:
+                    task.add_done_callback(lambda t, items=items: finish(items, t))
@@ -0,0 +1,550 @@
+# -*- coding: utf-8 -*-
+"""
+检测服务性能基准测试
+用合成图片（可配置分辨率和物体密度）在不同并发数下压测检测 API（/detect、/detect_batch、
+/detect_image）和简易 Web 界面（/detect），支持进程内调用和本地 socket 两种方式，
+统计吞吐量、p50/p95/p99 延迟、CPU 占用、峰值内存以及各阶段耗时（来自响应头 Server-Timing），
+结果输出为 JSON，可与之前的结果对比以发现性能回退
+
+示例:
+  python benchmark.py --target api --mode inprocess,socket --endpoints detect,detect_batch \\
+      --resolutions 640x480,1920x1080 --concurrency 1,4 --density 5,50 --output bench.json
+  python benchmark.py --compare baseline.json --output bench.json   # 对比并在回退超过阈值时返回非 0
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+try:
+    import psutil
+except ImportError:  # 可选：非 Linux 系统上统计服务进程的 CPU 和内存
+    psutil = None
+
+from stage_timing import parse_server_timing, STAGES
+
+ROOT = Path(__file__).resolve().parent
+
+# 压测目标的端点
+ENDPOINTS = {
+    'api': ('detect', 'detect_batch', 'detect_image'),
+    'simple': ('detect',)
+}
+MODES = ('inprocess', 'socket')
+
+# 记录到结果中的环境变量（影响服务性能的配置）
+ENV_PREFIX = 'YOLO_'
+
+
+# ---------- 合成图片 ----------
+
+def synthetic_image(width, height, objects, rng, quality=90):
+    """
+    生成 JPEG 图片：渐变背景 + 噪声 + objects 个随机颜色的矩形 / 椭圆
+
+    物体越多图片细节越多，JPEG 更大、解码更慢，检测框也可能更多
+    """
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width)),
+                     np.full((height, width), 128, np.float32)], axis=2)
+    image = (base + rng.normal(0, 8, (height, width, 3))).clip(0, 255).astype(np.uint8)
+    for _ in range(objects):
+        w = int(rng.uniform(0.03, 0.25) * width)
+        h = int(rng.uniform(0.03, 0.25) * height)
+        x1, y1 = int(rng.uniform(0, width - w)), int(rng.uniform(0, height - h))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        if rng.random() < 0.5:
+            cv2.rectangle(image, (x1, y1), (x1 + w, y1 + h), color, -1)
+        else:
+            cv2.ellipse(image, (x1 + w // 2, y1 + h // 2), (w // 2, h // 2), 0, 0, 360, color, -1)
+    ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes()
+
+
+def image_pool(width, height, objects, count, seed):
+    """同一场景使用的一组图片（种子固定，结果可复现）"""
+    rng = np.random.default_rng([seed, width, height, objects])
+    return [synthetic_image(width, height, objects, rng) for _ in range(count)]
+
+
+def parse_resolution(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+# ---------- 请求 ----------
+
+def build_request(target, endpoint, images, conf):
+    """(路径, 文件列表 [(字段名, 文件名, 字节)], 表单字段)"""
+    if target == 'simple':
+        return '/detect', [('image', 'bench.jpg', images[0])], {}
+    fields = {'conf_threshold': str(conf)}
+    if endpoint == 'detect_batch':
+        return '/detect_batch', [('images', f'bench_{i}.jpg', data) for i, data in enumerate(images)], fields
+    return f'/{endpoint}', [('image', 'bench.jpg', images[0])], fields
+
+
+def encode_multipart(files, fields):
+    """multipart/form-data 请求体"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8'))
+    for name, filename, data in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: image/jpeg\r\n\r\n'.encode('utf-8'))
+        parts.append(data)
+        parts.append(b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class SocketClient:
+    """通过本地 TCP 连接发送请求（每个压测线程一个保持连接）"""
+
+    def __init__(self, port):
+        self.port = port
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=300)
+        return conn
+
+    def post(self, path, files, fields):
+        body, content_type = encode_multipart(files, fields)
+        for attempt in range(2):
+            conn = self._conn()
+            try:
+                conn.request('POST', path, body=body, headers={'Content-Type': content_type})
+                response = conn.getresponse()
+                content = response.read()
+                return response.status, response.getheader('Server-Timing'), content
+            except (http.client.HTTPException, OSError):
+                # 服务端关闭了保持的连接，重连一次
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+    def get(self, path):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        finally:
+            conn.close()
+
+
+class FastAPIClient:
+    """进程内调用检测 API（starlette TestClient，不经过网络）"""
+
+    def __init__(self, app):
+        from fastapi.testclient import TestClient
+
+        self.client = TestClient(app)
+        self.client.__enter__()
+
+    def post(self, path, files, fields):
+        response = self.client.post(path, files=[(n, (f, d, 'image/jpeg')) for n, f, d in files], data=fields)
+        return response.status_code, response.headers.get('server-timing'), response.content
+
+    def close(self):
+        self.client.__exit__(None, None, None)
+
+
+class FlaskClient:
+    """进程内调用 Flask 应用（test_client）"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def post(self, path, files, fields):
+        data = dict(fields)
+        for name, filename, content in files:
+            data.setdefault(name, []).append((io.BytesIO(content), filename))
+        response = self.client.post(path, data=data, content_type='multipart/form-data')
+        return response.status_code, response.headers.get('Server-Timing'), response.get_data()
+
+    def close(self):
+        pass
+
+
+# ---------- 被测服务 ----------
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+SERVER_SCRIPTS = {
+    'api': (
+        "import sys, uvicorn, detection_api as m\n"
+        "uvicorn.run(m.app, host='127.0.0.1', port=int(sys.argv[1]), log_level='warning')\n"
+    ),
+    'simple': (
+        "import sys, simple_web_app as m\n"
+        "m.MODEL_PATH = sys.argv[2]\n"
+        "m.load_model_once()\n"
+        "m.app.run(host='127.0.0.1', port=int(sys.argv[1]), threaded=True)\n"
+    )
+}
+
+
+class Service:
+    """一个被测服务：client 发送请求，pid 为统计 CPU / 内存的进程"""
+
+    def __init__(self, target, mode, model):
+        self.target = target
+        self.mode = mode
+        self.process = None
+        if mode == 'inprocess':
+            self.pid = os.getpid()
+            if target == 'api':
+                import detection_api
+
+                self.client = FastAPIClient(detection_api.app)
+                detection_api.load_model(model)
+            else:
+                import simple_web_app
+
+                simple_web_app.MODEL_PATH = model
+                simple_web_app.load_model_once()
+                self.client = FlaskClient(simple_web_app.app)
+            return
+
+        # 服务进程与进程内方式使用相同的工作目录（相对的模型路径、yolo_workspace 等保持一致）
+        port = free_port()
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(ROOT), os.environ.get('PYTHONPATH')])))
+        self.process = subprocess.Popen([sys.executable, '-c', SERVER_SCRIPTS[target], str(port), model], env=env)
+        self.pid = self.process.pid
+        self.client = SocketClient(port)
+        self._wait_ready('/health' if target == 'api' else '/')
+        if target == 'api':
+            status, _, body = self.client.post('/load_model', [], {'model_name': model})
+            if status != 200:
+                raise RuntimeError(f'加载模型失败: {body[:200]}')
+
+    def _wait_ready(self, path, timeout=180):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'服务进程已退出（返回码 {self.process.returncode}）')
+            try:
+                if self.client.get(path) == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.5)
+        raise RuntimeError('等待服务启动超时')
+
+    def close(self):
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        else:
+            self.client.close()
+
+
+# ---------- CPU / 内存 ----------
+
+def process_tree(pid):
+    """进程及其所有子进程（进程模式的推理工作者），只在 Linux 上能列出子进程"""
+    children = {}
+    try:
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                try:
+                    with open(f'/proc/{entry}/stat', 'r') as f:
+                        ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+                except (OSError, ValueError, IndexError):
+                    continue
+                children.setdefault(ppid, []).append(int(entry))
+    except OSError:
+        return [pid]
+    tree, queue = [], [pid]
+    while queue:
+        current = queue.pop()
+        tree.append(current)
+        queue.extend(children.get(current, []))
+    return tree
+
+
+def cpu_seconds(pid):
+    """进程树累计 CPU 时间（用户态 + 内核态，含所有线程）"""
+    total = 0.0
+    try:
+        for p in process_tree(pid):
+            with open(f'/proc/{p}/stat', 'r') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            total += (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        return total
+    except (OSError, AttributeError, ValueError):
+        pass
+    if psutil is not None:
+        process = psutil.Process(pid)
+        for p in [process] + process.children(recursive=True):
+            times = p.cpu_times()
+            total += times.user + times.system
+        return total
+    if pid == os.getpid():
+        times = os.times()
+        return times.user + times.system
+    return None
+
+
+def reset_peak_rss(pid):
+    """重置峰值 RSS（Linux 写 clear_refs，失败时峰值为进程启动以来的峰值）"""
+    for p in process_tree(pid):
+        try:
+            with open(f'/proc/{p}/clear_refs', 'w') as f:
+                f.write('5')
+        except OSError:
+            pass
+
+
+def peak_rss_mb(pid):
+    """进程树的峰值 RSS 之和（MB）"""
+    total = 0
+    try:
+        for p in process_tree(pid):
+            with open(f'/proc/{p}/status', 'r') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        total += int(line.split()[1])
+        return round(total / 1024, 1)
+    except OSError:
+        pass
+    if psutil is not None:
+        process = psutil.Process(pid)
+        for p in [process] + process.children(recursive=True):
+            info = p.memory_info()
+            total += getattr(info, 'peak_wset', info.rss)
+        return round(total / 1024 / 1024, 1)
+    return None
+
+
+# ---------- 统计 ----------
+
+def percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        'mean': round(float(values.mean()), 2),
+        'p50': round(float(np.percentile(values, 50)), 2),
+        'p95': round(float(np.percentile(values, 95)), 2),
+        'p99': round(float(np.percentile(values, 99)), 2),
+        'max': round(float(values.max()), 2)
+    }
+
+
+def run_scenario(service, endpoint, pool, concurrency, requests, batch_size, warmup, conf):
+    """并发发送 requests 个请求，返回统计结果"""
+    target = service.target
+
+    def payload(i):
+        images = [pool[(i * batch_size + k) % len(pool)] for k in range(batch_size if endpoint == 'detect_batch' else 1)]
+        return build_request(target, endpoint, images, conf)
+
+    for i in range(warmup):
+        service.client.post(*payload(i))
+
+    def one(i):
+        path, files, fields = payload(i)
+        start = time.perf_counter()
+        try:
+            status, timing, body = service.client.post(path, files, fields)
+        except Exception as e:
+            return {'error': str(e), 'latency': (time.perf_counter() - start) * 1000}
+        return {
+            'status': status,
+            'latency': (time.perf_counter() - start) * 1000,
+            'stages': parse_server_timing(timing),
+            'bytes': sum(len(d) for _, _, d in files),
+            'response_bytes': len(body)
+        }
+
+    reset_peak_rss(service.pid)
+    cpu_before = cpu_seconds(service.pid)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool_executor:
+        records = list(pool_executor.map(one, range(requests)))
+    wall = time.perf_counter() - start
+    cpu_after = cpu_seconds(service.pid)
+
+    ok = [r for r in records if r.get('status') == 200]
+    stage_names = [s for s in STAGES + ('total',) if any(s in r['stages'] for r in ok)]
+    images_per_request = batch_size if endpoint == 'detect_batch' else 1
+    cpu = None if cpu_before is None or cpu_after is None else cpu_after - cpu_before
+    return {
+        'requests': requests,
+        'ok': len(ok),
+        'errors': len(records) - len(ok),
+        'error_samples': sorted({r.get('error') or f"HTTP {r['status']}" for r in records if r.get('status') != 200})[:5],
+        'wall_s': round(wall, 3),
+        'throughput_rps': round(len(ok) / wall, 2),
+        'images_per_s': round(len(ok) * images_per_request / wall, 2),
+        'latency_ms': percentiles([r['latency'] for r in ok]),
+        'stages_ms': {name: percentiles([r['stages'].get(name, 0.0) for r in ok]) for name in stage_names},
+        'cpu_percent': None if cpu is None else round(cpu / wall * 100, 1),
+        'peak_rss_mb': peak_rss_mb(service.pid),
+        'request_kb': round(np.mean([r['bytes'] for r in ok]) / 1024, 1) if ok else None,
+        'response_kb': round(np.mean([r['response_bytes'] for r in ok]) / 1024, 1) if ok else None
+    }
+
+
+def scenario_key(s):
+    return (f"{s['target']}/{s['mode']}/{s['endpoint']}/{s['resolution']}/d{s['density']}"
+            f"/c{s['concurrency']}" + (f"/b{s['batch_size']}" if s['endpoint'] == 'detect_batch' else ''))
+
+
+def metadata(args):
+    from runtime_config import runtime_report
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=str(ROOT),
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'runtime': runtime_report(),
+        'env': {k: v for k, v in sorted(os.environ.items()) if k.startswith(ENV_PREFIX)},
+        'args': vars(args)
+    }
+
+
+# ---------- 对比 ----------
+
+def compare(current, baseline, threshold):
+    """对比同名场景的吞吐量和 p95 延迟，返回回退的场景列表"""
+    previous = {scenario_key(s): s for s in baseline['scenarios']}
+    regressions = []
+    print(f"\n{'场景':<52} {'吞吐量 (req/s)':>22} {'p95 (ms)':>24}")
+    for s in current['scenarios']:
+        key = scenario_key(s)
+        old = previous.get(key)
+        if old is None or not s.get('latency_ms') or not old.get('latency_ms'):
+            continue
+        rps_change = s['throughput_rps'] / old['throughput_rps'] - 1 if old['throughput_rps'] else 0
+        p95_change = s['latency_ms']['p95'] / old['latency_ms']['p95'] - 1 if old['latency_ms']['p95'] else 0
+        flag = ''
+        if rps_change < -threshold or p95_change > threshold:
+            flag = '  ← 回退'
+            regressions.append(key)
+        print(f"{key:<52} {old['throughput_rps']:>8} → {s['throughput_rps']:<8} {rps_change:+6.1%}"
+              f" {old['latency_ms']['p95']:>8} → {s['latency_ms']['p95']:<8} {p95_change:+6.1%}{flag}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='检测服务性能基准测试')
+    parser.add_argument('--target', default='api', help='api（detection_api.py）/ simple（simple_web_app.py），逗号分隔')
+    parser.add_argument('--mode', default='inprocess', help='inprocess / socket，逗号分隔')
+    parser.add_argument('--endpoints', default='detect', help='api 的端点: detect / detect_batch / detect_image，逗号分隔')
+    parser.add_argument('--resolutions', default='640x480,1280x720', help='合成图片分辨率，逗号分隔')
+    parser.add_argument('--density', default='10', help='每张图片的物体数，逗号分隔')
+    parser.add_argument('--concurrency', default='1,4', help='并发请求数，逗号分隔')
+    parser.add_argument('--requests', type=int, default=50, help='每个场景的请求数')
+    parser.add_argument('--batch-size', type=int, default=4, help='detect_batch 每个请求的图片数')
+    parser.add_argument('--warmup', type=int, default=3, help='每个场景的预热请求数（不计入结果）')
+    parser.add_argument('--pool', type=int, default=8, help='每个场景轮流使用的不同图片数')
+    parser.add_argument('--model', default='yolov8n.pt', help='模型路径')
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--seed', type=int, default=0, help='合成图片的随机种子')
+    parser.add_argument('--keep-cache', action='store_true', help='保留结果缓存（默认关闭，避免重复图片直接命中缓存）')
+    parser.add_argument('--output', default='benchmark_results.json', help='结果 JSON 文件')
+    parser.add_argument('--compare', help='对比的基准结果 JSON')
+    parser.add_argument('--threshold', type=float, default=0.1, help='判定回退的相对变化（默认 10%%）')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.keep_cache:
+        # 在导入服务模块 / 启动服务进程之前关闭结果缓存
+        os.environ['YOLO_RESULT_CACHE_SIZE'] = '0'
+    os.environ.setdefault('YOLO_STAGE_TIMING', '1')
+    model = str(Path(args.model).resolve()) if Path(args.model).exists() else args.model
+
+    split = lambda text: [item.strip() for item in text.split(',') if item.strip()]
+    targets, modes = split(args.target), split(args.mode)
+    for target in targets:
+        if target not in ENDPOINTS:
+            raise SystemExit(f'未知的压测目标: {target}')
+    for mode in modes:
+        if mode not in MODES:
+            raise SystemExit(f'未知的方式: {mode}')
+
+    result = {'meta': metadata(args), 'scenarios': []}
+    for target in targets:
+        endpoints = [e for e in split(args.endpoints) if e in ENDPOINTS[target]] or [ENDPOINTS[target][0]]
+        for mode in modes:
+            print(f"\n=== {target} / {mode} ===")
+            service = Service(target, mode, model)
+            try:
+                for resolution in split(args.resolutions):
+                    width, height = parse_resolution(resolution)
+                    for density in map(int, split(args.density)):
+                        pool = image_pool(width, height, density, args.pool, args.seed)
+                        for endpoint in endpoints:
+                            for concurrency in map(int, split(args.concurrency)):
+                                scenario = {
+                                    'target': target, 'mode': mode, 'endpoint': endpoint,
+                                    'resolution': f'{width}x{height}', 'density': density,
+                                    'concurrency': concurrency, 'batch_size': args.batch_size
+                                }
+                                scenario.update(run_scenario(service, endpoint, pool, concurrency, args.requests,
+                                                             args.batch_size, args.warmup, args.conf))
+                                result['scenarios'].append(scenario)
+                                latency = scenario['latency_ms'] or {}
+                                print(f"{scenario_key(scenario):<52} {scenario['throughput_rps']:>7} req/s  "
+                                      f"p50 {latency.get('p50')} ms  p95 {latency.get('p95')} ms  p99 {latency.get('p99')} ms  "
+                                      f"CPU {scenario['cpu_percent']}%  RSS {scenario['peak_rss_mb']} MB"
+                                      + (f"  错误 {scenario['errors']}" if scenario['errors'] else ''))
+            finally:
+                service.close()
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存: {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} 个场景性能回退超过 {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,512 @@
+# -*- coding: utf-8 -*-
+"""
+数据集目录索引
+用 SQLite 记录图片、标注文件和训练得到的模型权重，按目录修改时间增量扫描，
+列表查询直接走索引，不必每次请求都遍历目录、逐个检查标注文件是否存在
+"""
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# 默认数据库位置（可通过环境变量覆盖）
+CATALOG_DB = os.environ.get('YOLO_CATALOG_DB', str(Path('yolo_workspace') / 'catalog.db'))
+
+# 支持的图片格式
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tiff'}
+LABEL_EXTENSIONS = {'.txt'}
+WEIGHT_EXTENSIONS = {'.pt'}
+
+SPLITS = ('train', 'val')
+
+# 图片列表的排序字段
+SORT_COLUMNS = {
+    'name': 'i.name',
+    'mtime': 'i.mtime_ns',
+    'size': 'i.size'
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    mtime_ns INTEGER,
+    scanned_at REAL
+);
+CREATE TABLE IF NOT EXISTS images (
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    stem TEXT NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    PRIMARY KEY (folder, name)
+);
+CREATE INDEX IF NOT EXISTS images_stem ON images (folder, stem);
+CREATE TABLE IF NOT EXISTS labels (
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    stem TEXT NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    boxes INTEGER,
+    classes TEXT,
+    PRIMARY KEY (folder, name)
+);
+CREATE INDEX IF NOT EXISTS labels_stem ON labels (folder, stem);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    run TEXT NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    PRIMARY KEY (folder, name)
+);
+"""
+
+
+def _folder_key(folder):
+    return str(Path(folder).absolute())
+
+
+def parse_label_file(path):
+    """读取 YOLO 标注文件，返回 (框数量, 类别ID集合)"""
+    boxes, classes = 0, set()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if not parts:
+                    continue
+                boxes += 1
+                try:
+                    classes.add(int(float(parts[0])))
+                except ValueError:
+                    pass
+    except OSError:
+        pass
+    return boxes, classes
+
+
+def _encode_classes(classes):
+    # 以 ",0,3," 形式保存，按类别过滤时用 LIKE '%,3,%'
+    return ',' + ','.join(str(c) for c in sorted(classes)) + ',' if classes else ','
+
+
+def _decode_classes(text):
+    return [int(c) for c in (text or '').strip(',').split(',') if c]
+
+
+def encode_cursor(value, name):
+    """分页游标：排序值 + 文件名（文件名在目录内唯一，保证顺序确定）"""
+    return base64.urlsafe_b64encode(json.dumps([value, name]).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        value, name = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return value, name
+    except Exception:
+        raise ValueError(f'无效的分页游标: {cursor}')
+
+
+class DatasetCatalog:
+    """
+    数据集目录索引
+
+    scan_folder() 只在目录的 mtime 变化时重新列目录，且只对新增文件取 stat；
+    force=True 时对所有文件重新 stat，文件内容被原地修改后用它刷新。
+    应用内写入的文件通过 record_image() / record_label() 直接登记，无需重新扫描。
+    """
+
+    def __init__(self, db_path=CATALOG_DB):
+        self.db_path = str(db_path)
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._scan_lock = threading.Lock()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self):
+        """每个线程一个连接（Flask 多线程处理请求）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    # ---------- 扫描 ----------
+
+    def _file_row(self, table, folder, name, stat):
+        stem = Path(name).stem
+        if table == 'labels':
+            boxes, classes = parse_label_file(os.path.join(folder, name))
+            return (folder, name, stem, stat.st_size, stat.st_mtime_ns, boxes, _encode_classes(classes))
+        return (folder, name, stem, stat.st_size, stat.st_mtime_ns)
+
+    def _upsert(self, conn, table, rows):
+        if rows:
+            placeholders = ','.join('?' * len(rows[0]))
+            conn.executemany(f'INSERT OR REPLACE INTO {table} VALUES ({placeholders})', rows)
+
+    def _scan(self, table, kind, folder, extensions, force=False):
+        """增量扫描单个目录，返回是否重新列过目录"""
+        folder = _folder_key(folder)
+        conn = self._conn()
+        try:
+            dir_mtime = os.stat(folder).st_mtime_ns
+        except OSError:
+            # 目录已不存在
+            with conn:
+                conn.execute(f'DELETE FROM {table} WHERE folder = ?', (folder,))
+                conn.execute('DELETE FROM folders WHERE path = ?', (folder,))
+            return True
+
+        row = conn.execute('SELECT mtime_ns FROM folders WHERE path = ?', (folder,)).fetchone()
+        if not force and row is not None and row['mtime_ns'] == dir_mtime:
+            return False
+
+        known = {
+            r['name']: (r['size'], r['mtime_ns'])
+            for r in conn.execute(f'SELECT name, size, mtime_ns FROM {table} WHERE folder = ?', (folder,))
+        }
+        seen, changed = set(), []
+        with os.scandir(folder) as it:
+            for entry in it:
+                if os.path.splitext(entry.name)[1].lower() not in extensions:
+                    continue
+                seen.add(entry.name)
+                # 已登记的文件只在 force 时重新 stat，网络存储上 stat 代价很高
+                if entry.name in known and not force:
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if known.get(entry.name) != (stat.st_size, stat.st_mtime_ns):
+                    changed.append(self._file_row(table, folder, entry.name, stat))
+
+        removed = [(folder, name) for name in known if name not in seen]
+        with conn:
+            conn.executemany(f'DELETE FROM {table} WHERE folder = ? AND name = ?', removed)
+            self._upsert(conn, table, changed)
+            conn.execute(
+                'INSERT OR REPLACE INTO folders VALUES (?, ?, ?, ?)',
+                (folder, kind, dir_mtime, time.time())
+            )
+        return True
+
+    def scan_folder(self, folder, force=False):
+        """扫描图片目录"""
+        with self._scan_lock:
+            return self._scan('images', 'images', folder, IMAGE_EXTENSIONS, force)
+
+    def scan_labels(self, folder, force=False):
+        """扫描标注目录"""
+        with self._scan_lock:
+            return self._scan('labels', 'labels', folder, LABEL_EXTENSIONS, force)
+
+    def scan_dataset(self, dataset_dir, force=False):
+        """扫描数据集的 images/{train,val} 和 labels/{train,val}"""
+        dataset_dir = Path(dataset_dir)
+        for split in SPLITS:
+            self.scan_folder(dataset_dir / 'images' / split, force)
+            self.scan_labels(dataset_dir / 'labels' / split, force)
+
+    def scan_checkpoints(self, models_dir, force=False):
+        """
+        扫描训练输出目录下任意层级的 weights/*.pt（与 glob('**/weights/*.pt') 一致，跳过隐藏目录）
+
+        weights 目录中的文件每次都重新 stat：训练过程中 best.pt / last.pt 被原地覆盖时目录 mtime 不变；
+        只有大小或修改时间变化时才写入数据库
+        """
+        models_dir = Path(_folder_key(models_dir))
+        with self._scan_lock:
+            conn = self._conn()
+            if not models_dir.is_dir():
+                return
+            weight_dirs = set()
+            for root, dirs, _ in os.walk(models_dir):
+                dirs[:] = [d for d in dirs if not d.startswith('.')]
+                if os.path.basename(root) == 'weights':
+                    weight_dirs.add(root)
+
+            prefix = str(models_dir) + os.sep
+            known = {
+                r['path'] for r in conn.execute(
+                    "SELECT path FROM folders WHERE kind = 'weights' AND substr(path, 1, ?) = ?",
+                    (len(prefix), prefix)
+                )
+            }
+            with conn:
+                # 已删除的训练目录
+                for folder in known - weight_dirs:
+                    conn.execute('DELETE FROM checkpoints WHERE folder = ?', (folder,))
+                    conn.execute('DELETE FROM folders WHERE path = ?', (folder,))
+            for folder in sorted(weight_dirs):
+                self._scan_weights(conn, folder, os.path.basename(os.path.dirname(folder)), force)
+
+    def _scan_weights(self, conn, folder, run, force):
+        rows = []
+        with os.scandir(folder) as it:
+            for entry in it:
+                if os.path.splitext(entry.name)[1].lower() in WEIGHT_EXTENSIONS and entry.is_file():
+                    stat = entry.stat()
+                    rows.append((folder, entry.name, run, stat.st_size, stat.st_mtime_ns))
+        current = {
+            tuple(r) for r in conn.execute(
+                'SELECT folder, name, run, size, mtime_ns FROM checkpoints WHERE folder = ?', (folder,)
+            )
+        }
+        if not force and current == set(rows):
+            return
+        with conn:
+            conn.execute('DELETE FROM checkpoints WHERE folder = ?', (folder,))
+            self._upsert(conn, 'checkpoints', rows)
+            conn.execute(
+                "INSERT OR REPLACE INTO folders VALUES (?, 'weights', ?, ?)",
+                (folder, os.stat(folder).st_mtime_ns, time.time())
+            )
+
+    # ---------- 应用内写入后直接登记 ----------
+
+    def _record(self, table, paths):
+        rows, folders = [], set()
+        for path in map(Path, paths):
+            folder = _folder_key(path.parent)
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # 写入后又被删除的文件跳过，不影响同一批的其他文件（下次扫描目录时会同步）
+                continue
+            rows.append(self._file_row(table, folder, path.name, stat))
+            folders.add(folder)
+        mtimes = []
+        for folder in folders:
+            try:
+                mtimes.append((os.stat(folder).st_mtime_ns, folder))
+            except FileNotFoundError:
+                continue
+        conn = self._conn()
+        with conn:
+            self._upsert(conn, table, rows)
+            # 本次写入改变了目录 mtime，同步记录，避免下次整目录重新列出；
+            # 同一时刻的外部修改需要 force 扫描才能发现
+            conn.executemany('UPDATE folders SET mtime_ns = ? WHERE path = ?', mtimes)
+
+    def record_image(self, path):
+        """登记应用写入的图片"""
+        self._record('images', [path])
+
+    def record_label(self, path):
+        """登记应用写入的标注文件"""
+        self._record('labels', [path])
+
+    def record_images(self, paths):
+        """批量登记图片（一个事务）"""
+        self._record('images', paths)
+
+    def record_labels(self, paths):
+        """批量登记标注文件（一个事务）"""
+        self._record('labels', paths)
+
+    # ---------- 查询 ----------
+
+    def _image_filters(self, folder, label_folder=None, labeled=None, class_id=None):
+        where = ['i.folder = ?']
+        params = [label_folder and _folder_key(label_folder), _folder_key(folder)]
+        if labeled is not None:
+            where.append('l.name IS NOT NULL' if labeled else 'l.name IS NULL')
+        if class_id is not None:
+            where.append('l.classes LIKE ?')
+            params.append(f'%,{int(class_id)},%')
+        return ' AND '.join(where), params
+
+    _IMAGE_FROM = (
+        'FROM images i LEFT JOIN labels l ON l.folder = ? AND l.stem = i.stem'
+    )
+
+    _IMAGE_COLUMNS = (
+        'SELECT i.folder, i.name, i.size, i.mtime_ns, l.boxes, l.classes, l.name IS NOT NULL AS labeled'
+    )
+
+    def list_images(self, folder, label_folder=None, labeled=None, class_id=None, offset=0, limit=None):
+        """
+        按文件名排序列出目录中的图片
+
+        - label_folder: 判断是否已标注所用的标注目录
+        - labeled: True / False 只返回已标注 / 未标注的图片
+        - class_id: 只返回标注中包含该类别的图片
+        """
+        where, params = self._image_filters(folder, label_folder, labeled, class_id)
+        sql = (
+            f'{self._IMAGE_COLUMNS} {self._IMAGE_FROM} WHERE {where} ORDER BY i.name LIMIT ? OFFSET ?'
+        )
+        rows = self._conn().execute(sql, params + [-1 if limit is None else int(limit), int(offset)])
+        return [self._image_dict(r) for r in rows]
+
+    @staticmethod
+    def _sort_column(sort):
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"不支持的排序字段: {sort}（可选 {' / '.join(SORT_COLUMNS)}）")
+        return SORT_COLUMNS[sort]
+
+    @staticmethod
+    def _sort_value(row, sort):
+        return row['name'] if sort == 'name' else row['size'] if sort == 'size' else row['mtime_ns']
+
+    def _keyset(self, filters, sort, descending, key, before):
+        """(排序值, 文件名) 在 key 之后（before=True 时为之前）的查询条件及排序方向"""
+        column = self._sort_column(sort)
+        where, params = filters
+        forward = descending == before
+        if key is not None:
+            where += f" AND ({column}, i.name) {'>' if forward else '<'} (?, ?)"
+            params = params + list(key)
+        direction = 'ASC' if forward else 'DESC'
+        return where, params, f'ORDER BY {column} {direction}, i.name {direction}'
+
+    def _position(self, filters, sort, descending, key):
+        """key 在排序结果中的序号（前面有多少张图片）"""
+        where, params, _ = self._keyset(filters, sort, descending, key, before=True)
+        return self._conn().execute(f'SELECT COUNT(*) {self._IMAGE_FROM} WHERE {where}', params).fetchone()[0]
+
+    def _key_at(self, filters, sort, descending, index):
+        """第 index 张图片的 (排序值, 文件名)"""
+        where, params, order = self._keyset(filters, sort, descending, None, before=False)
+        row = self._conn().execute(
+            f'{self._IMAGE_COLUMNS} {self._IMAGE_FROM} WHERE {where} {order} LIMIT 1 OFFSET ?',
+            params + [int(index)]
+        ).fetchone()
+        return None if row is None else (self._sort_value(row, sort), row['name'])
+
+    def page_images(self, folder, label_folder=None, sort='name', descending=False,
+                    labeled=None, class_id=None, cursor=None, before=False, offset=None, limit=100):
+        """
+        游标分页查询图片
+
+        - cursor: 上一页返回的 next_cursor（before=True 时为 prev_cursor，向前翻页）
+        - offset: 未指定 cursor 时，从排序后的第 offset 张开始（用于跳转）
+        返回 images（每项带 index 序号）、total、next_cursor、prev_cursor
+        """
+        filters = self._image_filters(folder, label_folder, labeled, class_id)
+        key = decode_cursor(cursor) if cursor else None
+        if key is None and offset:
+            key = self._key_at(filters, sort, descending, int(offset) - 1)
+
+        where, params, order = self._keyset(filters, sort, descending, key, before)
+        rows = self._conn().execute(
+            f'{self._IMAGE_COLUMNS} {self._IMAGE_FROM} WHERE {where} {order} LIMIT ?',
+            params + [int(limit) + 1]
+        ).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if before:
+            rows.reverse()
+
+        keys = [(self._sort_value(r, sort), r['name']) for r in rows]
+        start = self._position(filters, sort, descending, keys[0]) if keys else 0
+        images = []
+        for i, row in enumerate(rows):
+            image = self._image_dict(row)
+            image['index'] = start + i
+            image['cursor'] = encode_cursor(*keys[i])
+            images.append(image)
+
+        has_next = more if not before else key is not None
+        has_prev = start > 0
+        return {
+            'images': images,
+            'total': self.count_images(folder, label_folder, labeled, class_id),
+            'next_cursor': encode_cursor(*keys[-1]) if keys and has_next else None,
+            'prev_cursor': encode_cursor(*keys[0]) if keys and has_prev else None
+        }
+
+    def next_unlabeled(self, folder, label_folder, sort='name', descending=False,
+                       cursor=None, after_index=None, wrap=True, limit=100):
+        """
+        查找排序在指定图片之后的第一张未标注图片
+
+        指定图片由 cursor 或 after_index（在不加过滤的排序结果中的序号）给出；
+        之后没有未标注图片且 wrap=True 时从头查找。返回从该图片开始的一页，没有时返回 None
+        """
+        filters = self._image_filters(folder, label_folder)
+        key = decode_cursor(cursor) if cursor else None
+        if key is None and after_index is not None:
+            key = self._key_at(filters, sort, descending, int(after_index))
+
+        unlabeled = self._image_filters(folder, label_folder, labeled=False)
+        candidates = [key, None] if wrap and key is not None else [key]
+        for start_key in candidates:
+            where, params, order = self._keyset(unlabeled, sort, descending, start_key, before=False)
+            row = self._conn().execute(
+                f'{self._IMAGE_COLUMNS} {self._IMAGE_FROM} WHERE {where} {order} LIMIT 1', params
+            ).fetchone()
+            if row is not None:
+                found = (self._sort_value(row, sort), row['name'])
+                # 从找到的图片开始返回一页（包含该图片本身）
+                index = self._position(filters, sort, descending, found)
+                return self.page_images(folder, label_folder, sort, descending, offset=index, limit=limit)
+        return None
+
+    def count_images(self, folder, label_folder=None, labeled=None, class_id=None):
+        where, params = self._image_filters(folder, label_folder, labeled, class_id)
+        sql = f'SELECT COUNT(*) {self._IMAGE_FROM} WHERE {where}'
+        return self._conn().execute(sql, params).fetchone()[0]
+
+    @staticmethod
+    def _image_dict(row):
+        return {
+            'path': os.path.join(row['folder'], row['name']),
+            'name': row['name'],
+            'labeled': bool(row['labeled']),
+            'boxes': row['boxes'] or 0,
+            'classes': _decode_classes(row['classes']),
+            'size': row['size'],
+            'mtime': row['mtime_ns'] / 1e9 if row['mtime_ns'] else None
+        }
+
+    def dataset_stats(self, dataset_dir):
+        """数据集各划分的图片数、已标注数和各类别的框数"""
+        dataset_dir = Path(dataset_dir)
+        conn = self._conn()
+        stats = {}
+        for split in SPLITS:
+            images = _folder_key(dataset_dir / 'images' / split)
+            labels = _folder_key(dataset_dir / 'labels' / split)
+            stats[f'{split}_images'] = conn.execute(
+                'SELECT COUNT(*) FROM images WHERE folder = ?', (images,)
+            ).fetchone()[0]
+            stats[f'{split}_labeled'] = conn.execute(
+                'SELECT COUNT(*) FROM labels WHERE folder = ?', (labels,)
+            ).fetchone()[0]
+            stats[f'{split}_boxes'] = conn.execute(
+                'SELECT COALESCE(SUM(boxes), 0) FROM labels WHERE folder = ?', (labels,)
+            ).fetchone()[0]
+        return stats
+
+    def list_checkpoints(self, models_dir):
+        """列出训练得到的模型权重，按训练目录和文件名排序"""
+        prefix = _folder_key(models_dir) + os.sep
+        rows = self._conn().execute(
+            'SELECT folder, name, run, size, mtime_ns FROM checkpoints '
+            'WHERE substr(folder, 1, ?) = ? ORDER BY run, name',
+            (len(prefix), prefix)
+        )
+        return [
+            {
+                'path': os.path.join(r['folder'], r['name']),
+                'name': r['name'],
+                'run': r['run'],
+                'size': r['size'],
+                'mtime': r['mtime_ns'] / 1e9
+            }
+            for r in rows
+        ]
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+数据集编译（训练前检查）
+并发校验所有图片和标注文件，生成可复用的校验缓存、训练用的图片清单和统计报告
+（各类别数量、框大小分布、图片尺寸分布）。缓存按文件大小和修改时间判断是否过期，
+保存标注时通过 invalidate() 标记，之后的编译只重新校验变化的文件
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from PIL import Image
+
+from dataset_catalog import IMAGE_EXTENSIONS, SPLITS
+from dataset_files import write_text_atomic
+
+# 并发校验的线程数（可通过环境变量覆盖）
+COMPILE_WORKERS = int(os.environ.get('YOLO_COMPILE_WORKERS', min(8, os.cpu_count() or 1)))
+
+# 缓存格式版本，校验规则变化时递增
+CACHE_VERSION = 1
+
+# 框大小分布：sqrt(w * h)（相对于图片）的分段上限
+BOX_SIZE_BINS = (0.02, 0.05, 0.1, 0.2, 0.4, 1.0)
+
+# 图片尺寸分布：最长边的分段上限（像素）
+IMAGE_SIZE_BINS = (640, 1280, 1920, 4096)
+
+# 报告中每类问题最多列出的文件数
+MAX_LISTED = 50
+
+
+def _file_key(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def verify_image(path):
+    """检查图片能否打开，返回 (宽, 高, 错误信息)"""
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+            img.verify()
+        if width < 10 or height < 10:
+            return width, height, f'图片尺寸过小: {width}x{height}'
+        return width, height, None
+    except Exception as e:
+        return None, None, f'图片损坏: {e}'
+
+
+def parse_label(path, num_classes):
+    """读取并检查 YOLO 标注文件，返回 (框列表, 错误信息)；文件不存在时框列表为 None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+    except FileNotFoundError:
+        return None, None
+    except OSError as e:
+        return [], f'标注文件无法读取: {e}'
+
+    boxes = []
+    for line_no, line in enumerate(text.splitlines(), 1):
+        parts = line.split()
+        if not parts:
+            continue
+        if len(parts) != 5:
+            return [], f'第 {line_no} 行应有 5 列，实际 {len(parts)} 列'
+        try:
+            cls = int(float(parts[0]))
+            x, y, w, h = (float(v) for v in parts[1:])
+        except ValueError:
+            return [], f'第 {line_no} 行包含非数字'
+        if not 0 <= cls < num_classes:
+            return [], f'第 {line_no} 行类别 {cls} 超出范围（共 {num_classes} 类）'
+        if not all(0 <= v <= 1 for v in (x, y, w, h)) or w <= 0 or h <= 0:
+            return [], f'第 {line_no} 行坐标不在 0~1 范围内'
+        boxes.append([cls, x, y, w, h])
+    return boxes, None
+
+
+def verify_item(image_path, label_path, num_classes):
+    """校验一张图片及其标注，返回缓存条目"""
+    width, height, image_error = verify_image(image_path)
+    boxes, label_error = parse_label(label_path, num_classes)
+    return {
+        'image_key': _file_key(image_path),
+        'label_key': _file_key(label_path),
+        'num_classes': num_classes,
+        'width': width,
+        'height': height,
+        'boxes': boxes,
+        'image_error': image_error,
+        'label_error': label_error
+    }
+
+
+def _bin_label(bins, value, fmt):
+    for upper in bins:
+        if value <= upper:
+            return fmt(upper)
+    return f'>{fmt(bins[-1])}'
+
+
+def split_stats(entries, class_names):
+    """汇总一个划分的统计信息"""
+    class_counts, images_per_class = Counter(), Counter()
+    box_sizes, pixel_sizes, image_sizes = Counter(), Counter(), Counter()
+    corrupt, invalid, missing, background = [], [], [], 0
+    valid = boxes = 0
+
+    for image_path, entry in entries:
+        if entry['image_error']:
+            corrupt.append({'path': image_path, 'error': entry['image_error']})
+            continue
+        if entry['label_error']:
+            invalid.append({'path': image_path, 'error': entry['label_error']})
+            continue
+        valid += 1
+        width, height = entry['width'], entry['height']
+        image_sizes[_bin_label(IMAGE_SIZE_BINS, max(width, height), str)] += 1
+        if entry['boxes'] is None:
+            missing.append(image_path)
+            continue
+        if not entry['boxes']:
+            background += 1
+            continue
+        boxes += len(entry['boxes'])
+        images_per_class.update({box[0] for box in entry['boxes']})
+        for cls, _, _, w, h in entry['boxes']:
+            class_counts[cls] += 1
+            box_sizes[_bin_label(BOX_SIZE_BINS, math.sqrt(w * h), lambda v: f'{v:g}')] += 1
+            # COCO 口径的小 / 中 / 大目标（按原图像素面积）
+            area = w * width * h * height
+            pixel_sizes['small' if area < 32 ** 2 else 'medium' if area < 96 ** 2 else 'large'] += 1
+
+    def named(counter):
+        return {class_names[c] if c < len(class_names) else str(c): counter.get(c, 0) for c in range(len(class_names))}
+
+    box_labels = [f'{v:g}' for v in BOX_SIZE_BINS] + [f'>{BOX_SIZE_BINS[-1]:g}']
+    image_labels = [str(v) for v in IMAGE_SIZE_BINS] + [f'>{IMAGE_SIZE_BINS[-1]}']
+    return {
+        'images': len(entries),
+        'valid': valid,
+        'labeled': valid - len(missing),
+        'background': background,
+        'missing_labels': len(missing),
+        'corrupt_images': len(corrupt),
+        'invalid_labels': len(invalid),
+        'boxes': boxes,
+        'class_counts': named(class_counts),
+        'images_per_class': named(images_per_class),
+        'box_size_hist': {k: box_sizes.get(k, 0) for k in box_labels},
+        'box_pixel_size': {k: pixel_sizes.get(k, 0) for k in ('small', 'medium', 'large')},
+        'image_size_hist': {k: image_sizes.get(k, 0) for k in image_labels},
+        'problems': {
+            'corrupt_images': corrupt[:MAX_LISTED],
+            'invalid_labels': invalid[:MAX_LISTED],
+            'missing_labels': missing[:MAX_LISTED]
+        }
+    }
+
+
+def dataset_warnings(splits):
+    """根据统计结果给出提示"""
+    warnings = []
+    train = splits.get('train', {})
+    val = splits.get('val', {})
+    if not train.get('labeled'):
+        warnings.append('训练集没有可用的已标注图片')
+    if not val.get('labeled'):
+        warnings.append('验证集没有可用的已标注图片')
+    counts = train.get('class_counts', {})
+    for name, count in counts.items():
+        if count == 0:
+            warnings.append(f'类别 {name} 在训练集中没有标注')
+        elif val.get('labeled') and val.get('class_counts', {}).get(name, 0) == 0:
+            warnings.append(f'类别 {name} 在验证集中没有标注')
+    present = [c for c in counts.values() if c]
+    if len(present) > 1 and max(present) > 10 * min(present):
+        warnings.append(f'类别数量不均衡: 最多 {max(present)} 个框，最少 {min(present)} 个框')
+    for split, stats in splits.items():
+        if stats.get('corrupt_images'):
+            warnings.append(f"{split} 有 {stats['corrupt_images']} 张图片损坏，已从训练清单中排除")
+        if stats.get('invalid_labels'):
+            warnings.append(f"{split} 有 {stats['invalid_labels']} 个标注文件格式错误，已从训练清单中排除")
+    return warnings
+
+
+class DatasetCompiler:
+    """
+    数据集编译器
+
+    compile() 校验 images/<split> 与 labels/<split>，结果写入 <数据集>/.compiled/：
+    cache.json（逐文件校验结果）、report.json（统计报告）和 <split>.txt（可用图片清单，
+    data.yaml 直接引用，损坏的图片和格式错误的标注不会进入训练）
+    """
+
+    def __init__(self, dataset_dir, workers=COMPILE_WORKERS):
+        self.dataset_dir = Path(dataset_dir).absolute()
+        self.out_dir = self.dataset_dir / '.compiled'
+        self.cache_file = self.out_dir / 'cache.json'
+        self.report_file = self.out_dir / 'report.json'
+        self.workers = max(1, int(workers))
+        self._lock = threading.Lock()
+        self._compile_lock = threading.Lock()
+        self._entries = None
+        self._invalidated = set()
+        self._stale = False
+
+    def _load(self):
+        """读取校验缓存（调用方需持有锁）"""
+        if self._entries is not None:
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._entries = data['entries'] if data.get('version') == CACHE_VERSION else {}
+        except (OSError, ValueError, KeyError):
+            self._entries = {}
+
+    def invalidate(self, paths):
+        """标记图片或标注文件已修改，下次编译时重新校验对应的图片"""
+        with self._lock:
+            self._load()
+            for path in paths:
+                path = Path(path).absolute()
+                if path.suffix.lower() in IMAGE_EXTENSIONS:
+                    images = [str(path)]
+                else:
+                    # 标注文件 labels/<split>/x.txt 对应 images/<split>/ 下同名的图片
+                    image_dir = self.dataset_dir / 'images' / path.parent.name
+                    images = [str(image_dir / (path.stem + ext)) for ext in IMAGE_EXTENSIONS]
+                for image in images:
+                    self._entries.pop(image, None)
+                    self._invalidated.add(image)
+            self._stale = True
+
+    def _list_split(self, split):
+        image_dir = self.dataset_dir / 'images' / split
+        label_dir = self.dataset_dir / 'labels' / split
+        try:
+            with os.scandir(image_dir) as it:
+                names = sorted(e.name for e in it
+                               if os.path.splitext(e.name)[1].lower() in IMAGE_EXTENSIONS and e.is_file())
+        except OSError:
+            names = []
+        return [(str(image_dir / name), str(label_dir / (Path(name).stem + '.txt'))) for name in names]
+
+    def compile(self, class_names, force=False):
+        """编译数据集并返回统计报告；force=True 时忽略缓存全部重新校验"""
+        with self._compile_lock:
+            started = time.time()
+            num_classes = len(class_names)
+            items = {split: self._list_split(split) for split in SPLITS}
+
+            with self._lock:
+                self._load()
+                entries = {} if force else dict(self._entries)
+                self._invalidated = set()
+
+            # 只有缓存缺失、文件大小或修改时间变化（或类别数变化）的图片需要重新校验
+            pending = []
+            for pairs in items.values():
+                for image_path, label_path in pairs:
+                    entry = entries.get(image_path)
+                    if (entry is None or entry['num_classes'] != num_classes
+                            or entry['image_key'] != _file_key(image_path)
+                            or entry['label_key'] != _file_key(label_path)):
+                        pending.append((image_path, label_path))
+
+            if pending:
+                with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='dataset-compile') as pool:
+                    results = pool.map(lambda pair: verify_item(pair[0], pair[1], num_classes), pending)
+                    for (image_path, _), entry in zip(pending, results):
+                        entries[image_path] = entry
+
+            listed = {image_path for pairs in items.values() for image_path, _ in pairs}
+            entries = {k: v for k, v in entries.items() if k in listed}
+
+            splits = {}
+            self.out_dir.mkdir(parents=True, exist_ok=True)
+            for split, pairs in items.items():
+                split_entries = [(image_path, entries[image_path]) for image_path, _ in pairs]
+                splits[split] = split_stats(split_entries, class_names)
+                usable = [p for p, e in split_entries if not e['image_error'] and not e['label_error']]
+                write_text_atomic(self.image_list(split), ''.join(f'{p}\n' for p in usable))
+
+            report = {
+                'compiled_at': datetime.now().isoformat(timespec='seconds'),
+                'elapsed': round(time.time() - started, 3),
+                'verified': len(pending),
+                'reused': len(listed) - len(pending),
+                'classes': list(class_names),
+                'splits': splits,
+                'warnings': dataset_warnings(splits)
+            }
+            write_text_atomic(self.report_file, json.dumps(report, ensure_ascii=False, indent=2))
+
+            with self._lock:
+                # 编译期间被 invalidate() 的图片不写回缓存，下次编译重新校验
+                self._entries = {k: v for k, v in entries.items() if k not in self._invalidated}
+                write_text_atomic(self.cache_file, json.dumps({'version': CACHE_VERSION, 'entries': self._entries}))
+                self._stale = bool(self._invalidated)
+            return report
+
+    def labeled_pool(self):
+        """
+        最近一次编译中所有可用且有标注文件的图片（不区分 train / val），
+        返回 [(图片路径, 类别ID集合)]，供自动划分使用
+        """
+        with self._lock:
+            self._load()
+            return [
+                (image_path, {box[0] for box in entry['boxes']})
+                for image_path, entry in sorted(self._entries.items())
+                if not entry['image_error'] and not entry['label_error'] and entry['boxes'] is not None
+            ]
+
+    def image_list(self, split):
+        """编译生成的可用图片清单"""
+        return self.out_dir / f'{split}.txt'
+
+    def report(self):
+        """最近一次编译的报告（尚未编译时返回 None），stale 表示本进程内之后又保存过标注"""
+        try:
+            with open(self.report_file, 'r', encoding='utf-8') as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            return None
+        report['stale'] = self._stale
+        return report
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+数据集文件操作
+服务器本地已有的图片直接以硬链接 / reflink / 复制的方式放入数据集，无需经浏览器往返传输
+"""
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+# 依次尝试的方式（可通过环境变量覆盖，例如只允许复制: YOLO_MATERIALIZE_METHODS=copy）
+MATERIALIZE_METHODS = tuple(
+    m.strip() for m in os.environ.get('YOLO_MATERIALIZE_METHODS', 'hardlink,reflink,copy').split(',') if m.strip()
+)
+
+# Linux FICLONE ioctl（btrfs / xfs 等支持写时复制的文件系统）
+FICLONE = 0x40049409
+
+
+def reflink(src, dst):
+    """写时复制克隆文件，文件系统不支持时抛出 OSError"""
+    try:
+        import fcntl
+    except ImportError:  # Windows
+        raise OSError('当前平台不支持 reflink')
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+_METHODS = {
+    'hardlink': os.link,
+    'reflink': reflink,
+    'copy': shutil.copy2
+}
+
+
+def temp_path(path):
+    """与目标文件同目录的临时文件名，写完后用 os.replace 原子替换"""
+    path = Path(path)
+    return path.with_name(f'.{path.name}.{uuid.uuid4().hex[:8]}.tmp')
+
+
+def write_text_atomic(path, text):
+    """先写临时文件再原子替换，读取方不会看到写了一半的文件"""
+    tmp = temp_path(path)
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def materialize_file(src, dst, methods=MATERIALIZE_METHODS):
+    """
+    把服务器上的 src 放到 dst，返回实际使用的方式
+
+    先在目标目录生成临时文件再原子替换，目标已存在时直接覆盖；
+    src 与 dst 已是同一个文件时不做任何操作，返回 'existing'
+    """
+    src, dst = Path(src), Path(dst)
+    if dst.exists() and os.path.samefile(src, dst):
+        return 'existing'
+    dst.parent.mkdir(parents=True, exist_ok=True)
+
+    error = None
+    for method in methods:
+        if method not in _METHODS:
+            raise ValueError(f"不支持的文件放置方式: {method}（可选 {' / '.join(_METHODS)}）")
+        tmp = temp_path(dst)
+        try:
+            _METHODS[method](str(src), str(tmp))
+            os.replace(tmp, dst)
+            return method
+        except OSError as e:
+            # 跨文件系统无法硬链接、文件系统不支持 reflink 等，尝试下一种方式
+            error = e
+            if tmp.exists():
+                tmp.unlink()
+    raise error or OSError(f'无法放置文件: {src}')
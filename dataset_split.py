@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+训练集 / 验证集自动划分
+对所有已标注图片（不区分标注时选择的 train / val）按类别分层划分，结果以硬链接目录
+（data.yaml 直接引用）的形式生成，不复制图片。同一种子和同一批图片总是得到相同的划分，
+新增少量图片时已有图片的归属基本不变
+"""
+import hashlib
+import json
+import os
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from dataset_catalog import IMAGE_EXTENSIONS
+from dataset_files import materialize_file, write_text_atomic
+
+# 默认验证集比例和随机种子（可通过环境变量覆盖）
+SPLIT_VAL_RATIO = float(os.environ.get('YOLO_SPLIT_VAL_RATIO', 0.2))
+SPLIT_SEED = int(os.environ.get('YOLO_SPLIT_SEED', 0))
+
+
+def _order_key(seed, path):
+    # 按 (种子, 文件名) 的哈希排序代替洗牌：结果确定，且不受其他图片增删的影响
+    return hashlib.sha1(f'{seed}:{Path(path).name}'.encode('utf-8')).hexdigest()
+
+
+def stratified_split(items, val_ratio=SPLIT_VAL_RATIO, seed=SPLIT_SEED):
+    """
+    按类别分层划分
+
+    items: [(图片路径, 类别ID集合)]，类别为空表示背景图片
+    返回 (train 路径列表, val 路径列表)
+
+    多标签的迭代分层：包含稀有类别的图片先分配，每张图片分到对其最稀有类别
+    仍最“缺”图片的一侧，使每个类别在两侧的图片数都接近目标比例
+    """
+    if not 0 < val_ratio < 1:
+        raise ValueError(f'验证集比例应在 0~1 之间: {val_ratio}')
+    items = sorted(items, key=lambda item: _order_key(seed, item[0]))
+    ratios = {'train': 1 - val_ratio, 'val': val_ratio}
+
+    class_total = Counter(c for _, classes in items for c in classes)
+    need = {split: {c: n * r for c, n in class_total.items()} for split, r in ratios.items()}
+    capacity = {split: len(items) * r for split, r in ratios.items()}
+    assigned = {'train': [], 'val': []}
+
+    labeled = [item for item in items if item[1]]
+    background = [item for item in items if not item[1]]
+    # 最稀有的类别越少见越先分配（排序稳定，同等稀有度保持哈希顺序）
+    labeled.sort(key=lambda item: min(class_total[c] for c in item[1]))
+
+    for path, classes in labeled:
+        rarest = min(classes, key=lambda c: (class_total[c], c))
+        split = max(ratios, key=lambda s: (need[s][rarest], capacity[s], s == 'train'))
+        assigned[split].append(path)
+        capacity[split] -= 1
+        for c in classes:
+            need[split][c] -= 1
+
+    # 背景图片按剩余容量补齐两侧
+    for path, _ in background:
+        split = max(ratios, key=lambda s: (capacity[s], s == 'train'))
+        assigned[split].append(path)
+        capacity[split] -= 1
+
+    return sorted(assigned['train']), sorted(assigned['val'])
+
+
+def split_summary(paths, classes_of, class_names):
+    """某一侧的图片数和各类别的图片数"""
+    counts = Counter(c for path in paths for c in classes_of[path])
+    return {
+        'images': len(paths),
+        'background': sum(1 for path in paths if not classes_of[path]),
+        'images_per_class': {
+            class_names[c] if c < len(class_names) else str(c): counts.get(c, 0) for c in range(len(class_names))
+        }
+    }
+
+
+def label_source(image_path):
+    """数据集中图片对应的标注文件: images/<split>/x.jpg -> labels/<split>/x.txt"""
+    image_path = Path(image_path)
+    return image_path.parents[2] / 'labels' / image_path.parent.name / (image_path.stem + '.txt')
+
+
+def link_file(src, dst):
+    """dst 已是 src 的硬链接时跳过，否则重新放置（标注保存时原子替换会产生新文件）"""
+    try:
+        if os.path.samestat(os.stat(src), os.stat(dst)):
+            return False
+    except FileNotFoundError:
+        pass
+    materialize_file(src, dst)
+    return True
+
+
+class DatasetSplitter:
+    """
+    划分结果保存在 out_dir：images/<split>、labels/<split>（指向数据集文件的硬链接，
+    文件系统不支持时依次退回 reflink / 复制）和 split.json（划分参数及统计）。
+
+    用独立目录而不是图片清单：ultralytics 按标注所在目录命名标签缓存（labels/<split>.cache），
+    清单里混有两个原始目录的图片时训练集和验证集会互相覆盖缓存，每次训练都要重新扫描
+    """
+
+    def __init__(self, out_dir):
+        self.out_dir = Path(out_dir).absolute()
+        self.summary_file = self.out_dir / 'split.json'
+
+    def images_dir(self, split):
+        return self.out_dir / 'images' / split
+
+    def _sync(self, split, paths):
+        """让 images/<split>、labels/<split> 与划分结果一致，只增删有变化的链接"""
+        image_dir, label_dir = self.images_dir(split), self.out_dir / 'labels' / split
+        image_dir.mkdir(parents=True, exist_ok=True)
+        label_dir.mkdir(parents=True, exist_ok=True)
+        # 原 train / val 中可能有同名图片，链接名加上来源目录前缀
+        wanted = {f'{Path(p).parent.name}_{Path(p).name}': p for p in paths}
+        stems = {Path(name).stem for name in wanted}
+        for folder, keep in ((image_dir, lambda n: n in wanted), (label_dir, lambda n: Path(n).stem in stems)):
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if not keep(entry.name) and entry.name.endswith(('.txt',) + tuple(IMAGE_EXTENSIONS)):
+                        os.unlink(entry.path)
+        linked = 0
+        for name, src in wanted.items():
+            linked += link_file(src, image_dir / name)
+            linked += link_file(label_source(src), label_dir / (Path(name).stem + '.txt'))
+        return linked
+
+    def split(self, items, class_names, val_ratio=SPLIT_VAL_RATIO, seed=SPLIT_SEED):
+        """划分并更新链接目录，返回统计信息"""
+        items = list(items)
+        train, val = stratified_split(items, val_ratio, seed)
+        classes_of = dict(items)
+
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        linked = sum(self._sync(split, paths) for split, paths in (('train', train), ('val', val)))
+
+        summary = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'val_ratio': val_ratio,
+            'seed': seed,
+            'linked': linked,
+            'train': split_summary(train, classes_of, class_names),
+            'val': split_summary(val, classes_of, class_names)
+        }
+        write_text_atomic(self.summary_file, json.dumps(summary, ensure_ascii=False, indent=2))
+        return summary
+
+    def current(self):
+        """最近一次划分的统计信息（尚未划分时返回 None）"""
+        try:
+            with open(self.summary_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
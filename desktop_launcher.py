@@ -5,6 +5,7 @@ YOLOv8 训练系统 - 桌面客户端启动器
 """
 import os
 import sys
+import multiprocessing
 import threading
 import time
 from pathlib import Path
@@ -43,6 +44,8 @@ def start_server():
 
         # 获取应用并启动服务器
         app = get_app()
+        from runtime_config import print_runtime_report
+        print_runtime_report()
         app.run(
             host='127.0.0.1',
             port=7865,
@@ -99,4 +102,6 @@ def main():
         input("\n按回车键退出...")
 
 if __name__ == '__main__':
+    # 打包后训练任务以子进程运行，需要 freeze_support
+    multiprocessing.freeze_support()
     main()
@@ -3,16 +3,42 @@
 YOLOv8 目标检测 FastAPI 接口
 提供：图片上传 → 检测多个物体 → 返回位置+类别
 """
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi import FastAPI, File, UploadFile, Form, Header, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from ultralytics import YOLO
-from PIL import Image
-import io
+from fastapi.concurrency import run_in_threadpool
+import asyncio
 import numpy as np
 import cv2
 from typing import Optional
 import base64
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from batch_scheduler import BatchScheduler, QueueFullError, MAX_BATCH_SIZE, MAX_WAIT_MS, MAX_QUEUE_SIZE
+from model_registry import registry, get_model
+from detection_format import (
+    serialize_detections, negotiate_format, pack_msgpack, pack_detections, build_multipart,
+    LAYOUTS, MEDIA_TYPES, AVAILABLE_FORMATS
+)
+from frame_pipeline import FramePipeline, DROP_POLICIES, STREAM_MAX_INFLIGHT, STREAM_BUFFER_SIZE
+from result_cache import ResultCache, CachedDetections
+from inference_executor import InferenceExecutor, predict_with_replica, INFER_MODE, INFER_WORKERS
+from runtime_config import apply_runtime, runtime_report, print_runtime_report
+from inference_backends import resolve_model, backend_of, INFER_BACKEND, BACKENDS
+from model_optimize import find_variants, MODELS_DIR
+from stage_timing import ServerTimingMiddleware, stage, elapsed
+from image_decode import decode_image, restore_results, FAST_DECODE
+from tiled_inference import Tiling, tile_windows, tile_images, merge_detections, build_results, TILE_SIZE, TILE_OVERLAP, TILE_MERGE
+from image_render import render_results, RENDER_MEDIA_TYPE, RENDER_EXTENSION
+import service_metrics
+
+# 运行时配置：线程模式下多个工作者共享本进程的核，进程模式下主进程只做解码和序列化
+apply_runtime(workers=INFER_WORKERS if INFER_MODE == 'thread' else 1)
 
 app = FastAPI(
     title="YOLOv8 目标检测 API",
@@ -27,26 +53,170 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Cache"],
 )
 
+
 # 全局模型实例
 model = None
 model_path = "yolov8n.pt"
 
-def load_model(path: str = "yolov8n.pt"):
-    """加载 YOLO 模型"""
+def load_model(path: str = "yolov8n.pt", backend: Optional[str] = None):
+    """
+    加载模型（通过模型注册表缓存，切换回已加载过的模型无需重新加载）
+
+    backend: torch / onnx / openvino，默认取 YOLO_INFER_BACKEND；onnx / openvino 首次使用时自动导出
+    """
     global model, model_path
-    model = YOLO(path)
+    path = resolve_model(path, backend or INFER_BACKEND)
+    model = get_model(path)
     model_path = path
     return model
 
+# 推理工作池：线程池或进程池，每个工作者持有独立的模型副本
+executor = InferenceExecutor(mode=INFER_MODE, workers=INFER_WORKERS)
+
+# 请求合并调度器：并发请求合并为一次批量推理，再交给工作池执行
+scheduler = BatchScheduler(
+    predict_with_replica,
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait_ms=MAX_WAIT_MS,
+    max_queue=MAX_QUEUE_SIZE,
+    executor=executor,
+    concurrency=executor.workers
+)
+
+# 检测结果缓存：相同图片 + 模型 + 阈值的重复请求直接返回缓存结果
+result_cache = ResultCache()
+
+# Prometheus 指标（GET /metrics）：请求和各阶段耗时直方图、进行中的请求数、排队深度、模型加载次数
+service_metrics.install_fastapi(app, collectors=(
+    service_metrics.model_cache_metrics(registry),
+    service_metrics.result_cache_metrics(result_cache),
+    service_metrics.queue_metrics({'batch': lambda: scheduler.pending}),
+))
+
+# 分阶段计时：响应头 Server-Timing 返回 read / decode / cache / predict / serialize / plot / encode 各阶段耗时
+# （在指标中间件之后添加，位于外层，两者共用同一个计时器）
+app.add_middleware(ServerTimingMiddleware)
+
+# 队列已满时建议客户端的重试间隔（秒）
+RETRY_AFTER_SECONDS = int(os.environ.get('YOLO_RETRY_AFTER', 1))
+
+def service_busy(e: Exception) -> HTTPException:
+    """队列已满时返回 503 + Retry-After"""
+    return HTTPException(
+        status_code=503,
+        detail=f"服务繁忙，请稍后重试: {str(e)}",
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+    )
+
+def check_layout(layout: str):
+    """校验响应布局参数"""
+    if layout not in LAYOUTS:
+        raise HTTPException(status_code=400, detail=f"不支持的 layout: {layout}（可选 {' / '.join(LAYOUTS)}）")
+
+def choose_format(accept: Optional[str], requested: Optional[str], supported) -> str:
+    """根据 response_format 参数或 Accept 头确定响应格式"""
+    supported = [f for f in supported if f in AVAILABLE_FORMATS]
+    fmt = negotiate_format(accept, requested, supported)
+    if fmt is None:
+        raise HTTPException(
+            status_code=406,
+            detail=f"不支持的响应格式，可选: {', '.join(MEDIA_TYPES[f] for f in supported)}"
+        )
+    return fmt
+
+def encode_response(content: dict, fmt: str, image: Optional[bytes] = None) -> Response:
+    """按协商的格式编码响应；图片在 msgpack / multipart 中以原始字节传输"""
+    if image is not None:
+        content['image_type'] = RENDER_MEDIA_TYPE
+    if fmt == 'msgpack':
+        if image is not None:
+            content['image'] = image
+        return Response(pack_msgpack(content), media_type=MEDIA_TYPES['msgpack'])
+    if fmt == 'multipart':
+        body, content_type = build_multipart(content, image, RENDER_MEDIA_TYPE)
+        return Response(body, media_type=content_type)
+    if image is not None:
+        content['image_base64'] = base64.b64encode(image).decode('utf-8')
+    return JSONResponse(content=content)
+
+async def predict_image(img, conf: float, iou: float, tiling: Optional[Tiling] = None):
+    """
+    检测一张已解码的图片，返回原图坐标下的 Results
+
+    切片模式下各切片分段提交给调度器（每段正好填满所有工作者的批次，不会一次占满队列），
+    由调度器合并成批次在工作池中并行推理，最后全局合并重复框
+    """
+    if tiling is None:
+        # 与其他并发请求合并为一个批次
+        return restore_results(await scheduler.predict(img.array, model_path, conf, iou), img)
+
+    windows = tile_windows(img.width, img.height, tiling)
+    tiles = await run_in_threadpool(tile_images, img.array, windows)
+    step = scheduler.max_batch_size * executor.workers
+    if scheduler.max_queue:
+        step = min(step, scheduler.max_queue)
+    results_list = []
+    for i in range(0, len(tiles), step):
+        futures = scheduler.submit_many(tiles[i:i + step], model_path, conf, iou)
+        results_list.extend(await asyncio.gather(*(asyncio.wrap_future(f) for f in futures)))
+    det = await run_in_threadpool(merge_detections, results_list, windows, tiling)
+    return build_results(img.array, det, results_list[0].names)
+
+async def predict_cached(contents: bytes, conf: float, iou: float, tiling: Optional[Tiling] = None):
+    """
+    解码并检测单张图片，优先使用结果缓存
+
+    返回 (img, results, entry, hit)，img 为 DecodedImage（大图可能按缩小尺寸解码，
+    results 中的检测框已换算回原图坐标），entry 为缓存条目（缓存关闭时为 None）；
+    tiling 不为空时按原尺寸解码并切片推理
+    """
+    with stage('decode'):
+        img = await run_in_threadpool(decode_image, contents, fast=FAST_DECODE and tiling is None)
+    if not result_cache.enabled:
+        with stage('predict'):
+            return img, await predict_image(img, conf, iou, tiling), None, False
+
+    with stage('cache'):
+        key = await run_in_threadpool(result_cache.make_key, contents, model_path, conf, iou, tiling and tiling.key)
+        entry = await run_in_threadpool(result_cache.get, key)
+        if entry is not None:
+            return img, entry.to_results(img.array), entry, True
+
+    with stage('predict'):
+        results = await predict_image(img, conf, iou, tiling)
+    with stage('cache'):
+        entry = await run_in_threadpool(result_cache.put, key, CachedDetections.from_results(results))
+    return img, results, entry, False
+
+async def annotated_cached(results, entry) -> bytes:
+    """标注图片（格式由 YOLO_RENDER_FORMAT 决定），缓存命中时复用已编码的图片"""
+    if entry is not None and entry.annotated is not None:
+        return entry.annotated
+    buffer = await run_in_threadpool(render_results, results)
+    if entry is not None:
+        result_cache.attach(entry, buffer)
+    return buffer
+
 # 启动时加载模型
 @app.on_event("startup")
 async def startup_event():
     """启动时加载默认模型"""
     print("正在加载 YOLOv8 模型...")
     load_model()
-    print(f"✓ 模型加载完成: {model_path}")
+    print(f"✓ 模型加载完成: {model_path} (backend={backend_of(model_path)})")
+    executor.start()
+    scheduler.start()
+    print(f"✓ 推理工作池已启动 (mode={executor.mode}, workers={executor.workers})")
+    print(f"✓ 批处理调度器已启动 (max_batch_size={scheduler.max_batch_size}, max_wait_ms={scheduler.max_wait_ms}, max_queue={scheduler.max_queue})")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """关闭时停止调度器和工作池"""
+    scheduler.stop()
+    executor.shutdown()
 
 @app.get("/")
 async def root():
@@ -58,7 +228,10 @@ async def root():
         "endpoints": {
             "/detect": "POST - 检测图片中的物体（返回JSON）",
             "/detect_image": "POST - 检测并返回标注后的图片",
+            "/detect_video": "POST - 上传视频，逐帧流式返回检测结果 (NDJSON)",
+            "/ws/detect": "WebSocket - 连续发送编码后的帧，逐帧返回检测结果",
             "/health": "GET - 健康检查",
+            "/metrics": "GET - Prometheus 指标",
             "/models": "GET - 查看可用模型",
             "/load_model": "POST - 加载指定模型"
         },
@@ -74,7 +247,25 @@ async def health_check():
     return {
         "status": "healthy",
         "model_loaded": model is not None,
-        "model_path": model_path
+        "model_path": model_path,
+        "backend": backend_of(model_path),
+        "batching": {
+            "max_batch_size": scheduler.max_batch_size,
+            "max_wait_ms": scheduler.max_wait_ms,
+            "max_queue": scheduler.max_queue,
+            "pending": scheduler.pending
+        },
+        "executor": {
+            "mode": executor.mode,
+            "workers": executor.workers
+        },
+        "streaming": {
+            "max_inflight": STREAM_MAX_INFLIGHT,
+            "buffer_size": STREAM_BUFFER_SIZE
+        },
+        "model_cache": registry.stats(),
+        "result_cache": result_cache.stats(),
+        "runtime": runtime_report()
     }
 
 @app.post("/detect")
@@ -82,7 +273,14 @@ async def detect_objects(
     image: UploadFile = File(..., description="要检测的图片"),
     conf_threshold: float = Form(0.25, description="置信度阈值 (0-1)"),
     iou_threshold: float = Form(0.45, description="IOU阈值 (0-1)"),
-    return_image: bool = Form(False, description="是否返回标注后的图片(base64)")
+    return_image: bool = Form(False, description="是否返回标注后的图片(base64)"),
+    layout: str = Form("objects", description="结果布局: objects(逐个物体) / columns(列式数组)"),
+    response_format: Optional[str] = Form(None, description="响应格式: json / msgpack / packed / multipart，默认按 Accept 头协商"),
+    tiled: bool = Form(False, description="切片推理：大图切成重叠小块分别检测后合并，适合超大图中的小目标"),
+    tile_size: int = Form(TILE_SIZE, description="切片边长（像素）"),
+    tile_overlap: float = Form(TILE_OVERLAP, description="相邻切片的重叠比例 [0, 1)"),
+    tile_merge: str = Form(TILE_MERGE, description="切片结果的合并方式: nms / wbf"),
+    accept: Optional[str] = Header(None)
 ):
     """
     检测图片中的物体
@@ -91,79 +289,80 @@ async def detect_objects(
     - image: 图片文件
     - conf_threshold: 置信度阈值，低于此值的检测结果会被过滤
     - iou_threshold: IOU阈值，用于非极大值抑制
+    - layout: objects 返回逐个物体的列表；columns 返回 x1/y1/x2/y2/confidence/class_id 并列数组
+    - response_format: json（默认）/ msgpack / packed（float32 数组）/ multipart（JSON + 原始 JPEG）
+    - tiled: 切片推理（SAHI 风格），tile_size / tile_overlap / tile_merge 为切片参数
 
     返回:
-    - detections: 检测结果列表
+    - detections: 检测结果列表（或列式数组）
     - count: 检测到的物体数量
-    - image_base64: (可选) 标注后的图片 (base64编码)
+    - image_base64: (可选) 标注后的图片 (base64编码；msgpack 为 image 字段原始字节，multipart 为独立的 image 部分)，
+      image_type 为其媒体类型
     """
     if model is None:
         raise HTTPException(status_code=500, detail="模型未加载")
+    check_layout(layout)
+    fmt = choose_format(accept, response_format, ('json', 'msgpack', 'packed', 'multipart'))
+    if fmt == 'packed' and return_image:
+        raise HTTPException(status_code=400, detail="packed 格式不包含图片，请使用 multipart 或 msgpack")
+    tiling = None
+    if tiled:
+        try:
+            tiling = Tiling(tile_size, tile_overlap, tile_merge)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
     try:
-        # 读取图片
-        contents = await image.read()
-        img = Image.open(io.BytesIO(contents)).convert('RGB')
-
-        # 进行检测
-        results = model.predict(
-            img,
-            conf=conf_threshold,
-            iou=iou_threshold,
-            verbose=False
-        )[0]
-
-        # 提取检测结果
-        detections = []
-        boxes = results.boxes
-
-        for i, box in enumerate(boxes):
-            # 获取边界框坐标
-            x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-            # 获取置信度
-            conf = float(box.conf[0])
-            # 获取类别
-            cls = int(box.cls[0])
-            class_name = results.names[cls]
-
-            detections.append({
-                'id': i + 1,
-                'class': class_name,
-                'confidence': round(conf, 4),
-                'bbox': {
-                    'x1': round(float(x1), 2),
-                    'y1': round(float(y1), 2),
-                    'x2': round(float(x2), 2),
-                    'y2': round(float(y2), 2),
-                    'width': round(float(x2 - x1), 2),
-                    'height': round(float(y2 - y1), 2)
-                }
-            })
+        # 读取图片（含处理函数开始前接收和解析上传表单的时间）
+        elapsed('read')
+        with stage('read'):
+            contents = await image.read()
+
+        # 进行检测（重复图片直接使用缓存结果）
+        img, results, entry, cached = await predict_cached(contents, conf_threshold, iou_threshold, tiling)
+
+        parameters = {
+            'conf_threshold': conf_threshold,
+            'iou_threshold': iou_threshold
+        }
+        if tiling is not None:
+            parameters['tiling'] = tiling.to_dict()
+
+        # packed 格式直接输出 float32 数组，无需生成逐个物体的字典
+        if fmt == 'packed':
+            with stage('serialize'):
+                body = pack_detections([results], {
+                    'image_size': {'width': img.width, 'height': img.height},
+                    'parameters': parameters
+                })
+            return Response(body, media_type=MEDIA_TYPES['packed'], headers={'X-Cache': 'HIT' if cached else 'MISS'})
+
+        # 提取检测结果（一次性批量转换）
+        with stage('serialize'):
+            detections, count = serialize_detections(results, layout)
 
         response = {
             'success': True,
-            'count': len(detections),
+            'count': count,
             'detections': detections,
             'image_size': {
                 'width': img.width,
                 'height': img.height
             },
-            'parameters': {
-                'conf_threshold': conf_threshold,
-                'iou_threshold': iou_threshold
-            }
+            'parameters': parameters,
+            'cached': cached
         }
 
         # 如果需要返回标注后的图片
+        buffer = None
         if return_image:
-            annotated_img = results.plot()
-            # 转换为 base64
-            _, buffer = cv2.imencode('.jpg', annotated_img)
-            img_base64 = base64.b64encode(buffer).decode('utf-8')
-            response['image_base64'] = img_base64
+            buffer = await annotated_cached(results, entry)
 
-        return JSONResponse(content=response)
+        with stage('serialize'):
+            return encode_response(response, fmt, buffer)
 
+    except QueueFullError as e:
+        raise service_busy(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"检测失败: {str(e)}")
 
@@ -176,37 +375,34 @@ async def detect_and_return_image(
     """
     检测图片并直接返回标注后的图片
 
-    返回: 标注后的图片 (JPEG格式)
+    返回: 标注后的图片（JPEG，YOLO_RENDER_FORMAT=webp 时为 WebP）
     """
     if model is None:
         raise HTTPException(status_code=500, detail="模型未加载")
 
     try:
-        # 读取图片
-        contents = await image.read()
-        img = Image.open(io.BytesIO(contents)).convert('RGB')
-
-        # 进行检测
-        results = model.predict(
-            img,
-            conf=conf_threshold,
-            iou=iou_threshold,
-            verbose=False
-        )[0]
-
-        # 获取标注后的图片
-        annotated_img = results.plot()
-
-        # 转换为字节流
-        _, buffer = cv2.imencode('.jpg', annotated_img)
-        img_bytes = io.BytesIO(buffer.tobytes())
-
-        return StreamingResponse(
-            img_bytes,
-            media_type="image/jpeg",
-            headers={"Content-Disposition": "inline; filename=detected.jpg"}
+        # 读取图片（含处理函数开始前接收和解析上传表单的时间）
+        elapsed('read')
+        with stage('read'):
+            contents = await image.read()
+
+        # 进行检测（重复图片直接使用缓存结果）
+        img, results, entry, cached = await predict_cached(contents, conf_threshold, iou_threshold)
+
+        # 获取标注后的图片（已编码的字节直接作为响应体）
+        buffer = await annotated_cached(results, entry)
+
+        return Response(
+            buffer,
+            media_type=RENDER_MEDIA_TYPE,
+            headers={
+                "Content-Disposition": f"inline; filename=detected{RENDER_EXTENSION}",
+                "X-Cache": "HIT" if cached else "MISS"
+            }
         )
 
+    except QueueFullError as e:
+        raise service_busy(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"检测失败: {str(e)}")
 
@@ -214,7 +410,10 @@ async def detect_and_return_image(
 async def detect_batch(
     images: list[UploadFile] = File(..., description="多张图片"),
     conf_threshold: float = Form(0.25),
-    iou_threshold: float = Form(0.45)
+    iou_threshold: float = Form(0.45),
+    layout: str = Form("objects", description="结果布局: objects / columns"),
+    response_format: Optional[str] = Form(None, description="响应格式: json / msgpack / packed，默认按 Accept 头协商"),
+    accept: Optional[str] = Header(None)
 ):
     """
     批量检测多张图片
@@ -223,49 +422,59 @@ async def detect_batch(
     """
     if model is None:
         raise HTTPException(status_code=500, detail="模型未加载")
+    check_layout(layout)
+    fmt = choose_format(accept, response_format, ('json', 'msgpack', 'packed'))
+
+    # 先读取并解码全部图片（解码在线程池中进行）
+    elapsed('read')
+    decoded = []
+    for image_file in images:
+        try:
+            with stage('read'):
+                contents = await image_file.read()
+            with stage('decode'):
+                decoded.append(await run_in_threadpool(decode_image, contents))
+        except Exception as e:
+            decoded.append(e)
+
+    # 再一次性提交给调度器，使其合并为批次；队列容量不足时整体返回 503
+    valid = [img.array for img in decoded if not isinstance(img, Exception)]
+    try:
+        futures = iter(scheduler.submit_many(valid, model_path, conf_threshold, iou_threshold))
+    except QueueFullError as e:
+        raise service_busy(e)
+    pending = [img if isinstance(img, Exception) else next(futures) for img in decoded]
 
     results = []
+    packed_results = []
 
-    for i, image_file in enumerate(images):
+    for i, (image_file, img, future) in enumerate(zip(images, decoded, pending)):
         try:
-            # 读取图片
-            contents = await image_file.read()
-            img = Image.open(io.BytesIO(contents)).convert('RGB')
-
-            # 进行检测
-            detection_results = model.predict(
-                img,
-                conf=conf_threshold,
-                iou=iou_threshold,
-                verbose=False
-            )[0]
-
-            # 提取检测结果
-            detections = []
-            boxes = detection_results.boxes
-
-            for j, box in enumerate(boxes):
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                conf = float(box.conf[0])
-                cls = int(box.cls[0])
-                class_name = detection_results.names[cls]
-
-                detections.append({
-                    'id': j + 1,
-                    'class': class_name,
-                    'confidence': round(conf, 4),
-                    'bbox': {
-                        'x1': round(float(x1), 2),
-                        'y1': round(float(y1), 2),
-                        'x2': round(float(x2), 2),
-                        'y2': round(float(y2), 2)
-                    }
+            if isinstance(future, Exception):
+                raise future
+
+            # 等待检测结果（检测框换算回原图坐标）
+            with stage('predict'):
+                detection_results = restore_results(await asyncio.wrap_future(future), img)
+
+            # packed 格式最后统一打包
+            if fmt == 'packed':
+                packed_results.append(detection_results)
+                results.append({
+                    'image_index': i,
+                    'image_name': image_file.filename,
+                    'count': len(detection_results.boxes)
                 })
+                continue
+
+            # 提取检测结果（一次性批量转换）
+            with stage('serialize'):
+                detections, count = serialize_detections(detection_results, layout, with_size=False)
 
             results.append({
                 'image_index': i,
                 'image_name': image_file.filename,
-                'count': len(detections),
+                'count': count,
                 'detections': detections
             })
 
@@ -276,17 +485,221 @@ async def detect_batch(
                 'error': str(e)
             })
 
-    return JSONResponse(content={
-        'success': True,
-        'total_images': len(images),
-        'results': results
-    })
+    if fmt == 'packed':
+        # 检测框按成功图片的顺序拼接，results 中记录每张图片的框数或错误
+        with stage('serialize'):
+            body = pack_detections(packed_results, {'total_images': len(images), 'results': results})
+        return Response(body, media_type=MEDIA_TYPES['packed'])
+
+    with stage('serialize'):
+        return encode_response({
+            'success': True,
+            'total_images': len(images),
+            'results': results
+        }, fmt)
+
+@app.websocket("/ws/detect")
+async def detect_stream(
+    websocket: WebSocket,
+    conf_threshold: float = 0.25,
+    iou_threshold: float = 0.45,
+    layout: str = "objects",
+    drop_policy: str = "oldest",
+    max_inflight: int = STREAM_MAX_INFLIGHT
+):
+    """
+    实时帧流检测
+
+    客户端连续发送编码后的图片帧（二进制消息，JPEG/PNG），
+    也可发送 JSON 文本消息更新 conf_threshold / iou_threshold。
+    服务端按帧顺序返回 JSON 检测结果；处理跟不上时按 drop_policy 丢帧，
+    每条结果中的 dropped 为累计丢帧数。
+    """
+    await websocket.accept()
+    if model is None or layout not in LAYOUTS or drop_policy not in DROP_POLICIES:
+        await websocket.send_json({'error': '模型未加载或参数无效'})
+        await websocket.close(code=1003)
+        return
+
+    params = {'conf_threshold': conf_threshold, 'iou_threshold': iou_threshold}
+
+    async def frames():
+        while True:
+            message = await websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            if message.get('bytes') is not None:
+                yield (message['bytes'], time.perf_counter())
+            elif message.get('text'):
+                try:
+                    update = json.loads(message['text'])
+                    params.update({k: float(v) for k, v in update.items() if k in params})
+                except (ValueError, AttributeError):
+                    await websocket.send_json({'error': f"无效的控制消息: {message['text'][:100]}"})
+
+    async def process(frame):
+        contents, received_at = frame
+        img = await run_in_threadpool(decode_image, contents)
+        try:
+            results = await scheduler.predict(img.array, model_path, params['conf_threshold'], params['iou_threshold'])
+        except QueueFullError:
+            pipeline.drop()
+            return {'error': '服务繁忙，已丢弃该帧', 'skipped': True}
+        restore_results(results, img)
+        detections, count = serialize_detections(results, layout)
+        return {
+            'count': count,
+            'detections': detections,
+            'image_size': {'width': img.width, 'height': img.height},
+            'latency_ms': round((time.perf_counter() - received_at) * 1000, 2)
+        }
+
+    async def send(index, result):
+        await websocket.send_json({'frame': index, 'dropped': pipeline.dropped, **result})
+
+    pipeline = FramePipeline(process, max_inflight=max_inflight, drop_policy=drop_policy)
+    try:
+        await pipeline.run(frames(), send)
+    except (WebSocketDisconnect, RuntimeError):
+        # 客户端断开连接
+        pass
+
+@app.post("/detect_video")
+async def detect_video(
+    video: UploadFile = File(..., description="视频文件"),
+    conf_threshold: float = Form(0.25),
+    iou_threshold: float = Form(0.45),
+    layout: str = Form("objects", description="结果布局: objects / columns"),
+    frame_stride: int = Form(1, description="每隔多少帧检测一次"),
+    max_frames: int = Form(0, description="最多检测的帧数，0 表示不限制")
+):
+    """
+    视频逐帧检测
+
+    返回: NDJSON 流，每行一帧的检测结果，最后一行为汇总信息
+    视频解码、推理、序列化流水线并行，多帧会在调度器中合并为批次
+    """
+    if model is None:
+        raise HTTPException(status_code=500, detail="模型未加载")
+    check_layout(layout)
+    frame_stride = max(1, frame_stride)
+
+    # OpenCV 需要文件路径，先把上传内容写入临时文件
+    suffix = Path(video.filename or '').suffix or '.mp4'
+    tmp = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+    try:
+        await run_in_threadpool(shutil.copyfileobj, video.file, tmp)
+    finally:
+        tmp.close()
+
+    cap = cv2.VideoCapture(tmp.name)
+    if not cap.isOpened():
+        cap.release()
+        os.remove(tmp.name)
+        raise HTTPException(status_code=400, detail="无法解码视频文件")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0
+    # 读取和释放互斥：客户端断开时 run 被取消，线程池中的读取可能还没结束
+    capture_lock = threading.Lock()
+
+    def read_frame(index):
+        """解码下一帧；跳过的帧只 grab 不做颜色转换"""
+        with capture_lock:
+            if index % frame_stride:
+                return cap.grab(), None
+            return cap.read()
+
+    def close_capture():
+        """等进行中的读取结束后释放视频并删除临时文件"""
+        with capture_lock:
+            cap.release()
+        os.remove(tmp.name)
+
+    async def frames():
+        index = produced = 0
+        while not max_frames or produced < max_frames:
+            ok, frame = await run_in_threadpool(read_frame, index)
+            if not ok:
+                return
+            if frame is not None:
+                yield (index, frame)
+                produced += 1
+            index += 1
+
+    async def process(item):
+        index, frame = item
+        # 离线视频不丢帧：队列满时稍后重试
+        while True:
+            try:
+                results = await scheduler.predict(frame, model_path, conf_threshold, iou_threshold)
+                break
+            except QueueFullError:
+                await asyncio.sleep(0.05)
+        detections, count = serialize_detections(results, layout)
+        return {
+            'frame': index,
+            'time': round(index / fps, 3) if fps else None,
+            'count': count,
+            'detections': detections
+        }
+
+    lines = asyncio.Queue()
+
+    async def sink(_, result):
+        await lines.put(json.dumps(result, ensure_ascii=False) + '\n')
+
+    async def run():
+        started = time.perf_counter()
+        pipeline = FramePipeline(process, drop_policy='none')
+        try:
+            await pipeline.run(frames(), sink)
+            elapsed = time.perf_counter() - started
+            summary = {
+                'done': True,
+                'frames': pipeline.processed,
+                'fps': fps,
+                'elapsed': round(elapsed, 3),
+                'processing_fps': round(pipeline.processed / elapsed, 2) if elapsed else None
+            }
+        except Exception as e:
+            summary = {'done': True, 'error': str(e)}
+        finally:
+            await run_in_threadpool(close_capture)
+        await lines.put(json.dumps(summary, ensure_ascii=False) + '\n')
+        await lines.put(None)
+
+    async def stream():
+        task = asyncio.ensure_future(run())
+        try:
+            while True:
+                line = await lines.get()
+                if line is None:
+                    break
+                yield line
+        finally:
+            task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 @app.get("/models")
 async def list_models():
     """列出可用的模型"""
+    # 训练系统生成的量化 / 导出版本（model_name 填 path 即可加载）
+    optimized = await run_in_threadpool(find_variants, MODELS_DIR)
     return {
         "current_model": model_path,
+        "optimized_models": [
+            {
+                "name": f"{v['run']}/{v['name']}",
+                "path": v['path'],
+                "backend": v['backend'],
+                "precision": v['precision'],
+                "size": f"{v['size_mb']}MB",
+                "mAP50_95": v.get('mAP50_95'),
+                "latency_ms": v.get('latency_ms'),
+                "speedup": v.get('speedup')
+            }
+            for v in optimized
+        ],
         "available_models": [
             {
                 "name": "yolov8n.pt",
@@ -327,14 +740,20 @@ async def list_models():
     }
 
 @app.post("/load_model")
-async def load_model_endpoint(model_name: str = Form(...)):
-    """加载指定的模型"""
+async def load_model_endpoint(model_name: str = Form(...), backend: Optional[str] = Form(None)):
+    """加载指定的模型（backend 可选 torch / onnx / openvino）"""
+    if backend is not None and backend not in BACKENDS:
+        raise HTTPException(status_code=400, detail=f"不支持的推理后端: {backend}（可选 {' / '.join(BACKENDS)}）")
     try:
-        load_model(model_name)
+        previous = model_path
+        await run_in_threadpool(load_model, model_name, backend)
+        # 切换模型后旧模型的缓存结果不再有效
+        await run_in_threadpool(result_cache.invalidate, previous)
         return {
             "success": True,
             "message": f"模型 {model_name} 加载成功",
-            "current_model": model_path
+            "current_model": model_path,
+            "backend": backend_of(model_path)
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"加载模型失败: {str(e)}")
@@ -363,6 +782,7 @@ Python示例:
       )
   print(response.json())
     """)
+    print_runtime_report()
 
     uvicorn.run(
         app,
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+检测结果序列化
+一次性把检测框从张量取到 NumPy，再批量生成响应数据，避免逐框的张量操作
+"""
+import json
+import struct
+import uuid
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # 可选依赖：未安装时不支持 MessagePack 响应
+    msgpack = None
+
+# 响应布局：objects 为逐个物体的字典列表，columns 为并列数组
+LAYOUTS = ('objects', 'columns')
+
+# 响应格式及对应的媒体类型
+MEDIA_TYPES = {
+    'json': 'application/json',
+    'msgpack': 'application/msgpack',
+    'packed': 'application/x-yolo-packed',
+    'multipart': 'multipart/mixed'
+}
+# 依赖已安装、可以返回的格式（未安装 msgpack 时不参与协商，请求方得到 406）
+AVAILABLE_FORMATS = tuple(fmt for fmt in MEDIA_TYPES if fmt != 'msgpack' or msgpack is not None)
+MEDIA_ALIASES = {
+    **{media: fmt for fmt, media in MEDIA_TYPES.items()},
+    'application/x-msgpack': 'msgpack',
+    'application/vnd.msgpack': 'msgpack',
+    '*/*': 'json',
+    'application/*': 'json'
+}
+
+# packed 格式: 魔数 + uint32 头长度 + UTF-8 JSON 头 + N×6 float32（小端）
+PACKED_MAGIC = b'YDET'
+PACKED_COLUMNS = ['x1', 'y1', 'x2', 'y2', 'confidence', 'class_id']
+
+
+def extract_boxes(results):
+    """
+    一次性提取所有检测框
+
+    返回:
+    - xyxy: (N, 4) float32 边界框
+    - conf: (N,) float32 置信度
+    - cls: (N,) int64 类别ID
+    """
+    data = results.boxes.data
+    if hasattr(data, 'cpu'):
+        data = data.cpu().numpy()
+    data = np.asarray(data, dtype=np.float32)
+    # boxes.data 的列: x1, y1, x2, y2, [track_id], conf, cls
+    return data[:, :4], data[:, -2], data[:, -1].astype(np.int64)
+
+
+def detections_to_objects(results, with_size=True):
+    """生成逐个物体的检测结果列表"""
+    xyxy, conf, cls = extract_boxes(results)
+    names = results.names
+    sizes = (xyxy[:, 2:] - xyxy[:, :2]).tolist()
+
+    # 用 Python 的 round()：np.round 先乘再舍入，部分值的结果与逐框序列化差一位
+    detections = []
+    for i, ((x1, y1, x2, y2), c, k, (w, h)) in enumerate(zip(xyxy.tolist(), conf.tolist(), cls.tolist(), sizes)):
+        bbox = {'x1': round(x1, 2), 'y1': round(y1, 2), 'x2': round(x2, 2), 'y2': round(y2, 2)}
+        if with_size:
+            bbox['width'] = round(w, 2)
+            bbox['height'] = round(h, 2)
+        detections.append({
+            'id': i + 1,
+            'class': names[k],
+            'confidence': round(c, 4),
+            'bbox': bbox
+        })
+    return detections
+
+
+def detections_to_columns(results):
+    """生成列式检测结果：x1/y1/x2/y2/confidence/class_id 并列数组 + 类别名映射"""
+    xyxy, conf, cls = extract_boxes(results)
+    x1, y1, x2, y2 = ([round(v, 2) for v in column] for column in xyxy.T.tolist())
+    return {
+        'x1': x1,
+        'y1': y1,
+        'x2': x2,
+        'y2': y2,
+        'confidence': [round(v, 4) for v in conf.tolist()],
+        'class_id': cls.tolist(),
+        'names': {int(k): results.names[int(k)] for k in np.unique(cls)}
+    }
+
+
+def serialize_detections(results, layout='objects', with_size=True):
+    """按指定布局序列化检测结果，返回 (detections, count)"""
+    if layout == 'columns':
+        detections = detections_to_columns(results)
+        return detections, len(detections['class_id'])
+    detections = detections_to_objects(results, with_size=with_size)
+    return detections, len(detections)
+
+
+def negotiate_format(accept=None, requested=None, supported=AVAILABLE_FORMATS):
+    """
+    确定响应格式
+
+    显式指定的 requested 优先，否则按 Accept 头（支持 q 值）协商；
+    没有可接受的格式时返回 None（supported 中依赖未安装的格式不会被选中）
+    """
+    supported = [fmt for fmt in supported if fmt in AVAILABLE_FORMATS]
+    if requested:
+        return requested if requested in supported else None
+    if not accept:
+        return 'json'
+
+    candidates = []
+    for order, item in enumerate(accept.split(',')):
+        media, *params = [p.strip() for p in item.split(';')]
+        q = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            candidates.append((-q, order, media.lower()))
+
+    for _, _, media in sorted(candidates):
+        fmt = MEDIA_ALIASES.get(media)
+        if fmt in supported:
+            return fmt
+    return None
+
+
+def pack_msgpack(content):
+    """MessagePack 编码（bytes 字段以二进制原样写入）"""
+    if msgpack is None:
+        raise RuntimeError('未安装 msgpack，无法返回 MessagePack 格式（pip install msgpack）')
+    return msgpack.packb(content, use_bin_type=True)
+
+
+def pack_detections(results_list, meta=None):
+    """
+    packed 格式编码
+
+    多张图片的检测框按顺序拼接，头部 counts 记录每张图片的框数
+    """
+    arrays, counts, names = [], [], {}
+    for results in results_list:
+        xyxy, conf, cls = extract_boxes(results)
+        arrays.append(np.column_stack([xyxy, conf, cls.astype(np.float32)]))
+        counts.append(len(cls))
+        names.update({int(k): results.names[int(k)] for k in np.unique(cls)})
+
+    header = {
+        'columns': PACKED_COLUMNS,
+        'counts': counts,
+        'names': {str(k): v for k, v in names.items()},
+        **(meta or {})
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    boxes = np.concatenate(arrays) if arrays else np.zeros((0, 6))
+    return (
+        struct.pack('<4sI', PACKED_MAGIC, len(header_bytes))
+        + header_bytes
+        + np.ascontiguousarray(boxes, dtype='<f4').tobytes()
+    )
+
+
+def unpack_detections(data):
+    """packed 格式解码，返回 (header, (N, 6) float32 数组)"""
+    magic, header_len = struct.unpack_from('<4sI', data)
+    if magic != PACKED_MAGIC:
+        raise ValueError('不是 packed 检测结果')
+    header = json.loads(data[8:8 + header_len].decode('utf-8'))
+    boxes = np.frombuffer(data, dtype='<f4', offset=8 + header_len).reshape(-1, len(header['columns']))
+    return header, boxes
+
+
+def build_multipart(content, image=None, image_type='image/jpeg'):
+    """
+    multipart/mixed 编码：JSON 结果 + 原始图片字节（不做 base64）
+
+    返回 (body, content_type)
+    """
+    boundary = uuid.uuid4().hex
+    parts = [('result', 'application/json', json.dumps(content, ensure_ascii=False).encode('utf-8'))]
+    if image is not None:
+        parts.append(('image', image_type, image))
+
+    chunks = []
+    for name, content_type, payload in parts:
+        chunks.append((
+            f'--{boundary}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Disposition: inline; name="{name}"\r\n'
+            f'Content-Length: {len(payload)}\r\n\r\n'
+        ).encode('ascii'))
+        chunks.append(payload)
+        chunks.append(b'\r\n')
+    chunks.append(f'--{boundary}--\r\n'.encode('ascii'))
+    return b''.join(chunks), f'multipart/mixed; boundary={boundary}'
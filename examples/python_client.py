@@ -2,9 +2,53 @@
 Python客户端示例 - 如何使用YOLO训练系统API
 """
 import requests
+import sys
 from pathlib import Path
 from PIL import Image
 import io
+import json
+import numpy as np
+
+# 响应格式的编解码与服务端共用 detection_format（仓库根目录）
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from detection_format import MEDIA_TYPES, unpack_detections
+
+try:
+    import msgpack
+except ImportError:  # 可选：仅 MessagePack 格式需要
+    msgpack = None
+
+
+# 响应格式对应的 Accept 头
+FORMAT_ACCEPT = MEDIA_TYPES
+
+
+def decode_packed(data):
+    """
+    解码 packed 格式: 魔数 YDET + uint32 头长度 + JSON 头 + N×6 float32
+
+    返回头部字典，并附加:
+    - boxes: (N, 6) 数组，列为 x1, y1, x2, y2, confidence, class_id
+    - boxes_per_image: 按 counts 拆分后的数组列表
+    """
+    result, boxes = unpack_detections(data)
+    result['boxes'] = boxes
+    result['boxes_per_image'] = np.split(boxes, np.cumsum(result['counts'])[:-1])
+    return result
+
+
+def decode_multipart(data, content_type):
+    """解码 multipart/mixed 响应：JSON 结果 + 原始图片字节（image 字段）"""
+    boundary = content_type.split('boundary=', 1)[1].strip('"').encode('ascii')
+    result = {}
+    for part in data.split(b'--' + boundary)[1:-1]:
+        head, _, payload = part.partition(b'\r\n\r\n')
+        payload = payload[:-2]  # 去掉结尾的 \r\n
+        if b'application/json' in head.lower():
+            result.update(json.loads(payload.decode('utf-8')))
+        else:
+            result['image'] = payload
+    return result
 
 
 class YOLOClient:
@@ -18,7 +62,21 @@ class YOLOClient:
         response = requests.get(f'{self.base_url}/health')
         return response.json()
 
-    def detect(self, image_path, conf=0.25, iou=0.45):
+    @staticmethod
+    def decode_response(response):
+        """按 Content-Type 解码检测响应"""
+        content_type = response.headers.get('Content-Type', '')
+        if content_type.startswith(('application/msgpack', 'application/x-msgpack')):
+            if msgpack is None:
+                raise RuntimeError('需要安装 msgpack 才能解码 MessagePack 响应')
+            return msgpack.unpackb(response.content, raw=False, strict_map_key=False)
+        if content_type.startswith('application/x-yolo-packed'):
+            return decode_packed(response.content)
+        if content_type.startswith('multipart/'):
+            return decode_multipart(response.content, content_type)
+        return response.json()
+
+    def detect(self, image_path, conf=0.25, iou=0.45, fmt='json', return_image=False):
         """
         检测单张图片
 
@@ -26,6 +84,8 @@ class YOLOClient:
             image_path: 图片路径
             conf: 置信度阈值 (0-1)
             iou: IoU阈值 (0-1)
+            fmt: 响应格式 json / msgpack / packed / multipart
+            return_image: 是否同时返回标注图片（msgpack / multipart 中为原始 JPEG 字节）
 
         Returns:
             检测结果字典
@@ -36,22 +96,25 @@ class YOLOClient:
                 files={'image': f},
                 data={
                     'conf_threshold': conf,
-                    'iou_threshold': iou
-                }
+                    'iou_threshold': iou,
+                    'return_image': return_image
+                },
+                headers={'Accept': FORMAT_ACCEPT[fmt]}
             )
 
         if response.status_code == 200:
-            return response.json()
+            return self.decode_response(response)
         else:
             raise Exception(f'检测失败: {response.status_code}')
 
-    def detect_batch(self, image_paths, conf=0.25):
+    def detect_batch(self, image_paths, conf=0.25, fmt='json'):
         """
         批量检测
 
         Args:
             image_paths: 图片路径列表
             conf: 置信度阈值
+            fmt: 响应格式 json / msgpack / packed
 
         Returns:
             批量检测结果
@@ -62,11 +125,12 @@ class YOLOClient:
             response = requests.post(
                 f'{self.base_url}/detect_batch',
                 files=files,
-                data={'conf_threshold': conf}
+                data={'conf_threshold': conf},
+                headers={'Accept': FORMAT_ACCEPT[fmt]}
             )
 
             if response.status_code == 200:
-                return response.json()
+                return self.decode_response(response)
             else:
                 raise Exception(f'批量检测失败: {response.status_code}')
         finally:
@@ -210,6 +274,23 @@ def example_6_error_handling():
         print(f"❌ 错误: {e}")
 
 
+def example_7_compact_formats():
+    """示例7: 紧凑响应格式"""
+    print("\n" + "=" * 60)
+    print("示例7: 紧凑响应格式")
+    print("=" * 60)
+
+    client = YOLOClient()
+
+    # packed: 直接得到 (N, 6) float32 数组
+    result = client.detect('test.jpg', fmt='packed')
+    print(f"packed: {result['counts'][0]} 个物体, 数组形状 {result['boxes'].shape}")
+
+    # multipart: JSON 结果 + 原始 JPEG（不经过 base64）
+    result = client.detect('test.jpg', fmt='multipart', return_image=True)
+    print(f"multipart: {result['count']} 个物体, 图片 {len(result['image'])} 字节")
+
+
 if __name__ == '__main__':
     print("\n🎯 YOLO API 使用示例")
     print("=" * 60)
@@ -226,6 +307,7 @@ if __name__ == '__main__':
         # example_4_confidence_threshold()
         # example_5_filter_by_class()
         # example_6_error_handling()
+        # example_7_compact_formats()
 
     except Exception as e:
         print(f"\n❌ 示例运行失败: {e}")
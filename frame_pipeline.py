@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+帧流水线
+接收、处理（解码 + 推理 + 序列化）、发送三段并行，结果按帧顺序输出，
+处理跟不上输入时按丢帧策略丢弃待处理的帧
+"""
+import asyncio
+import os
+from collections import deque
+
+# 默认配置（可通过环境变量覆盖）
+STREAM_MAX_INFLIGHT = int(os.environ.get('YOLO_STREAM_INFLIGHT', 2))
+STREAM_BUFFER_SIZE = int(os.environ.get('YOLO_STREAM_BUFFER', 2))
+
+# oldest: 缓冲区满时丢弃最旧的待处理帧（实时流，保证低延迟）
+# newest: 缓冲区满时丢弃新到的帧
+# none:   不丢帧，接收端等待（离线视频）
+DROP_POLICIES = ('oldest', 'newest', 'none')
+
+
+class FramePipeline:
+    """
+    帧流水线
+
+    - process_fn: async 函数，处理单帧并返回结果
+    - max_inflight: 同时处理中的帧数（多帧在推理调度器中可合并为一个批次）
+    - buffer_size: 已接收但尚未开始处理的帧数上限
+    - drop_policy: 见 DROP_POLICIES
+    """
+
+    def __init__(self, process_fn, max_inflight=STREAM_MAX_INFLIGHT,
+                 buffer_size=STREAM_BUFFER_SIZE, drop_policy='oldest'):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"不支持的丢帧策略: {drop_policy}（可选 {' / '.join(DROP_POLICIES)}）")
+        self.process_fn = process_fn
+        self.max_inflight = max(1, int(max_inflight))
+        self.buffer_size = max(1, int(buffer_size))
+        self.drop_policy = drop_policy
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+
+    def drop(self):
+        """记录一次丢帧（供 process_fn 在服务繁忙时调用）"""
+        self.dropped += 1
+
+    async def run(self, source, sink):
+        """
+        运行流水线
+
+        - source: 异步可迭代对象，逐个产生帧
+        - sink: async 回调 sink(index, result)，index 为帧的接收序号
+        """
+        buffer = deque()
+        cond = asyncio.Condition()
+        tasks = asyncio.Queue()
+        slots = asyncio.Semaphore(self.max_inflight)
+        source_done = False
+
+        async def receive():
+            nonlocal source_done
+            try:
+                async for frame in source:
+                    async with cond:
+                        index = self.received
+                        self.received += 1
+                        if self.drop_policy == 'none':
+                            await cond.wait_for(lambda: len(buffer) < self.buffer_size)
+                        elif len(buffer) >= self.buffer_size:
+                            self.dropped += 1
+                            if self.drop_policy == 'newest':
+                                continue
+                            buffer.popleft()
+                        buffer.append((index, frame))
+                        cond.notify_all()
+            finally:
+                async with cond:
+                    source_done = True
+                    cond.notify_all()
+
+        async def dispatch():
+            while True:
+                await slots.acquire()
+                async with cond:
+                    await cond.wait_for(lambda: buffer or source_done)
+                    if not buffer:
+                        slots.release()
+                        await tasks.put(None)
+                        return
+                    index, frame = buffer.popleft()
+                    cond.notify_all()
+                await tasks.put((index, asyncio.ensure_future(self.process_fn(frame))))
+
+        receiver = asyncio.ensure_future(receive())
+        dispatcher = asyncio.ensure_future(dispatch())
+        try:
+            while True:
+                item = await tasks.get()
+                if item is None:
+                    break
+                index, task = item
+                try:
+                    result = await task
+                except Exception as e:
+                    result = {'error': str(e)}
+                finally:
+                    slots.release()
+                self.processed += 1
+                await sink(index, result)
+
+            # 帧源本身出错时向调用方抛出
+            if receiver.done() and not receiver.cancelled() and receiver.exception():
+                raise receiver.exception()
+        finally:
+            receiver.cancel()
+            dispatcher.cancel()
+            while not tasks.empty():
+                item = tasks.get_nowait()
+                if item is not None:
+                    item[1].cancel()
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+超参数搜索
+在训练任务之上按网格 / 随机 / ASHA（异步逐次减半）生成并调度试验，按逐轮指标提前终止
+表现差的试验，汇总排行榜。同时运行的试验数和每个试验的 torch 线程数按 CPU 核数分配
+"""
+import itertools
+import math
+import os
+import random
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+from runtime_config import available_cpus, threads_per_worker
+from training_jobs import TrainingJobManager, FINISHED_STATES, stream_events
+
+# 同时运行的试验数（默认每个试验约 4 个核），每个试验的 torch 线程数为可用核数 / 并发数
+SWEEP_CONCURRENCY = int(os.environ.get('YOLO_SWEEP_CONCURRENCY', max(1, len(available_cpus()) // 4)))
+
+STRATEGIES = ('grid', 'random', 'asha')
+
+# 可搜索的参数（与训练页面的参数同名）
+SEARCHABLE = {
+    'lr': 'lr0', 'momentum': 'momentum', 'weight_decay': 'weight_decay', 'warmup_epochs': 'warmup_epochs',
+    'hsv_h': 'hsv_h', 'hsv_s': 'hsv_s', 'hsv_v': 'hsv_v', 'degrees': 'degrees', 'fliplr': 'fliplr',
+    'mosaic': 'mosaic', 'batch': 'batch', 'imgsz': 'imgsz'
+}
+
+# 排序指标
+METRICS = ('mAP50_95', 'mAP50')
+
+# 中位数停止规则：至少有这么多其他试验到达同一轮时才比较
+MEDIAN_MIN_TRIALS = 3
+
+
+def grid_points(space):
+    """网格搜索：每个参数须给出 values 列表"""
+    names = sorted(space)
+    for name in names:
+        if 'values' not in space[name]:
+            raise ValueError(f'网格搜索的参数 {name} 需要指定 values 列表')
+    for combo in itertools.product(*(space[name]['values'] for name in names)):
+        yield dict(zip(names, combo))
+
+
+def sample_point(space, rng):
+    """随机采样一组参数：values 中随机选取，或在 [min, max] 内均匀 / 对数均匀采样"""
+    point = {}
+    for name in sorted(space):
+        spec = space[name]
+        if 'values' in spec:
+            point[name] = rng.choice(spec['values'])
+            continue
+        low, high = float(spec['min']), float(spec['max'])
+        if spec.get('log'):
+            value = math.exp(rng.uniform(math.log(low), math.log(high)))
+        else:
+            value = rng.uniform(low, high)
+        point[name] = int(round(value)) if spec.get('type') == 'int' else round(value, 6)
+    return point
+
+
+def asha_rungs(min_epochs, max_epochs, eta):
+    """ASHA 的检查点（轮数）：min_epochs * eta^k，小于总轮数"""
+    rungs, epoch = [], max(1, int(min_epochs))
+    while epoch < max_epochs:
+        rungs.append(epoch)
+        epoch *= eta
+    return rungs
+
+
+class Trial:
+    """一次试验：一组参数对应一个训练任务"""
+
+    def __init__(self, index, params, job):
+        self.index = index
+        self.params = params
+        self.job = job
+        self.history = {}
+        self.best = None
+        self.pruned_at = None
+
+    def to_dict(self):
+        job = self.job
+        model_path = job.result.get('model_path')
+        if not model_path and job.result.get('save_dir'):
+            # 提前终止的试验也保留了截至当时的最佳权重
+            best = Path(job.result['save_dir']) / 'weights' / 'best.pt'
+            model_path = str(best) if best.exists() else None
+        return {
+            'trial': self.index,
+            'job_id': job.id,
+            'name': job.name,
+            'params': self.params,
+            'status': 'pruned' if self.pruned_at else job.status,
+            'pruned_at': self.pruned_at,
+            'epochs': max(self.history) if self.history else 0,
+            'best': self.best,
+            'model_path': model_path
+        }
+
+
+class Sweep:
+    """一次超参数搜索"""
+
+    def __init__(self, name, strategy, metric, max_epochs, min_epochs, eta, early_stopping):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.strategy = strategy
+        self.metric = metric
+        self.max_epochs = max_epochs
+        self.min_epochs = min_epochs
+        self.eta = eta
+        self.early_stopping = early_stopping
+        self.rungs = asha_rungs(min_epochs, max_epochs, eta) if strategy == 'asha' else []
+        self.status = 'running'
+        self.created_at = datetime.now().isoformat(timespec='seconds')
+        self.finished_at = None
+        self.trials = []
+        self.events = []
+
+    def leaderboard(self):
+        """按最佳指标从高到低排列的试验"""
+        return sorted((t.to_dict() for t in self.trials),
+                      key=lambda t: (t['best'] is not None, t['best'] or 0), reverse=True)
+
+    def to_dict(self, with_trials=True):
+        data = {
+            'id': self.id,
+            'name': self.name,
+            'strategy': self.strategy,
+            'metric': self.metric,
+            'max_epochs': self.max_epochs,
+            'rungs': self.rungs,
+            'status': self.status,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'trials': len(self.trials),
+            'finished': sum(1 for t in self.trials if t.job.status in FINISHED_STATES),
+            'pruned': sum(1 for t in self.trials if t.pruned_at)
+        }
+        if with_trials:
+            data['leaderboard'] = self.leaderboard()
+        return data
+
+
+class SweepManager:
+    """
+    超参数搜索管理器
+
+    所有搜索的试验共用一个训练任务队列（最多同时运行 concurrency 个），
+    每个试验的 torch 线程数为 CPU 核数 / concurrency，数据加载线程数也不超过该值。
+    试验的逐轮指标通过训练任务的事件回调进入 _on_trial_event()，在那里做提前终止判断
+    """
+
+    def __init__(self, concurrency=SWEEP_CONCURRENCY):
+        self.concurrency = max(1, int(concurrency))
+        self.threads_per_trial = threads_per_worker(self.concurrency)
+        self._cond = threading.Condition()
+        self._sweeps = OrderedDict()
+        self._trial_of = {}
+        self.trials = TrainingJobManager(self.concurrency, listener=self._on_trial_event, cond=self._cond)
+
+    def submit(self, name, model_path, base_args, space, strategy='random', max_trials=8,
+               metric='mAP50_95', min_epochs=1, eta=3, early_stopping=True, seed=0):
+        """
+        提交搜索
+
+        base_args: model.train 的基础参数（与单次训练相同）
+        space: {参数名: {'values': [...]} 或 {'min', 'max', 'log', 'type'}}，参数名同训练页面
+        strategy: grid（全部组合，最多 max_trials 个）/ random / asha（随机采样 + 逐次减半提前终止）
+        early_stopping: grid / random 时按中位数规则提前终止
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"不支持的搜索策略: {strategy}（可选 {' / '.join(STRATEGIES)}）")
+        if metric not in METRICS:
+            raise ValueError(f"不支持的指标: {metric}（可选 {' / '.join(METRICS)}）")
+        unknown = set(space) - set(SEARCHABLE)
+        if unknown:
+            raise ValueError(f"不支持搜索的参数: {', '.join(sorted(unknown))}")
+        if not space:
+            raise ValueError('搜索空间为空')
+
+        max_trials = max(1, int(max_trials))
+        if strategy == 'grid':
+            points = list(itertools.islice(grid_points(space), max_trials))
+        else:
+            rng = random.Random(seed)
+            points = [sample_point(space, rng) for _ in range(max_trials)]
+
+        sweep = Sweep(name, strategy, metric, int(base_args['epochs']), int(min_epochs), max(2, int(eta)),
+                      bool(early_stopping))
+        with self._cond:
+            self._sweeps[sweep.id] = sweep
+            self._emit(sweep, 'queued', {'trials': len(points)},
+                       message=f'超参数搜索已提交: {len(points)} 个试验，同时运行 {self.concurrency} 个')
+            for index, point in enumerate(points):
+                train_args = dict(base_args)
+                train_args.update({SEARCHABLE[k]: v for k, v in point.items()})
+                train_args['name'] = f'{name}_t{index:03d}'
+                train_args['workers'] = min(int(train_args.get('workers', 0)), self.threads_per_trial)
+                job = self.trials.submit(train_args['name'], model_path, train_args, threads=self.threads_per_trial)
+                trial = Trial(index, point, job)
+                sweep.trials.append(trial)
+                self._trial_of[job.id] = (sweep, trial)
+        return sweep
+
+    def get(self, sweep_id):
+        return self._sweeps.get(sweep_id)
+
+    def list(self):
+        with self._cond:
+            return [sweep.to_dict(with_trials=False) for sweep in reversed(self._sweeps.values())]
+
+    def cancel(self, sweep_id):
+        """取消搜索：排队和运行中的试验全部取消，已完成的保留"""
+        with self._cond:
+            sweep = self._sweeps.get(sweep_id)
+            if sweep is None or sweep.status in FINISHED_STATES:
+                return False
+            sweep.status = 'cancelling'
+            jobs = [t.job.id for t in sweep.trials if t.job.status not in FINISHED_STATES]
+            for job_id in jobs:
+                self.trials.cancel(job_id)
+            self._check_finished(sweep)
+        return True
+
+    def stream(self, sweep_id, heartbeat=15):
+        """以 Server-Sent Events 格式输出搜索进度"""
+        return stream_events(self._cond, self._sweeps[sweep_id], heartbeat)
+
+    # ---------- 提前终止 ----------
+
+    def _on_trial_event(self, job, event, data):
+        """训练任务事件回调（持有锁）"""
+        entry = self._trial_of.get(job.id)
+        if entry is None:
+            return
+        sweep, trial = entry
+        if event == 'running' and data.get('save_dir'):
+            job.result['save_dir'] = data['save_dir']
+        elif event == 'epoch':
+            value = data.get(sweep.metric)
+            if value is None:
+                return
+            epoch = data['epoch']
+            trial.history[epoch] = value
+            trial.best = value if trial.best is None else max(trial.best, value)
+            self._emit(sweep, 'trial_epoch', {'trial': trial.index, 'epoch': epoch, sweep.metric: value})
+            if job.status not in FINISHED_STATES and job.status != 'cancelling' and self._should_stop(sweep, trial, epoch):
+                trial.pruned_at = epoch
+                self._emit(sweep, 'pruned', {'trial': trial.index, 'epoch': epoch, 'best': trial.best},
+                           message=f'试验 {trial.index} 在第 {epoch} 轮提前终止（{sweep.metric}={trial.best}）')
+                self.trials.cancel(job.id)
+        elif event in FINISHED_STATES:
+            self._emit(sweep, 'trial_finished', trial.to_dict())
+            self._check_finished(sweep)
+
+    def _should_stop(self, sweep, trial, epoch):
+        if sweep.strategy == 'asha':
+            if epoch not in sweep.rungs:
+                return False
+            # 到达同一检查点的试验中，只有前 1/eta 继续训练
+            values = sorted((t.best for t in sweep.trials if epoch in t.history), reverse=True)
+            keep = max(1, len(values) // sweep.eta)
+            return trial.best < values[keep - 1]
+        if not sweep.early_stopping or epoch < sweep.min_epochs:
+            return False
+        # 中位数停止规则：最佳指标低于其他试验同一轮指标的中位数
+        others = sorted(t.history[epoch] for t in sweep.trials if t is not trial and epoch in t.history)
+        if len(others) < MEDIAN_MIN_TRIALS:
+            return False
+        mid = len(others) // 2
+        median = others[mid] if len(others) % 2 else (others[mid - 1] + others[mid]) / 2
+        return trial.best < median
+
+    def _check_finished(self, sweep):
+        """所有试验结束后结束搜索（调用方需持有锁）"""
+        if sweep.status in FINISHED_STATES or any(t.job.status not in FINISHED_STATES for t in sweep.trials):
+            return
+        sweep.status = 'cancelled' if sweep.status == 'cancelling' else 'completed'
+        sweep.finished_at = datetime.now().isoformat(timespec='seconds')
+        best = sweep.leaderboard()[0] if sweep.trials else None
+        self._emit(sweep, sweep.status, {'best': best},
+                   message=f"超参数搜索结束，最佳试验: {best['name']}（{sweep.metric}={best['best']}）" if best else None)
+
+    def _emit(self, sweep, event, data=None, message=None):
+        """记录事件并唤醒订阅者（调用方需持有锁）"""
+        sweep.events.append({
+            'seq': len(sweep.events),
+            'event': event,
+            'status': sweep.status,
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'message': message,
+            'data': data or {}
+        })
+        self._cond.notify_all()
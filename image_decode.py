@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+上传图片解码
+直接用 OpenCV 解码为 BGR 数组（ultralytics 对数组输入按 BGR 处理），不经过 PIL 中间图像；
+JPEG 原图比模型输入大很多时按 1/2、1/4、1/8 做 DCT 缩小解码（IMREAD_REDUCED_*），
+推理后再把检测框换算回原图坐标（标注图片由 image_render 按解码分辨率绘制）。1200 万像素的相机照片缩小解码的像素只有原来的 1/16，
+解码耗时和内存都大幅下降，而 letterbox 本来就会缩到 640
+"""
+import io
+import os
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# 是否启用缩小解码（可通过环境变量关闭，关闭后按原尺寸解码）
+FAST_DECODE = os.environ.get('YOLO_FAST_DECODE', '1') != '0'
+
+# 模型输入尺寸：缩小后的长边不小于该值
+DECODE_IMGSZ = int(os.environ.get('YOLO_DECODE_IMGSZ', 640))
+
+# 缩小倍数 → OpenCV 读取标志；忽略 EXIF 方向，与 PIL 解码的坐标保持一致
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8 | cv2.IMREAD_IGNORE_ORIENTATION),
+    (4, cv2.IMREAD_REDUCED_COLOR_4 | cv2.IMREAD_IGNORE_ORIENTATION),
+    (2, cv2.IMREAD_REDUCED_COLOR_2 | cv2.IMREAD_IGNORE_ORIENTATION),
+)
+_FULL_FLAG = cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION
+
+
+class DecodedImage:
+    """解码后的图片：BGR 数组（可能是缩小的）+ 原图宽高"""
+
+    __slots__ = ('array', 'width', 'height')
+
+    def __init__(self, array, width, height):
+        self.array = array
+        self.width = width
+        self.height = height
+
+    @property
+    def reduced(self):
+        return self.array.shape[:2] != (self.height, self.width)
+
+
+def reduction(width, height, imgsz=DECODE_IMGSZ):
+    """缩小倍数：保证缩小后的长边仍不小于 imgsz，放不下时为 1"""
+    for factor, flag in _REDUCED_FLAGS:
+        if max(width, height) // factor >= imgsz:
+            return factor, flag
+    return 1, _FULL_FLAG
+
+
+def _decode_pil(contents):
+    """OpenCV 不支持的格式（例如 GIF）退回 PIL"""
+    rgb = np.asarray(Image.open(io.BytesIO(contents)).convert('RGB'))
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+
+
+def decode_image(contents, imgsz=DECODE_IMGSZ, fast=FAST_DECODE):
+    """
+    解码图片字节为 DecodedImage
+
+    JPEG 先只读文件头取得原图尺寸，足够大时按缩小倍数解码；其他格式按原尺寸解码
+    """
+    buffer = np.frombuffer(contents, dtype=np.uint8)
+    flag = _FULL_FLAG
+    size = None
+    if fast and contents[:2] == b'\xff\xd8':
+        size = Image.open(io.BytesIO(contents)).size
+        _, flag = reduction(*size, imgsz=imgsz)
+
+    array = cv2.imdecode(buffer, flag)
+    if array is None:
+        array = _decode_pil(contents)
+        size = None
+    if size is None:
+        size = (array.shape[1], array.shape[0])
+    return DecodedImage(array, *size)
+
+
+def _scaled(data, sx, sy):
+    """检测框坐标按比例缩放后的副本（张量或数组）"""
+    data = data.clone() if hasattr(data, 'clone') else np.array(data, copy=True)
+    data[:, [0, 2]] *= sx
+    data[:, [1, 3]] *= sy
+    return data
+
+
+def restore_results(results, image):
+    """把缩小图上的检测结果换算回原图坐标（就地修改，orig_shape 改为原图尺寸）"""
+    h, w = results.orig_shape
+    if (w, h) == (image.width, image.height) or results.boxes is None:
+        return results
+    data = _scaled(results.boxes.data, image.width / w, image.height / h)
+    results.orig_shape = (image.height, image.width)
+    results.boxes = type(results.boxes)(data, results.orig_shape)
+    return results
+
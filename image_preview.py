@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+图片预览服务
+按指定最大尺寸生成缩小的 JPEG 预览，按 (路径, 修改时间, 文件大小, 尺寸) 缓存到磁盘，
+超过容量上限时按最近使用时间淘汰
+"""
+import hashlib
+import mimetypes
+import os
+import threading
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+from dataset_files import temp_path
+
+# 默认配置（可通过环境变量覆盖）
+PREVIEW_CACHE_DIR = os.environ.get('YOLO_PREVIEW_CACHE_DIR', str(Path('yolo_workspace') / 'previews'))
+PREVIEW_CACHE_MB = float(os.environ.get('YOLO_PREVIEW_CACHE_MB', 512))
+PREVIEW_MAX_SIZE = int(os.environ.get('YOLO_PREVIEW_MAX_SIZE', 1280))
+PREVIEW_QUALITY = int(os.environ.get('YOLO_PREVIEW_QUALITY', 85))
+
+# 预览允许的最大边长范围
+MIN_PREVIEW_SIZE = 32
+MAX_PREVIEW_SIZE = 4096
+
+
+def guess_mimetype(path):
+    """按扩展名判断图片的 Content-Type"""
+    return mimetypes.guess_type(str(path))[0] or 'application/octet-stream'
+
+
+def clamp_size(max_size):
+    return min(MAX_PREVIEW_SIZE, max(MIN_PREVIEW_SIZE, int(max_size)))
+
+
+def render_preview(src, dst, max_size, quality=PREVIEW_QUALITY):
+    """生成预览图（不放大），写入 dst"""
+    with Image.open(src) as img:
+        # JPEG 可在解码时直接按 1/2、1/4、1/8 缩小，大图解码快得多
+        img.draft('RGB', (max_size, max_size))
+        img = ImageOps.exif_transpose(img)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img.thumbnail((max_size, max_size), Image.LANCZOS, reducing_gap=3.0)
+        tmp = temp_path(dst)
+        try:
+            img.save(tmp, 'JPEG', quality=quality, optimize=False)
+            os.replace(tmp, dst)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+
+class PreviewCache:
+    """
+    预览图磁盘缓存
+
+    get(path, max_size) 返回 (预览文件路径, etag)，源文件修改后自动生成新的预览
+    """
+
+    def __init__(self, cache_dir=PREVIEW_CACHE_DIR, max_mb=PREVIEW_CACHE_MB):
+        self.cache_dir = Path(cache_dir).absolute()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(float(max_mb) * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._rendering = {}
+        self._total = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def etag(path, max_size):
+        """预览的 ETag：源文件路径、修改时间、大小和预览尺寸的哈希"""
+        stat = os.stat(path)
+        key = f'{Path(path).absolute()}:{stat.st_mtime_ns}:{stat.st_size}:{clamp_size(max_size)}:{PREVIEW_QUALITY}'
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _file(self, etag):
+        return self.cache_dir / etag[:2] / f'{etag}.jpg'
+
+    def get(self, path, max_size=PREVIEW_MAX_SIZE):
+        max_size = clamp_size(max_size)
+        etag = self.etag(path, max_size)
+        cached = self._file(etag)
+        try:
+            # 更新访问时间，用于 LRU 淘汰
+            os.utime(cached)
+            with self._lock:
+                self.hits += 1
+            return cached, etag
+        except FileNotFoundError:
+            pass
+
+        # 同一预览只生成一次，并发请求等待生成完成
+        with self._lock:
+            render_lock = self._rendering.setdefault(etag, threading.Lock())
+        with render_lock:
+            try:
+                if not cached.exists():
+                    cached.parent.mkdir(exist_ok=True)
+                    render_preview(path, cached, max_size)
+                    with self._lock:
+                        self.misses += 1
+                        self._add(cached)
+            finally:
+                with self._lock:
+                    self._rendering.pop(etag, None)
+        return cached, etag
+
+    def _scan(self):
+        return [(p, p.stat()) for p in self.cache_dir.glob('*/*.jpg')]
+
+    def _add(self, added):
+        """登记新生成的预览并在超出上限时淘汰，不淘汰刚生成的文件（调用方需持有锁）"""
+        if self._total is None:
+            self._total = sum(st.st_size for _, st in self._scan())
+        else:
+            self._total += added.stat().st_size
+        if self._total <= self.max_bytes:
+            return
+        # 按修改时间（命中时会更新）从旧到新删除，直到降到上限的 90%
+        for path, st in sorted(self._scan(), key=lambda item: item[1].st_mtime):
+            if self._total <= self.max_bytes * 0.9:
+                break
+            if path == added:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            self._total -= st.st_size
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'cache_dir': str(self.cache_dir),
+                'max_mb': round(self.max_bytes / 1024 / 1024, 2),
+                'size_mb': round(self._total / 1024 / 1024, 2) if self._total is not None else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
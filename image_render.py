@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+标注图片渲染
+代替 results.plot()：一次性取出检测框后用 OpenCV 直接画在已解码的数组上（不复制整张图），
+可限制输出尺寸（先缩小再画框，画的像素更少），JPEG 质量可配置，也可输出 WebP。
+缩小用的画布按线程复用，连续请求同样尺寸的图片时不再重新分配
+"""
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from detection_format import extract_boxes
+from stage_timing import stage
+
+# 默认配置（可通过环境变量覆盖）
+RENDER_FORMAT = os.environ.get('YOLO_RENDER_FORMAT', 'jpeg')  # jpeg | webp
+RENDER_QUALITY = int(os.environ.get('YOLO_RENDER_QUALITY', 85))  # 1-100
+RENDER_MAX_SIZE = int(os.environ.get('YOLO_RENDER_MAX_SIZE', 0))  # 标注图片的最大边长，0 表示不限制
+
+RENDER_FORMATS = {
+    'jpeg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY, 'image/jpeg'),
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY, 'image/webp'),
+}
+
+if RENDER_FORMAT not in RENDER_FORMATS:
+    raise ValueError(f"不支持的标注图片格式: {RENDER_FORMAT}（可选 {' / '.join(RENDER_FORMATS)}）")
+
+# 标注图片的媒体类型和文件扩展名
+RENDER_MEDIA_TYPE = RENDER_FORMATS[RENDER_FORMAT][2]
+RENDER_EXTENSION = RENDER_FORMATS[RENDER_FORMAT][0]
+
+_canvas = threading.local()
+_colors = None
+
+
+def _palette(cls):
+    """类别颜色（BGR），与 ultralytics 的配色一致"""
+    global _colors
+    if _colors is None:
+        from ultralytics.utils.plotting import colors as _colors
+    return _colors(int(cls), True)
+
+
+def _resized(image, max_size):
+    """缩小到最大边长 max_size，复用当前线程的画布；不需要缩小时原样返回"""
+    h, w = image.shape[:2]
+    if not max_size or max(h, w) <= max_size:
+        return image
+    ratio = max_size / max(h, w)
+    shape = (max(1, round(h * ratio)), max(1, round(w * ratio)), image.shape[2])
+    buffers = getattr(_canvas, 'buffers', None)
+    if buffers is None:
+        buffers = _canvas.buffers = {}
+    dst = buffers.get(shape)
+    if dst is None:
+        # 只保留最近一种尺寸，避免尺寸各异时画布不断累积
+        buffers.clear()
+        dst = buffers[shape] = np.empty(shape, dtype=np.uint8)
+    cv2.resize(image, (shape[1], shape[0]), dst=dst, interpolation=cv2.INTER_AREA)
+    return dst
+
+
+def draw_detections(image, xyxy, conf, cls, names):
+    """
+    在 BGR 数组上就地绘制检测框和标签（xyxy 为该图片坐标系下的坐标）
+
+    线宽和字号按图片尺寸取值，与 results.plot() 的默认外观一致
+    """
+    h, w = image.shape[:2]
+    lw = max(round((h + w) / 2 * 0.003), 2)
+    tf = max(lw - 1, 1)
+    sf = lw / 3
+    boxes = np.round(xyxy).astype(np.int32).tolist()
+    for (x1, y1, x2, y2), c, k in zip(boxes, conf.tolist(), cls.tolist()):
+        color = _palette(k)
+        # 水平 / 垂直的框线抗锯齿没有可见差别，只有文字使用 LINE_AA
+        cv2.rectangle(image, (x1, y1), (x2, y2), color, thickness=lw, lineType=cv2.LINE_8)
+        label = f'{names[k]} {c:.2f}'
+        tw, th = cv2.getTextSize(label, 0, fontScale=sf, thickness=tf)[0]
+        th += 3
+        x1 = min(x1, w - tw)
+        outside = y1 >= th
+        top = y1 - th if outside else y1
+        cv2.rectangle(image, (x1, top), (x1 + tw, top + th), color, -1, cv2.LINE_8)
+        cv2.putText(image, label, (x1, top + th - 2), 0, sf, (255, 255, 255), thickness=tf, lineType=cv2.LINE_AA)
+    return image
+
+
+def encode_image(image, fmt=RENDER_FORMAT, quality=RENDER_QUALITY):
+    """编码为 JPEG / WebP 字节"""
+    extension, flag, _ = RENDER_FORMATS[fmt]
+    ok, buffer = cv2.imencode(extension, image, [flag, int(quality)])
+    if not ok:
+        raise RuntimeError(f'图片编码失败 ({fmt})')
+    return buffer.tobytes()
+
+
+def render_results(results, max_size=RENDER_MAX_SIZE, fmt=RENDER_FORMAT, quality=RENDER_QUALITY):
+    """
+    绘制检测结果并编码，返回图片字节（媒体类型见 RENDER_MEDIA_TYPE）
+
+    直接在 results.orig_img 上绘制（会修改该数组）；检测框为原图坐标，
+    原图按缩小尺寸解码或输出需要缩小时按比例换算
+    """
+    with stage('plot'):
+        image = results.orig_img
+        if not (image.flags.writeable and image.flags.c_contiguous):
+            image = np.array(image)
+        image = _resized(image, max_size)
+        xyxy, conf, cls = extract_boxes(results)
+        h, w = results.orig_shape
+        ih, iw = image.shape[:2]
+        if (ih, iw) != (h, w):
+            xyxy = xyxy * np.array([iw / w, ih / h, iw / w, ih / h], dtype=np.float32)
+        draw_detections(image, xyxy, conf, cls, results.names)
+    with stage('encode'):
+        return encode_image(image, fmt, quality)
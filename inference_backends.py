@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+"""
+推理后端
+除 ultralytics 的 PyTorch 模型外，支持导出为 ONNX / OpenVINO 后用 ONNX Runtime / OpenVINO 推理。
+导出只做一次，产物放在权重文件旁边，按 (权重哈希, 输入尺寸, opset) 命名；
+letterbox 预处理和 NMS 后处理用 NumPy 实现，推理过程不调用 torch。
+返回的结果仍是 ultralytics Results，序列化、绘制、缓存等下游代码无需区分后端
+"""
+import ast
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from dataset_files import materialize_file
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+try:
+    import openvino
+except ImportError:
+    openvino = None
+
+# 默认配置（可通过环境变量覆盖）
+# 推理后端: torch（ultralytics 原生）/ onnx（ONNX Runtime）/ openvino
+INFER_BACKEND = os.environ.get('YOLO_INFER_BACKEND', 'torch')
+# 导出的输入尺寸和 ONNX opset
+EXPORT_IMGSZ = int(os.environ.get('YOLO_EXPORT_IMGSZ', 640))
+EXPORT_OPSET = int(os.environ.get('YOLO_EXPORT_OPSET', 17))
+# OpenVINO 推理设备
+OPENVINO_DEVICE = os.environ.get('YOLO_OPENVINO_DEVICE', 'CPU')
+
+BACKENDS = ('torch', 'onnx', 'openvino')
+
+# NMS 参数（与 ultralytics 默认值一致）
+MAX_DET = 300
+MAX_NMS = 30000
+MAX_WH = 7680
+
+_hash_cache = {}
+_export_locks = {}
+_export_locks_lock = threading.Lock()
+
+
+def backend_available(backend):
+    """后端依赖是否已安装"""
+    if backend == 'onnx':
+        return onnxruntime is not None
+    if backend == 'openvino':
+        return openvino is not None
+    return backend == 'torch'
+
+
+def weights_hash(path):
+    """权重文件内容的 SHA-256 前 16 位（按路径 + mtime + 大小缓存）"""
+    stat = os.stat(path)
+    key = (str(Path(path).resolve()), stat.st_mtime_ns, stat.st_size)
+    digest = _hash_cache.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        digest = _hash_cache[key] = h.hexdigest()[:16]
+    return digest
+
+
+def artifact_path(weights, backend, imgsz=EXPORT_IMGSZ, opset=EXPORT_OPSET, precision='fp32'):
+    """
+    导出产物的路径: best.<哈希>.<尺寸>.op<opset>.onnx 或 best.<哈希>.<尺寸>.op<opset>_openvino_model/，
+    量化版本在 opset 后加精度，例如 best.<哈希>.640.op17.int8.onnx
+    """
+    weights = Path(weights)
+    stem = f'{weights.stem}.{weights_hash(weights)}.{int(imgsz)}.op{int(opset)}'
+    if precision != 'fp32':
+        stem += f'.{precision}'
+    if backend == 'onnx':
+        return weights.with_name(stem + '.onnx')
+    return weights.with_name(stem + '_openvino_model')
+
+
+def is_exported(path):
+    """路径是否为导出的模型（ONNX 文件或 OpenVINO 目录）"""
+    path = str(path).rstrip('/\\')
+    return path.endswith(('.onnx', '_openvino_model', '.xml'))
+
+
+def _export_lock(weights):
+    with _export_locks_lock:
+        return _export_locks.setdefault(str(Path(weights).resolve()), threading.Lock())
+
+
+def ensure_exported(weights, backend, imgsz=EXPORT_IMGSZ, opset=EXPORT_OPSET, precision='fp32', **export_args):
+    """
+    返回导出产物的路径，不存在时先导出
+
+    同一进程内同一权重同时只导出一次；ultralytics 导出到权重旁的固定文件名（best.onnx / best_openvino_model），
+    所以先把权重链接到本次调用独有的临时目录再导出，完成后原子改名为带哈希的名字，
+    同时导出的其他进程（推理工作进程、检测 API 与训练系统）不会覆盖或读到写了一半的文件。
+    precision 只影响产物命名，对应的导出参数（half / int8 / data）由 export_args 给出
+    """
+    if backend not in ('onnx', 'openvino'):
+        raise ValueError(f"不支持导出的后端: {backend}（可选 onnx / openvino）")
+    with _export_lock(weights):
+        if not Path(weights).exists():
+            # 预训练模型先由 ultralytics 下载
+            from ultralytics import YOLO
+            YOLO(str(weights))
+        target = artifact_path(weights, backend, imgsz, opset, precision)
+        if target.exists():
+            return target
+
+        from ultralytics import YOLO
+        print(f"导出 {backend} 模型: {weights} (imgsz={imgsz}, opset={opset}, precision={precision}) ...")
+        work_dir = Path(tempfile.mkdtemp(prefix='.export-', dir=target.parent))
+        try:
+            source = work_dir / Path(weights).name
+            materialize_file(weights, source)
+            exported = Path(YOLO(str(source)).export(
+                format=backend, imgsz=int(imgsz), opset=int(opset), dynamic=True, verbose=False, **export_args
+            ))
+            try:
+                os.replace(exported, target)
+            except OSError:
+                # 其他进程已经导出完成（OpenVINO 的目标是非空目录，不能覆盖）
+                if not target.exists():
+                    raise
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        print(f"✓ 导出完成: {target}")
+        return target
+
+
+def resolve_model(path, backend=None, imgsz=EXPORT_IMGSZ, opset=EXPORT_OPSET):
+    """
+    按后端返回实际加载的模型路径
+
+    torch 后端或已是导出模型时原样返回；.pt 权重在 onnx / openvino 后端下返回（必要时导出的）产物路径
+    """
+    backend = backend or INFER_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"不支持的推理后端: {backend}（可选 {' / '.join(BACKENDS)}）")
+    if backend == 'torch' or is_exported(path):
+        return str(path)
+    if not backend_available(backend):
+        raise RuntimeError(f"推理后端 {backend} 的依赖未安装（pip install {'onnxruntime' if backend == 'onnx' else 'openvino'}）")
+    return str(ensure_exported(path, backend, imgsz, opset))
+
+
+def load_backend(path):
+    """按模型路径加载: .onnx → ONNX Runtime，*_openvino_model → OpenVINO，其他 → ultralytics YOLO"""
+    path = str(path).rstrip('/\\')
+    if path.endswith('.onnx'):
+        return OnnxModel(path)
+    if path.endswith(('_openvino_model', '.xml')):
+        return OpenVinoModel(path)
+    from ultralytics import YOLO
+    return YOLO(path)
+
+
+def backend_of(path):
+    """模型路径对应的后端名"""
+    path = str(path).rstrip('/\\')
+    if path.endswith('.onnx'):
+        return 'onnx'
+    if path.endswith(('_openvino_model', '.xml')):
+        return 'openvino'
+    return 'torch'
+
+
+# ---------- NumPy 预处理 / 后处理 ----------
+
+def letterbox(image, size, color=114):
+    """
+    等比缩放并居中填充到 size=(h, w)
+
+    返回 (填充后的图片, 缩放比例, (左填充, 上填充))
+    """
+    h, w = image.shape[:2]
+    gain = min(size[0] / h, size[1] / w)
+    new_w, new_h = int(round(w * gain)), int(round(h * gain))
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    dw, dh = (size[1] - new_w) / 2, (size[0] - new_h) / 2
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(color, color, color))
+    return image, gain, (left, top)
+
+
+def to_blob(images):
+    """BGR uint8 图片列表 → NCHW float32 RGB [0, 1]"""
+    batch = np.stack(images)[..., ::-1].transpose(0, 3, 1, 2)
+    return np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+
+
+def nms(boxes, scores, iou_threshold):
+    """贪心 NMS，boxes 为 xyxy，返回保留的下标（按分数从高到低）"""
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1).clip(0) * (y2 - y1).clip(0)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = (np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest])).clip(0)
+        h = (np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest])).clip(0)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-7)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def postprocess(output, conf, iou, max_det=MAX_DET, classes=None, agnostic=False):
+    """
+    单张图片的模型输出 → (n, 6) 的 [x1, y1, x2, y2, conf, cls]（letterbox 坐标）
+
+    output: (4 + 类别数, 锚点数) 的 xywh + 各类别分数；
+    端到端模型（无需 NMS）输出 (max_det, 6) 的 xyxy + conf + cls
+    """
+    if output.shape[-1] == 6:
+        det = output[output[:, 4] > conf]
+        if classes is not None:
+            det = det[np.isin(det[:, 5], classes)]
+        return det[:max_det].astype(np.float32)
+
+    pred = output.T
+    scores = pred[:, 4:]
+    cls = scores.argmax(1)
+    best = scores[np.arange(len(cls)), cls]
+    mask = best > conf
+    if classes is not None:
+        mask &= np.isin(cls, classes)
+    xywh, best, cls = pred[mask, :4], best[mask], cls[mask]
+    if len(best) > MAX_NMS:
+        top = best.argsort()[::-1][:MAX_NMS]
+        xywh, best, cls = xywh[top], best[top], cls[top]
+
+    boxes = np.empty_like(xywh)
+    boxes[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+    boxes[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+    # 不同类别的框错开，一次 NMS 完成按类别抑制
+    offsets = 0 if agnostic else cls[:, None] * MAX_WH
+    keep = nms(boxes + offsets, best, iou)[:max_det]
+    return np.concatenate([boxes[keep], best[keep, None], cls[keep, None]], axis=1).astype(np.float32)
+
+
+def scale_boxes(det, gain, pad, shape):
+    """letterbox 坐标 → 原图坐标，并裁剪到图片范围内"""
+    det[:, [0, 2]] = ((det[:, [0, 2]] - pad[0]) / gain).clip(0, shape[1])
+    det[:, [1, 3]] = ((det[:, [1, 3]] - pad[1]) / gain).clip(0, shape[0])
+    return det
+
+
+def load_source(source):
+    """与 ultralytics 相同的输入约定：PIL 图片为 RGB，数组为 BGR，字符串 / Path 为文件路径"""
+    if isinstance(source, np.ndarray):
+        return source, ''
+    if isinstance(source, (str, Path)):
+        image = cv2.imread(str(source))
+        if image is None:
+            raise ValueError(f'无法读取图片: {source}')
+        return image, str(source)
+    return np.ascontiguousarray(np.asarray(source.convert('RGB'))[:, :, ::-1]), getattr(source, 'filename', '') or ''
+
+
+def parse_names(names):
+    """导出元数据中的类别名（字符串形式的 dict 或 dict）"""
+    if isinstance(names, str):
+        names = ast.literal_eval(names)
+    return {int(k): v for k, v in names.items()}
+
+
+def parse_imgsz(imgsz):
+    if isinstance(imgsz, str):
+        imgsz = ast.literal_eval(imgsz)
+    if isinstance(imgsz, int):
+        return imgsz, imgsz
+    return int(imgsz[0]), int(imgsz[-1])
+
+
+class ExportedModel:
+    """
+    导出模型的公共部分：predict() 的输入输出与 ultralytics YOLO.predict 一致
+
+    子类提供 names、imgsz、batch（固定的批大小，动态时为 None）和 _forward(blob)
+    """
+
+    names = {}
+    imgsz = (EXPORT_IMGSZ, EXPORT_IMGSZ)
+    batch = None
+    file_bytes = 0
+
+    def __init__(self):
+        # 与 YOLO 对象一致，注册表会写入 device
+        self.overrides = {}
+
+    def _forward(self, blob):
+        raise NotImplementedError
+
+    def predict(self, source, conf=0.25, iou=0.7, max_det=MAX_DET, classes=None, agnostic_nms=False, **kwargs):
+        """检测一张或多张图片，返回 Results 列表（verbose 等其他参数忽略）"""
+        from ultralytics.engine.results import Results
+
+        sources = source if isinstance(source, (list, tuple)) else [source]
+        images, paths = zip(*(load_source(s) for s in sources)) if sources else ((), ())
+        boxed = [letterbox(image, self.imgsz) for image in images]
+
+        step = self.batch or len(boxed) or 1
+        outputs = []
+        for start in range(0, len(boxed), step):
+            chunk = [b[0] for b in boxed[start:start + step]]
+            outputs.extend(self._forward(to_blob(chunk))[:len(chunk)])
+
+        results = []
+        for image, path, (_, gain, pad), output in zip(images, paths, boxed, outputs):
+            det = postprocess(output, conf, iou, max_det, classes, agnostic_nms)
+            det = scale_boxes(det, gain, pad, image.shape[:2])
+            results.append(Results(image, path=path, names=self.names, boxes=det))
+        return results
+
+    __call__ = predict
+
+
+class OnnxModel(ExportedModel):
+    """ONNX Runtime 推理"""
+
+    def __init__(self, path):
+        super().__init__()
+        if onnxruntime is None:
+            raise RuntimeError('未安装 onnxruntime（pip install onnxruntime）')
+        from runtime_config import effective_threads, resolve_device
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = effective_threads()
+        options.inter_op_num_threads = 1
+        providers = ['CPUExecutionProvider']
+        if resolve_device() not in ('cpu', 'mps') and 'CUDAExecutionProvider' in onnxruntime.get_available_providers():
+            providers.insert(0, 'CUDAExecutionProvider')
+        self.session = onnxruntime.InferenceSession(str(path), options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+
+        meta = self.session.get_modelmeta().custom_metadata_map
+        self.names = parse_names(meta['names']) if 'names' in meta else {}
+        shape = self.session.get_inputs()[0].shape
+        if isinstance(shape[2], int) and isinstance(shape[3], int):
+            self.imgsz = (shape[2], shape[3])
+        elif 'imgsz' in meta:
+            self.imgsz = parse_imgsz(meta['imgsz'])
+        self.batch = shape[0] if isinstance(shape[0], int) else None
+        self.file_bytes = os.path.getsize(path)
+
+    def _forward(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVinoModel(ExportedModel):
+    """OpenVINO 推理，path 为导出目录或其中的 .xml 文件"""
+
+    def __init__(self, path):
+        super().__init__()
+        if openvino is None:
+            raise RuntimeError('未安装 openvino（pip install openvino）')
+        import yaml
+        from runtime_config import effective_threads
+
+        path = Path(path)
+        xml = path if path.suffix == '.xml' else next(path.glob('*.xml'))
+        core = openvino.Core()
+        model = core.read_model(str(xml))
+        self.compiled = core.compile_model(model, OPENVINO_DEVICE, {
+            'INFERENCE_NUM_THREADS': effective_threads(),
+            'PERFORMANCE_HINT': 'LATENCY'
+        })
+
+        meta_file = xml.parent / 'metadata.yaml'
+        meta = {}
+        if meta_file.exists():
+            with open(meta_file, 'r', encoding='utf-8') as f:
+                meta = yaml.safe_load(f) or {}
+        self.names = parse_names(meta.get('names', {}))
+        shape = model.inputs[0].get_partial_shape()
+        if shape[2].is_static and shape[3].is_static:
+            self.imgsz = (shape[2].get_length(), shape[3].get_length())
+        elif 'imgsz' in meta:
+            self.imgsz = parse_imgsz(meta['imgsz'])
+        self.batch = shape[0].get_length() if shape[0].is_static else None
+        self.file_bytes = sum(f.stat().st_size for f in xml.parent.iterdir() if f.is_file())
+
+    def _forward(self, blob):
+        return self.compiled(blob)[self.compiled.output(0)]
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+推理执行器
+在独立的线程池或进程池中运行 predict，每个工作者持有自己的模型副本
+"""
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from model_registry import get_model
+from runtime_config import apply_runtime
+
+# 默认配置（可通过环境变量覆盖）
+INFER_MODE = os.environ.get('YOLO_INFER_MODE', 'thread')  # thread | process
+INFER_WORKERS = int(os.environ.get('YOLO_INFER_WORKERS', 1))
+
+
+def get_replica(model_path):
+    """从模型注册表获取当前工作线程专属的模型副本"""
+    return get_model(model_path, replica=threading.current_thread().name)
+
+
+def init_worker(slots, workers):
+    """进程模式工作者的初始化：取得序号并应用运行时配置（线程数、CPU 亲和性）"""
+    try:
+        index = slots.get_nowait()
+    except queue.Empty:
+        # 工作者异常退出后补充的新进程，序号已用完，不绑定核
+        index = None
+    apply_runtime(workers=workers, index=index)
+
+
+def predict_with_replica(images, model_path, conf, iou):
+    """使用当前工作者的模型副本对一批图片执行 predict"""
+    model = get_replica(model_path)
+    return model.predict(images, conf=conf, iou=iou, verbose=False)
+
+
+class InferenceExecutor:
+    """
+    推理工作池
+
+    mode='thread': 线程池，适合单进程部署，torch 推理期间会释放 GIL
+    mode='process': 进程池（spawn），每个进程独立加载模型，可跨核扩展；
+    每个进程启动时按 runtime_config 设置线程数，YOLO_CPU_AFFINITY=auto 时各自绑定一段核
+    """
+
+    def __init__(self, mode=INFER_MODE, workers=INFER_WORKERS):
+        if mode not in ('thread', 'process'):
+            raise ValueError(f"不支持的推理模式: {mode}（可选 thread / process）")
+        self.mode = mode
+        self.workers = max(1, int(workers))
+        self._pool = None
+
+    def start(self):
+        """创建工作池"""
+        if self._pool is not None:
+            return
+        if self.mode == 'process':
+            ctx = multiprocessing.get_context('spawn')
+            slots = ctx.Queue()
+            for index in range(self.workers):
+                slots.put(index)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=ctx,
+                initializer=init_worker,
+                initargs=(slots, self.workers)
+            )
+        else:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix='yolo-infer'
+            )
+
+    def submit(self, fn, *args):
+        """提交任务，返回 concurrent.futures.Future"""
+        if self._pool is None:
+            self.start()
+        return self._pool.submit(fn, *args)
+
+    def shutdown(self):
+        """关闭工作池"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
@@ -5,6 +5,7 @@ YOLOv8 训练系统 - 启动器
 """
 import os
 import sys
+import multiprocessing
 import time
 import webbrowser
 import threading
@@ -35,6 +36,7 @@ from datetime import datetime
 
 # 导入主应用模块
 import yolo_training_system
+from runtime_config import print_runtime_report
 
 def open_browser():
     """延迟打开浏览器"""
@@ -48,6 +50,7 @@ def main():
     print("=" * 70)
     print("🎯 YOLOv8 训练系统 - 启动中...")
     print("=" * 70)
+    print_runtime_report()
     print()
 
     # 在新线程中打开浏览器
@@ -72,4 +75,6 @@ def main():
         input("\n按回车键退出...")
 
 if __name__ == '__main__':
+    # 打包后训练任务以子进程运行，需要 freeze_support
+    multiprocessing.freeze_support()
     main()
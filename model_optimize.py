@@ -0,0 +1,458 @@
+# -*- coding: utf-8 -*-
+"""
+模型优化
+为训练好的 FP32 权重生成 FP16 和 INT8（用验证集做静态校准）的 ONNX / OpenVINO 版本，
+并在验证集上逐个测量 mAP 和单张推理延迟，生成「精度 - 延迟」报告（保存在权重旁的 best.optimize.json）。
+报告中的版本会出现在模型列表中，可以像普通模型一样选择
+"""
+import importlib.util
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+from dataset_catalog import IMAGE_EXTENSIONS
+from dataset_files import write_text_atomic
+from inference_backends import (
+    artifact_path, backend_available, ensure_exported, letterbox, load_backend, to_blob, weights_hash,
+    EXPORT_IMGSZ, EXPORT_OPSET
+)
+from training_jobs import stream_events
+
+# 默认配置（可通过环境变量覆盖）
+# INT8 静态校准使用的验证集图片数
+CALIB_IMAGES = int(os.environ.get('YOLO_CALIB_IMAGES', 100))
+# 测量延迟使用的验证集图片数（逐张推理，先预热）
+LATENCY_IMAGES = int(os.environ.get('YOLO_LATENCY_IMAGES', 50))
+# 训练输出目录（检测 API 据此列出优化后的模型）
+MODELS_DIR = Path(os.environ.get('YOLO_MODELS_DIR', 'yolo_workspace/models'))
+
+PRECISIONS = ('fp32', 'fp16', 'int8')
+WARMUP_RUNS = 3
+
+
+def report_path(weights):
+    return Path(weights).with_suffix('.optimize.json')
+
+
+def training_data(weights):
+    """
+    训练该权重时使用的 data.yaml，找不到时返回 None
+
+    优先使用提交训练时保存在输出目录中的快照，其次是 args.yaml 中记录的路径
+    """
+    run_dir = Path(weights).parent.parent
+    if (run_dir / 'data.yaml').exists():
+        return str(run_dir / 'data.yaml')
+    args_file = run_dir / 'args.yaml'
+    try:
+        with open(args_file, 'r', encoding='utf-8') as f:
+            data = (yaml.safe_load(f) or {}).get('data')
+    except OSError:
+        return None
+    return data if data and Path(data).exists() else None
+
+
+def val_images(data_yaml):
+    """data.yaml 中验证集的图片路径（val 可以是目录、图片清单文件或它们的列表）"""
+    with open(data_yaml, 'r', encoding='utf-8') as f:
+        data = yaml.safe_load(f) or {}
+    root = Path(data.get('path') or Path(data_yaml).parent)
+    entries = data.get('val') or []
+    images = []
+    for entry in entries if isinstance(entries, list) else [entries]:
+        entry = Path(entry) if Path(entry).is_absolute() else root / entry
+        if entry.is_dir():
+            images.extend(sorted(p for p in entry.rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS))
+        elif entry.is_file():
+            with open(entry, 'r', encoding='utf-8') as f:
+                lines = [line.strip() for line in f if line.strip()]
+            images.extend(Path(line) if Path(line).is_absolute() else entry.parent / line for line in lines)
+    return [str(p) for p in images]
+
+
+def _sample(paths, count):
+    """均匀抽取 count 张（结果固定，便于不同版本之间比较）"""
+    if len(paths) <= count:
+        return list(paths)
+    step = len(paths) / count
+    return [paths[int(i * step)] for i in range(count)]
+
+
+# ---------- ONNX 的 FP16 / INT8 转换 ----------
+
+class _CalibrationReader:
+    """onnxruntime 静态量化的校准数据：预处理方式与推理时相同"""
+
+    def __init__(self, input_name, images, imgsz):
+        self.input_name = input_name
+        self.images = iter(images)
+        self.imgsz = imgsz
+
+    def get_next(self):
+        for path in self.images:
+            image = cv2.imread(path)
+            if image is not None:
+                return {self.input_name: to_blob([letterbox(image, self.imgsz)[0]])}
+        return None
+
+    def rewind(self):
+        pass
+
+
+def _head_nodes(model):
+    """
+    检测头的解码部分（DFL、框坐标换算、Sigmoid、拼接）：
+    框坐标（0~imgsz）和类别分数（0~1）拼在同一个张量里，量化为 INT8 会严重损失精度，保持 FP32
+    """
+    pattern = re.compile(r'/model\.(\d+)/')
+    indices = [int(m.group(1)) for node in model.graph.node for m in [pattern.match(node.name)] if m]
+    if not indices:
+        return []
+    prefix = f'/model.{max(indices)}/'
+    return [node.name for node in model.graph.node
+            if node.name.startswith(prefix) and (node.op_type != 'Conv' or '/dfl/' in node.name)]
+
+
+def _copy_metadata(src, dst):
+    """转换后保留 ultralytics 写入的元数据（类别名、输入尺寸等）"""
+    import onnx
+
+    source = onnx.load(str(src), load_external_data=False)
+    model = onnx.load(str(dst))
+    existing = {p.key for p in model.metadata_props}
+    for prop in source.metadata_props:
+        if prop.key not in existing:
+            model.metadata_props.add(key=prop.key, value=prop.value)
+    onnx.save(model, str(dst))
+
+
+def onnx_to_fp16(src, dst):
+    """权重和计算转为 FP16，输入输出仍为 FP32"""
+    import onnx
+    from onnxruntime.transformers.float16 import convert_float_to_float16
+
+    model = convert_float_to_float16(onnx.load(str(src)), keep_io_types=True)
+    onnx.save(model, str(dst))
+
+
+def onnx_to_int8(src, dst, images, imgsz):
+    """静态 INT8 量化（QDQ 格式，逐通道权重），用验证集图片校准激活范围"""
+    import onnx
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+    model = onnx.load(str(src))
+    reader = _CalibrationReader(model.graph.input[0].name, images, imgsz)
+    quantize_static(
+        str(src), str(dst), reader,
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+        nodes_to_exclude=_head_nodes(model)
+    )
+    _copy_metadata(src, dst)
+
+
+def build_variant(weights, backend, precision, data_yaml, imgsz=EXPORT_IMGSZ, opset=EXPORT_OPSET):
+    """生成（或复用已有的）某个后端和精度的版本，返回模型路径"""
+    if precision not in PRECISIONS:
+        raise ValueError(f"不支持的精度: {precision}（可选 {' / '.join(PRECISIONS)}）")
+    if not backend_available(backend):
+        raise RuntimeError(f"推理后端 {backend} 的依赖未安装")
+
+    if backend == 'openvino':
+        if precision == 'int8':
+            if importlib.util.find_spec('nncf') is None:
+                raise RuntimeError('OpenVINO INT8 量化需要 nncf（pip install nncf）')
+            return ensure_exported(weights, backend, imgsz, opset, precision, int8=True, data=str(data_yaml))
+        return ensure_exported(weights, backend, imgsz, opset, precision, half=precision == 'fp16')
+
+    source = ensure_exported(weights, 'onnx', imgsz, opset)
+    if precision == 'fp32':
+        return source
+    target = artifact_path(weights, 'onnx', imgsz, opset, precision)
+    if target.exists():
+        return target
+    fd, tmp = tempfile.mkstemp(suffix='.onnx', dir=target.parent)
+    os.close(fd)
+    try:
+        if precision == 'fp16':
+            onnx_to_fp16(source, tmp)
+        else:
+            images = _sample(val_images(data_yaml), CALIB_IMAGES)
+            if not images:
+                raise ValueError('验证集没有图片，无法做 INT8 校准')
+            onnx_to_int8(source, tmp, images, (int(imgsz), int(imgsz)))
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+    return target
+
+
+# ---------- 精度 / 延迟测量 ----------
+
+def model_size_mb(path):
+    path = Path(path)
+    if path.is_dir():
+        size = sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+    else:
+        size = path.stat().st_size
+    return round(size / 1024 / 1024, 2)
+
+
+def measure_accuracy(path, data_yaml, imgsz, work_dir):
+    """在验证集上评估 mAP（ultralytics val，逐张推理）"""
+    from ultralytics import YOLO
+
+    name = Path(str(path).rstrip('/\\')).name
+    metrics = YOLO(str(path), task='detect').val(
+        data=str(data_yaml), imgsz=int(imgsz), batch=1, device='cpu', plots=False, verbose=False,
+        project=str(work_dir), name=name, exist_ok=True
+    )
+    return {'mAP50': round(float(metrics.box.map50), 4), 'mAP50_95': round(float(metrics.box.map), 4)}
+
+
+def measure_latency(path, images, conf=0.25, iou=0.7):
+    """逐张推理的延迟（毫秒，不含图片解码），与服务中的调用方式一致"""
+    model = load_backend(path)
+    if hasattr(model, 'overrides'):
+        model.overrides['device'] = 'cpu'
+    frames = [frame for frame in (cv2.imread(p) for p in images) if frame is not None]
+    if not frames:
+        return None
+    for frame in frames[:WARMUP_RUNS]:
+        model.predict(frame, conf=conf, iou=iou, verbose=False)
+    times = []
+    for frame in frames:
+        start = time.perf_counter()
+        model.predict(frame, conf=conf, iou=iou, verbose=False)
+        times.append((time.perf_counter() - start) * 1000)
+    times = np.array(times)
+    return {
+        'mean': round(float(times.mean()), 2),
+        'p50': round(float(np.percentile(times, 50)), 2),
+        'p95': round(float(np.percentile(times, 95)), 2),
+        'images': len(times)
+    }
+
+
+def load_report(weights):
+    """权重对应的优化报告；权重已被覆盖（哈希不同）时返回 None"""
+    try:
+        with open(report_path(weights), 'r', encoding='utf-8') as f:
+            report = json.load(f)
+        if report.get('hash') != weights_hash(weights):
+            return None
+        return report
+    except (OSError, ValueError):
+        return None
+
+
+def list_variants(weights):
+    """报告中可用的优化版本（不含原始 FP32 权重本身）"""
+    report = load_report(weights) if Path(weights).exists() else None
+    if not report:
+        return []
+    variants = []
+    for variant in report['variants']:
+        if variant.get('backend') == 'torch' or variant.get('error'):
+            continue
+        # 导出产物与权重在同一目录，按文件名定位（工作目录整体移动后仍可用）
+        path = Path(weights).parent / Path(variant['path']).name
+        if path.exists():
+            variants.append(dict(variant, path=str(path)))
+    return variants
+
+
+def find_variants(models_dir=MODELS_DIR):
+    """训练输出目录下所有权重的优化版本"""
+    variants = []
+    for report_file in sorted(Path(models_dir).glob('*/weights/*.optimize.json')):
+        weights = report_file.with_name(report_file.name[:-len('.optimize.json')] + '.pt')
+        for variant in list_variants(weights):
+            variants.append(dict(variant, weights=str(weights), run=weights.parent.parent.name))
+    return variants
+
+
+def variant_label(variant):
+    """模型下拉框中显示的说明"""
+    parts = [f"{variant['backend']}-{variant['precision']}"]
+    if variant.get('mAP50_95') is not None:
+        parts.append(f"mAP50-95 {variant['mAP50_95']}")
+    if variant.get('latency_ms'):
+        parts.append(f"{variant['latency_ms']['p50']} ms")
+    return '，'.join(parts)
+
+
+# ---------- 后台优化任务 ----------
+
+class OptimizeJob:
+    """一次优化：为一个权重生成若干版本并逐个评估"""
+
+    def __init__(self, weights, data_yaml, backends, precisions, imgsz):
+        self.id = uuid.uuid4().hex[:12]
+        self.weights = str(weights)
+        self.data_yaml = str(data_yaml)
+        self.backends = list(backends)
+        self.precisions = list(precisions)
+        self.imgsz = int(imgsz)
+        self.status = 'queued'
+        self.created_at = datetime.now().isoformat(timespec='seconds')
+        self.finished_at = None
+        self.report = None
+        self.events = []
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'weights': self.weights,
+            'data': self.data_yaml,
+            'backends': self.backends,
+            'precisions': self.precisions,
+            'imgsz': self.imgsz,
+            'status': self.status,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'report': self.report
+        }
+
+
+class OptimizeJobManager:
+    """
+    优化任务管理器
+
+    导出、量化和评估都很耗 CPU，任务在一个后台线程中依次执行；
+    每个版本完成后追加一条事件，可通过 stream() 以 SSE 订阅
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._jobs = OrderedDict()
+        self._queue = []
+        self._worker = None
+
+    def submit(self, weights, data_yaml, backends=('onnx',), precisions=PRECISIONS, imgsz=EXPORT_IMGSZ):
+        weights = Path(weights)
+        if not weights.exists() or weights.suffix != '.pt':
+            raise ValueError(f'权重文件不存在: {weights}')
+        unknown = set(precisions) - set(PRECISIONS)
+        if unknown:
+            raise ValueError(f"不支持的精度: {', '.join(sorted(unknown))}")
+        for backend in backends:
+            if backend not in ('onnx', 'openvino'):
+                raise ValueError(f"不支持的后端: {backend}（可选 onnx / openvino）")
+            if not backend_available(backend):
+                raise ValueError(f"推理后端 {backend} 的依赖未安装")
+        if not val_images(data_yaml):
+            raise ValueError('验证集没有图片')
+
+        job = OptimizeJob(weights, data_yaml, backends, precisions, imgsz)
+        with self._cond:
+            self._jobs[job.id] = job
+            self._queue.append(job)
+            self._emit(job, 'queued', message=f'优化任务已提交: {weights}')
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def list(self):
+        with self._cond:
+            return [job.to_dict() for job in reversed(self._jobs.values())]
+
+    def stream(self, job_id, heartbeat=15):
+        return stream_events(self._cond, self._jobs[job_id], heartbeat)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._queue:
+                    self._worker = None
+                    return
+                job = self._queue.pop(0)
+                job.status = 'running'
+                self._emit(job, 'running')
+            try:
+                report = self._optimize(job)
+                with self._cond:
+                    job.report = report
+                    self._finish(job, 'completed', message='优化完成')
+            except Exception as e:
+                with self._cond:
+                    self._finish(job, 'failed', message=f'优化失败: {e}')
+
+    def _optimize(self, job):
+        weights, data_yaml = Path(job.weights), job.data_yaml
+        images = _sample(val_images(data_yaml), LATENCY_IMAGES)
+        work_dir = weights.parent / 'optimize'
+
+        plan = [('torch', 'fp32')] + [(b, p) for b in job.backends for p in job.precisions]
+        variants = []
+        for backend, precision in plan:
+            variant = {'name': f'{backend}-{precision}', 'backend': backend, 'precision': precision}
+            try:
+                path = weights if backend == 'torch' else build_variant(weights, backend, precision, data_yaml, job.imgsz)
+                variant['path'] = str(path)
+                variant['size_mb'] = model_size_mb(path)
+                variant.update(measure_accuracy(path, data_yaml, job.imgsz, work_dir))
+                variant['latency_ms'] = measure_latency(path, images)
+            except Exception as e:
+                variant['error'] = str(e)
+            variants.append(variant)
+            with self._cond:
+                self._emit(job, 'variant', variant, message=f"{variant['name']}: "
+                           + (variant['error'] if 'error' in variant else variant_label(variant)))
+
+        # 以 PyTorch FP32 为基准计算加速比和精度损失
+        base = variants[0]
+        for variant in variants:
+            if 'error' in variant or 'error' in base or not variant.get('latency_ms') or not base.get('latency_ms'):
+                continue
+            variant['speedup'] = round(base['latency_ms']['p50'] / variant['latency_ms']['p50'], 2)
+            variant['mAP50_95_drop'] = round(base['mAP50_95'] - variant['mAP50_95'], 4)
+
+        report = {
+            'weights': str(weights),
+            'hash': weights_hash(weights),
+            'data': str(data_yaml),
+            'imgsz': job.imgsz,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'variants': variants
+        }
+        write_text_atomic(report_path(weights), json.dumps(report, ensure_ascii=False, indent=2))
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return report
+
+    def _finish(self, job, status, message=None):
+        """调用方需持有锁"""
+        job.status = status
+        job.finished_at = datetime.now().isoformat(timespec='seconds')
+        self._emit(job, status, {'report': job.report} if job.report else None, message=message)
+
+    def _emit(self, job, event, data=None, message=None):
+        """记录事件并唤醒订阅者（调用方需持有锁）"""
+        job.events.append({
+            'seq': len(job.events),
+            'event': event,
+            'status': job.status,
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'message': message,
+            'data': data or {}
+        })
+        self._cond.notify_all()
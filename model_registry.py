@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+进程级模型注册表
+按 (模型路径, 文件修改时间, 副本号) 缓存已加载的模型（YOLO 或导出的 ONNX / OpenVINO 模型），
+按数量和估算内存做 LRU 淘汰，避免每次请求都重新加载权重
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+# 默认配置（可通过环境变量覆盖）
+MAX_MODELS = int(os.environ.get('YOLO_MODEL_CACHE_SIZE', 8))
+MAX_MEMORY_MB = float(os.environ.get('YOLO_MODEL_CACHE_MB', 4096))
+
+
+def _file_mtime(path):
+    """模型文件的修改时间，文件不存在（例如待自动下载的预训练模型）时返回 None"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def estimate_model_bytes(model, path):
+    """估算模型占用的内存：参数和缓冲区字节数，失败时退回文件大小"""
+    try:
+        module = model.model
+        return sum(t.numel() * t.element_size() for t in list(module.parameters()) + list(module.buffers()))
+    except Exception:
+        if getattr(model, 'file_bytes', 0):
+            return model.file_bytes
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+
+class _Entry:
+    def __init__(self, model, size):
+        self.model = model
+        self.size = size
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """
+    模型注册表
+
+    get(path) 返回缓存中的模型，文件被覆盖（mtime 变化）后会重新加载。
+    replica 用于为不同工作线程保留独立副本；同一副本被多个线程共享时，
+    应通过 using(path) 取得独占使用权。
+    """
+
+    def __init__(self, max_models=MAX_MODELS, max_memory_mb=MAX_MEMORY_MB):
+        self.max_models = max(1, int(max_models))
+        self.max_bytes = int(float(max_memory_mb) * 1024 * 1024)
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(path, replica):
+        return (str(Path(path).resolve()), _file_mtime(path), replica)
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return entry
+
+    def _entry(self, path, replica):
+        key = self._key(path, replica)
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                return entry
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        # 同一模型只加载一次，其他线程等待加载完成
+        with load_lock:
+            with self._lock:
+                entry = self._lookup(key)
+                if entry is not None:
+                    return entry
+
+            from inference_backends import load_backend, backend_of
+            from runtime_config import resolve_device
+            from service_metrics import observe_model_load
+            start = time.perf_counter()
+            model = load_backend(path)
+            observe_model_load(backend_of(path), time.perf_counter() - start)
+            # 所有 predict 调用默认使用统一配置的设备
+            model.overrides['device'] = resolve_device()
+            entry = _Entry(model, estimate_model_bytes(model, path))
+
+            with self._lock:
+                self._loading.pop(key, None)
+                # 预训练模型可能刚被下载，按加载后的 mtime 登记
+                key = self._key(path, replica)
+                # 同一路径的旧版本权重已过期，直接移除
+                for old in [k for k in self._entries if k[0] == key[0] and k[2] == replica]:
+                    del self._entries[old]
+                self._entries[key] = entry
+                self.loads += 1
+                self._evict()
+            return entry
+
+    def _evict(self):
+        """按 LRU 顺序淘汰，至少保留最近使用的一个模型"""
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_models or self.memory_bytes > self.max_bytes
+        ):
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    @property
+    def memory_bytes(self):
+        return sum(e.size for e in self._entries.values())
+
+    def get(self, path, replica=None):
+        """获取模型（必要时加载）"""
+        return self._entry(path, replica).model
+
+    @contextmanager
+    def using(self, path, replica=None):
+        """获取模型并在 with 块内独占使用，适合多线程共享同一副本的场景"""
+        entry = self._entry(path, replica)
+        with entry.lock:
+            yield entry.model
+
+    def evict(self, path):
+        """移除指定路径的所有缓存副本"""
+        resolved = str(Path(path).resolve())
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == resolved]:
+                del self._entries[key]
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """缓存统计信息"""
+        with self._lock:
+            return {
+                'models': len(self._entries),
+                'max_models': self.max_models,
+                'memory_mb': round(self.memory_bytes / 1024 / 1024, 1),
+                'max_memory_mb': round(self.max_bytes / 1024 / 1024, 1),
+                'loads': self.loads,
+                'hits': self.hits,
+                'evictions': self.evictions,
+                'entries': [
+                    {'path': k[0], 'replica': k[2], 'memory_mb': round(e.size / 1024 / 1024, 1)}
+                    for k, e in self._entries.items()
+                ]
+            }
+
+
+# 进程内共享的注册表
+registry = ModelRegistry()
+
+
+def get_model(path, replica=None):
+    """从共享注册表获取模型"""
+    return registry.get(path, replica)
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+批量预标注任务
+用选定的模型对整个文件夹批量推理，把建议的 YOLO 标注写入暂存目录，供标注页面加载后修正。
+任务状态保存在暂存目录的 manifest.json 中，中断后可从未完成的图片继续
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from dataset_files import write_text_atomic
+from inference_executor import InferenceExecutor, get_replica, INFER_MODE
+from training_jobs import FINISHED_STATES, stream_events
+
+# 默认配置（可通过环境变量覆盖）
+PRELABEL_DIR = os.environ.get('YOLO_PRELABEL_DIR', str(Path('yolo_workspace') / 'prelabels'))
+PRELABEL_WORKERS = int(os.environ.get('YOLO_PRELABEL_WORKERS', 2))
+PRELABEL_BATCH_SIZE = int(os.environ.get('YOLO_PRELABEL_BATCH_SIZE', 8))
+
+# 进度事件和 manifest 的最短间隔（秒），避免大文件夹产生大量事件
+PROGRESS_INTERVAL = 1.0
+
+# 可以继续执行的状态（服务重启时运行中的任务记为 interrupted）
+RESUMABLE_STATES = ('cancelled', 'failed', 'interrupted')
+
+
+def yolo_lines(results):
+    """检测结果转为 YOLO 格式的标注行: class x_center y_center width height（归一化）"""
+    boxes = results.boxes
+    if len(boxes) == 0:
+        return []
+    # 导出的 ONNX / OpenVINO 模型的检测框是 NumPy 数组，没有 .cpu()
+    xywhn, cls = boxes.xywhn, boxes.cls
+    if hasattr(xywhn, 'cpu'):
+        xywhn, cls = xywhn.cpu().numpy(), cls.cpu().numpy()
+    cls = np.asarray(cls).astype(int)
+    return [f'{c} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n' for c, (x, y, w, h) in zip(cls.tolist(), xywhn.tolist())]
+
+
+def prelabel_batch(paths, model_path, conf, iou, labels_dir):
+    """
+    工作者入口：对一批图片推理并写入暂存标注
+
+    返回 (成功的图片数, 框数, 错误列表)；没有检测到物体的图片写入空文件，表示已处理
+    """
+    model = get_replica(model_path)
+    try:
+        results_list = model.predict(paths, conf=conf, iou=iou, verbose=False)
+        pairs = list(zip(paths, results_list))
+        errors = []
+    except Exception:
+        # 批次中有无法读取的图片时逐张处理，跳过出错的图片
+        pairs, errors = [], []
+        for path in paths:
+            try:
+                pairs.append((path, model.predict(path, conf=conf, iou=iou, verbose=False)[0]))
+            except Exception as e:
+                errors.append({'path': path, 'error': str(e)})
+
+    boxes = 0
+    for path, results in pairs:
+        lines = yolo_lines(results)
+        boxes += len(lines)
+        write_text_atomic(Path(labels_dir) / f'{Path(path).stem}.txt', ''.join(lines))
+    return len(pairs), boxes, errors
+
+
+class PrelabelJob:
+    """单个预标注任务，状态持久化在 <暂存目录>/<id>/manifest.json"""
+
+    def __init__(self, root, folder, model_path, conf, iou, batch_size, job_id=None):
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.dir = Path(root) / self.id
+        self.labels_dir = self.dir / 'labels'
+        self.folder = str(folder)
+        self.model_path = str(model_path)
+        self.conf = float(conf)
+        self.iou = float(iou)
+        self.batch_size = max(1, int(batch_size))
+        self.status = 'queued'
+        self.created_at = datetime.now().isoformat(timespec='seconds')
+        self.started_at = None
+        self.finished_at = None
+        self.total = 0
+        self.done = 0
+        self.boxes = 0
+        self.errors = []
+        self.events = []
+        self.cancel_requested = False
+
+    _FIELDS = ('id', 'folder', 'model_path', 'conf', 'iou', 'batch_size', 'status',
+               'created_at', 'started_at', 'finished_at', 'total', 'done', 'boxes', 'errors')
+
+    def to_dict(self):
+        data = {k: getattr(self, k) for k in self._FIELDS}
+        data['labels_dir'] = str(self.labels_dir.absolute())
+        data['progress'] = round(self.done / self.total, 4) if self.total else 0
+        data['errors'] = self.errors[-20:]
+        data['error_count'] = len(self.errors)
+        return data
+
+    def save(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        data = {k: getattr(self, k) for k in self._FIELDS}
+        write_text_atomic(self.dir / 'manifest.json', json.dumps(data, ensure_ascii=False, indent=2))
+
+    @classmethod
+    def load(cls, job_dir):
+        with open(Path(job_dir) / 'manifest.json', 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        job = cls(Path(job_dir).parent, data['folder'], data['model_path'], data['conf'],
+                  data['iou'], data['batch_size'], job_id=data['id'])
+        for key in cls._FIELDS:
+            setattr(job, key, data.get(key, getattr(job, key)))
+        if job.status not in FINISHED_STATES:
+            job.status = 'interrupted'
+        return job
+
+    def label_path(self, image_path):
+        """某张图片的暂存标注文件（不存在时返回 None）"""
+        path = self.labels_dir / f'{Path(image_path).stem}.txt'
+        return path if path.exists() else None
+
+
+class PrelabelJobManager:
+    """
+    预标注任务管理器
+
+    任务按提交顺序逐个执行；每个任务用一个推理工作池（每个工作者持有独立的模型副本）
+    分批处理图片，工作者直接写暂存标注，主线程只汇总进度
+    """
+
+    def __init__(self, root=PRELABEL_DIR, list_images=None, workers=PRELABEL_WORKERS, mode=INFER_MODE):
+        self.root = Path(root).absolute()
+        self.root.mkdir(parents=True, exist_ok=True)
+        # list_images(folder) 返回文件夹中按名称排序的图片路径（使用数据集索引）
+        self.list_images = list_images
+        self.workers = max(1, int(workers))
+        self.mode = mode
+        self._jobs = OrderedDict()
+        self._cond = threading.Condition()
+        self._run_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """加载暂存目录中已有的任务，未完成的可继续执行"""
+        for manifest in sorted(self.root.glob('*/manifest.json'), key=lambda p: p.stat().st_mtime):
+            try:
+                job = PrelabelJob.load(manifest.parent)
+            except Exception as e:
+                print(f"读取预标注任务失败 {manifest}: {e}")
+                continue
+            self._jobs[job.id] = job
+
+    def submit(self, folder, model_path, conf=0.25, iou=0.45, batch_size=PRELABEL_BATCH_SIZE):
+        """提交预标注任务"""
+        job = PrelabelJob(self.root, folder, model_path, conf, iou, batch_size)
+        job.labels_dir.mkdir(parents=True, exist_ok=True)
+        with self._cond:
+            self._jobs[job.id] = job
+            self._emit(job, 'queued', message=f'预标注任务已加入队列: {folder}')
+        job.save()
+        self._start(job)
+        return job
+
+    def resume(self, job_id):
+        """继续执行中断、取消或失败的任务，已有暂存标注的图片会被跳过"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in RESUMABLE_STATES:
+                return False
+            job.status = 'queued'
+            job.cancel_requested = False
+            job.finished_at = None
+            self._emit(job, 'queued', message='预标注任务已重新加入队列')
+        self._start(job)
+        return True
+
+    def cancel(self, job_id):
+        """取消任务，已写入的暂存标注保留，之后可继续执行"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED_STATES or job.status == 'interrupted':
+                return False
+            job.cancel_requested = True
+            if job.status == 'queued':
+                self._finish(job, 'cancelled', message='任务已取消')
+            else:
+                job.status = 'cancelling'
+        return True
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def list(self):
+        with self._cond:
+            return [job.to_dict() for job in reversed(self._jobs.values())]
+
+    def latest_for_folder(self, folder):
+        """某个文件夹最近一次的预标注任务"""
+        folder = str(Path(folder).absolute())
+        with self._cond:
+            for job in reversed(self._jobs.values()):
+                if str(Path(job.folder).absolute()) == folder:
+                    return job
+        return None
+
+    def stream(self, job_id, heartbeat=15):
+        """以 Server-Sent Events 格式输出任务进度（服务重启前中断的任务直接结束）"""
+        return stream_events(self._cond, self._jobs[job_id], heartbeat, FINISHED_STATES + ('interrupted',))
+
+    def _start(self, job):
+        threading.Thread(target=self._run, args=(job,), name=f'prelabel-{job.id}', daemon=True).start()
+
+    def _run(self, job):
+        # 同一时间只运行一个预标注任务，其余排队
+        with self._run_lock:
+            with self._cond:
+                if job.cancel_requested or job.status != 'queued':
+                    return
+                job.status = 'running'
+                job.started_at = job.started_at or datetime.now().isoformat(timespec='seconds')
+                self._emit(job, 'running', message='预标注已开始')
+            try:
+                self._process(job)
+            except Exception as e:
+                with self._cond:
+                    self._finish(job, 'failed', {'error': str(e)}, message=f'预标注失败: {e}')
+
+    def _process(self, job):
+        images = [str(p) for p in self.list_images(job.folder)]
+        job.labels_dir.mkdir(parents=True, exist_ok=True)
+        # 一次列出暂存目录即可知道哪些图片已处理，不必逐张 stat
+        done_stems = {p.stem for p in job.labels_dir.glob('*.txt')}
+        pending = [p for p in images if Path(p).stem not in done_stems]
+        with self._cond:
+            job.total = len(images)
+            job.done = len(images) - len(pending)
+            job.errors = []
+            self._emit(job, 'progress', self._progress(job, 0, time.time()))
+        job.save()
+
+        batches = [pending[i:i + job.batch_size] for i in range(0, len(pending), job.batch_size)]
+        executor = InferenceExecutor(mode=self.mode, workers=self.workers)
+        executor.start()
+        started, processed = time.time(), 0
+        last_report = started
+        inflight = set()
+        try:
+            while batches or inflight:
+                # 每个工作者最多两个排队批次，取消后不再提交新批次
+                while batches and len(inflight) < self.workers * 2 and not job.cancel_requested:
+                    inflight.add(executor.submit(
+                        prelabel_batch, batches.pop(0), job.model_path, job.conf, job.iou, str(job.labels_dir)
+                    ))
+                if not inflight:
+                    break
+                finished, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                with self._cond:
+                    for future in finished:
+                        count, boxes, errors = future.result()
+                        processed += count
+                        job.done += count
+                        job.boxes += boxes
+                        job.errors.extend(errors)
+                    report = time.time() - last_report >= PROGRESS_INTERVAL or not (batches or inflight)
+                    if report:
+                        self._emit(job, 'progress', self._progress(job, processed, started))
+                if report:
+                    last_report = time.time()
+                    job.save()
+        finally:
+            executor.shutdown()
+
+        with self._cond:
+            if job.cancel_requested:
+                self._finish(job, 'cancelled', message=f'预标注已取消（已完成 {job.done}/{job.total}）')
+            else:
+                self._finish(job, 'completed', message=f'预标注完成: {job.done} 张图片，{job.boxes} 个框')
+
+    @staticmethod
+    def _progress(job, processed, started):
+        elapsed = time.time() - started
+        return {
+            'done': job.done,
+            'total': job.total,
+            'boxes': job.boxes,
+            'errors': len(job.errors),
+            'imgs_per_sec': round(processed / elapsed, 2) if elapsed > 0 and processed else None
+        }
+
+    def _finish(self, job, status, data=None, message=None):
+        """结束任务（调用方需持有锁）"""
+        job.status = status
+        job.finished_at = datetime.now().isoformat(timespec='seconds')
+        if data and data.get('error'):
+            job.errors.append({'path': None, 'error': data['error']})
+        self._emit(job, status, data, message=message)
+        job.save()
+
+    def _emit(self, job, event, data=None, message=None):
+        """记录事件并唤醒订阅者（调用方需持有锁）"""
+        job.events.append({
+            'seq': len(job.events),
+            'event': event,
+            'status': job.status,
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'message': message,
+            'data': data or {}
+        })
+        self._cond.notify_all()
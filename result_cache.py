@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+检测结果缓存
+按 (图片内容哈希, 模型文件, conf, iou) 缓存检测框，相同图片重复提交时无需再次推理。
+内存中按条数和字节数做 LRU 淘汰，可选写入磁盘以便重启后复用
+"""
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+# 默认配置（可通过环境变量覆盖，YOLO_RESULT_CACHE_SIZE=0 关闭缓存）
+RESULT_CACHE_SIZE = int(os.environ.get('YOLO_RESULT_CACHE_SIZE', 256))
+RESULT_CACHE_MB = float(os.environ.get('YOLO_RESULT_CACHE_MB', 128))
+RESULT_CACHE_DIR = os.environ.get('YOLO_RESULT_CACHE_DIR', '')  # 为空时只使用内存缓存
+
+
+def content_hash(contents):
+    """图片字节的内容哈希"""
+    return hashlib.sha256(contents).hexdigest()
+
+
+def model_identity(path):
+    """模型标识：解析后的路径 + 文件修改时间，权重被覆盖后旧结果自动失效"""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+    return str(Path(path).resolve()), mtime
+
+
+class CachedDetections:
+    """缓存的检测结果：boxes.data 数组 + 类别名 + 原图尺寸，以及可选的标注图片"""
+
+    def __init__(self, data, names, orig_shape, annotated=None):
+        self.data = np.ascontiguousarray(data, dtype=np.float32)
+        self.names = names
+        self.orig_shape = tuple(orig_shape)
+        self.annotated = annotated
+
+    @classmethod
+    def from_results(cls, results):
+        data = results.boxes.data
+        if hasattr(data, 'cpu'):
+            data = data.cpu().numpy()
+        return cls(data, dict(results.names), results.orig_shape)
+
+    @property
+    def size(self):
+        return self.data.nbytes + (len(self.annotated) if self.annotated else 0)
+
+    def to_results(self, image):
+        """
+        重建 ultralytics Results，供序列化和绘制复用
+
+        image: 原图（PIL RGB 或 BGR 数组，可以是缩小解码的图片），用于绘制标注；
+        检测框和 orig_shape 始终是原图坐标
+        """
+        import torch
+        from ultralytics.engine.results import Results
+
+        if not isinstance(image, np.ndarray):
+            image = np.asarray(image)[:, :, ::-1]
+        results = Results(image, path='', names=self.names, boxes=torch.from_numpy(self.data))
+        if results.orig_shape != self.orig_shape:
+            results.orig_shape = self.orig_shape
+            results.boxes = type(results.boxes)(results.boxes.data, self.orig_shape)
+        return results
+
+
+class ResultCache:
+    """
+    检测结果缓存
+
+    get / put 的 key 由 make_key() 生成；attach() 附加标注图片（计入内存上限）；
+    invalidate(model_path) 移除某个模型的全部结果
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, max_memory_mb=RESULT_CACHE_MB, disk_dir=RESULT_CACHE_DIR):
+        self.max_entries = max(0, int(max_entries))
+        self.max_bytes = int(float(max_memory_mb) * 1024 * 1024)
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_key(contents, model_path, conf, iou, variant=None):
+        """variant 区分同一图片的不同推理方式（例如切片推理的参数）"""
+        model, mtime = model_identity(model_path)
+        digest = content_hash(contents)
+        if variant:
+            digest = f'{digest}.{variant}'
+        return (model, mtime, digest, f'{float(conf):.4f}', f'{float(iou):.4f}')
+
+    def _disk_path(self, key):
+        model, mtime, digest, conf, iou = key
+        model_dir = hashlib.sha1(model.encode('utf-8')).hexdigest()[:16]
+        return self.disk_dir / model_dir / f'{mtime}_{digest}_{conf}_{iou}.npz'
+
+    def get(self, key):
+        """查找缓存，未命中返回 None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        entry = self._load(key) if self.disk_dir else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        """写入缓存（内存，以及配置了 disk_dir 时的磁盘）"""
+        if not self.enabled:
+            return entry
+        with self._lock:
+            self._store(key, entry)
+        if self.disk_dir:
+            try:
+                self._save(key, entry)
+            except OSError as e:
+                print(f"写入结果缓存失败: {e}")
+        return entry
+
+    def attach(self, entry, annotated):
+        """给结果附加已编码的标注图片，并按新的内存占用重新淘汰（标注图片不写入磁盘缓存）"""
+        with self._lock:
+            entry.annotated = annotated
+            self._evict()
+        return annotated
+
+    def _store(self, key, entry):
+        """写入内存并按 LRU 淘汰（调用方需持有锁）"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._evict()
+
+    def _evict(self):
+        """超出条数或字节数上限时淘汰最久未使用的结果（调用方需持有锁）"""
+        while self._entries and (
+            len(self._entries) > self.max_entries or self.memory_bytes > self.max_bytes
+        ):
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _save(self, key, entry):
+        path = self._disk_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            data=entry.data,
+            names=np.frombuffer(json.dumps(entry.names, ensure_ascii=False).encode('utf-8'), dtype=np.uint8),
+            orig_shape=np.asarray(entry.orig_shape)
+        )
+        # 先写临时文件再替换，避免并发读到半个文件
+        tmp = path.with_suffix(f'.{threading.get_ident()}.tmp')
+        tmp.write_bytes(buffer.getvalue())
+        os.replace(tmp, path)
+
+    def _load(self, key):
+        path = self._disk_path(key)
+        if not path.exists():
+            return None
+        try:
+            with np.load(path) as archive:
+                names = json.loads(archive['names'].tobytes().decode('utf-8'))
+                return CachedDetections(
+                    archive['data'],
+                    {int(k): v for k, v in names.items()},
+                    archive['orig_shape'].tolist()
+                )
+        except Exception as e:
+            print(f"读取结果缓存失败 {path}: {e}")
+            return None
+
+    @property
+    def memory_bytes(self):
+        return sum(e.size for e in self._entries.values())
+
+    def invalidate(self, model_path):
+        """移除指定模型的全部缓存结果（内存和磁盘）"""
+        model, _ = model_identity(model_path)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == model]:
+                del self._entries[key]
+                self.evictions += 1
+        if self.disk_dir:
+            model_dir = hashlib.sha1(model.encode('utf-8')).hexdigest()[:16]
+            shutil.rmtree(self.disk_dir / model_dir, ignore_errors=True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'memory_mb': round(self.memory_bytes / 1024 / 1024, 2),
+                'max_memory_mb': round(self.max_bytes / 1024 / 1024, 1),
+                'disk_dir': str(self.disk_dir) if self.disk_dir else None,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.disk_hits) / lookups, 4) if lookups else None,
+                'evictions': self.evictions
+            }
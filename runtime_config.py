@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+运行时配置
+统一设置推理 / 训练使用的设备、torch 线程数、OpenCV 线程数和 CPU 亲和性，
+避免多个工作者各自按全部核数开线程、互相争抢 CPU。各服务启动时调用 apply_runtime()，
+并用 print_runtime_report() 输出实际生效的设置
+"""
+import os
+
+# 默认配置（可通过环境变量覆盖）
+# 设备: auto（有 CUDA 用第一块 GPU，其次 Apple MPS，否则 CPU）/ cpu / 0 / 0,1 / cuda:0 / mps
+DEVICE = os.environ.get('YOLO_DEVICE', 'auto')
+# 每个进程（或每个推理工作者）的 torch 计算线程数，0 表示按 CPU 核数 / 工作者数自动分配
+TORCH_THREADS = int(os.environ.get('YOLO_TORCH_THREADS', 0))
+# torch inter-op 线程数，0 表示保持 torch 默认值
+INTEROP_THREADS = int(os.environ.get('YOLO_INTEROP_THREADS', 0))
+# OpenCV 线程数，-1 表示与 torch 线程数相同
+CV_THREADS = int(os.environ.get('YOLO_CV_THREADS', -1))
+# CPU 亲和性: 空（不绑定）/ auto（进程模式的推理工作者各自绑定一段不重叠的核）/ 核列表，例如 0-3,8
+CPU_AFFINITY = os.environ.get('YOLO_CPU_AFFINITY', '').strip()
+
+_resolved_device = None
+_effective = {}
+
+
+def parse_cpu_list(text):
+    """解析 '0-3,8' 形式的核列表"""
+    cpus = set()
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+def available_cpus():
+    """当前进程可用的 CPU 核"""
+    if CPU_AFFINITY and CPU_AFFINITY != 'auto':
+        return parse_cpu_list(CPU_AFFINITY)
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # Windows / macOS
+        return list(range(os.cpu_count() or 1))
+
+
+def resolve_device(device=None):
+    """把 auto 解析为实际设备（结果会被缓存），返回 ultralytics 的 device 参数"""
+    global _resolved_device
+    device = DEVICE if device is None else device
+    if device != 'auto':
+        return device
+    if _resolved_device is None:
+        _resolved_device = 'cpu'
+        try:
+            import torch
+
+            if torch.cuda.is_available():
+                _resolved_device = '0'
+            elif getattr(torch.backends, 'mps', None) is not None and torch.backends.mps.is_available():
+                _resolved_device = 'mps'
+        except ImportError:
+            pass
+    return _resolved_device
+
+
+def threads_per_worker(workers=1):
+    """每个工作者的 torch 线程数"""
+    if TORCH_THREADS > 0:
+        return TORCH_THREADS
+    return max(1, len(available_cpus()) // max(1, int(workers)))
+
+
+def effective_threads():
+    """当前进程（每个工作者）实际使用的计算线程数，供 ONNX Runtime / OpenVINO 会话使用"""
+    return _effective.get('threads') or threads_per_worker()
+
+
+def worker_cpus(index, workers):
+    """CPU_AFFINITY=auto 时第 index 个工作者绑定的核（核数不够分时返回 None，不绑定）"""
+    cpus = available_cpus()
+    per_worker = len(cpus) // max(1, int(workers))
+    if per_worker < 1:
+        return None
+    start = (index % workers) * per_worker
+    return cpus[start:start + per_worker]
+
+
+def _set_affinity(cpus):
+    try:
+        os.sched_setaffinity(0, cpus)
+        return True
+    except (AttributeError, OSError) as e:
+        print(f"设置 CPU 亲和性失败: {e}")
+        return False
+
+
+def apply_runtime(workers=1, index=None, threads=None):
+    """
+    在当前进程应用运行时配置
+
+    workers: 本进程内同时推理的工作者数（线程数按核数 / workers 分配）
+    index: 进程模式下工作者的序号，CPU_AFFINITY=auto 时据此绑定一段核
+    threads: 直接指定 torch 线程数（覆盖自动分配）
+    """
+    if CPU_AFFINITY == 'auto':
+        if index is not None:
+            cpus = worker_cpus(index, workers)
+            if cpus:
+                _set_affinity(cpus)
+                # 进程已绑定到自己的一段核，线程数按这段核数设置
+                workers = 1
+    elif CPU_AFFINITY:
+        _set_affinity(parse_cpu_list(CPU_AFFINITY))
+
+    threads = threads or threads_per_worker(workers)
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+        if INTEROP_THREADS > 0:
+            try:
+                torch.set_num_interop_threads(INTEROP_THREADS)
+            except RuntimeError:
+                # 只能在 inter-op 线程池启动前设置一次
+                pass
+    except ImportError:
+        pass
+    try:
+        # ultralytics 选择 CPU 设备时会按自己的默认值重置 torch 线程数，改为本配置的值
+        from ultralytics.utils import torch_utils
+
+        torch_utils.NUM_THREADS = threads
+    except ImportError:
+        pass
+    try:
+        import cv2
+
+        cv2.setNumThreads(threads if CV_THREADS < 0 else CV_THREADS)
+    except ImportError:
+        pass
+
+    _effective.update(workers=workers, index=index, threads=threads)
+    return runtime_report()
+
+
+def runtime_report():
+    """当前进程实际生效的设置"""
+    report = {
+        'device': DEVICE,
+        'resolved_device': resolve_device(),
+        'cpu_count': os.cpu_count(),
+        'torch_threads': None,
+        'interop_threads': None,
+        'cv_threads': None,
+        'affinity': None,
+        'workers': _effective.get('workers'),
+        'omp_num_threads': os.environ.get('OMP_NUM_THREADS')
+    }
+    try:
+        import torch
+
+        report['torch_threads'] = torch.get_num_threads()
+        report['interop_threads'] = torch.get_num_interop_threads()
+    except ImportError:
+        pass
+    try:
+        import cv2
+
+        report['cv_threads'] = cv2.getNumThreads()
+    except ImportError:
+        pass
+    try:
+        report['affinity'] = sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        pass
+    return report
+
+
+def print_runtime_report():
+    """输出运行时设置（启动时调用）"""
+    report = runtime_report()
+    affinity = report['affinity']
+    if affinity and len(affinity) == report['cpu_count']:
+        affinity = '全部'
+    print("运行时配置:")
+    print(f"  设备: {report['resolved_device']}（YOLO_DEVICE={report['device']}）")
+    print(f"  torch 线程: {report['torch_threads']}，inter-op 线程: {report['interop_threads']}，"
+          f"OpenCV 线程: {report['cv_threads']}")
+    print(f"  CPU 核数: {report['cpu_count']}，绑定的核: {affinity}")
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+Prometheus 指标
+各服务的 /metrics 端点以 Prometheus 文本格式输出：请求数和耗时直方图、进行中的请求数、
+各阶段（读取上传、解码、推理、逐框序列化、绘制、编码）耗时直方图、模型加载次数和耗时、
+排队深度和缓存统计。阶段耗时复用 stage_timing 的计时器，不额外计时；
+YOLO_METRICS=0 时不注册中间件和端点，热路径上没有任何额外开销
+"""
+import bisect
+import os
+import threading
+
+from stage_timing import STAGE_TIMING, begin, current
+
+# 是否启用指标（可通过环境变量关闭）
+METRICS_ENABLED = os.environ.get('YOLO_METRICS', '1') != '0'
+
+# 请求和阶段耗时的直方图分桶（秒），例如 YOLO_METRICS_BUCKETS=0.01,0.05,0.1,0.5,1
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LATENCY_BUCKETS = tuple(sorted(
+    float(b) for b in os.environ.get('YOLO_METRICS_BUCKETS', '').split(',') if b.strip()
+)) or DEFAULT_BUCKETS
+
+# 模型加载耗时的分桶（秒）
+LOAD_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    """只增不减的计数"""
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}' for labels, value in items
+        ]
+
+
+class Gauge(Counter):
+    """可增可减的当前值"""
+    kind = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """分桶直方图：各桶内的计数在输出时累加成 Prometheus 的累计桶"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def render(self):
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        lines = self.header()
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, ("le", _number(bound)))} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    指标注册表
+
+    除了直接更新的指标，还可以用 collector(fn) 注册在抓取时才计算的指标：
+    fn() 返回 [(名称, 类型, 说明, [(标签字典, 值), ...]), ...]，
+    用于队列深度、缓存统计等已经由其他组件维护的数值
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._add(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def collector(self, fn):
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        """Prometheus 文本格式"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for fn in self._collectors:
+            try:
+                families = fn()
+            except Exception as e:
+                print(f"指标收集失败 ({getattr(fn, '__name__', fn)}): {e}")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_labels(labels.keys(), labels.values())} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# 进程内共享的注册表和通用指标
+metrics = MetricsRegistry()
+
+REQUESTS = metrics.counter(
+    'yolo_http_requests_total', 'HTTP 请求数', ('method', 'endpoint', 'status'))
+REQUEST_SECONDS = metrics.histogram(
+    'yolo_http_request_duration_seconds', 'HTTP 请求耗时（秒，流式响应到最后一个字节）', ('method', 'endpoint'))
+IN_FLIGHT = metrics.gauge(
+    'yolo_http_requests_in_flight', '正在处理的 HTTP 请求数')
+STAGE_SECONDS = metrics.histogram(
+    'yolo_stage_duration_seconds', '请求各阶段耗时（秒）', ('endpoint', 'stage'))
+MODEL_LOAD_SECONDS = metrics.histogram(
+    'yolo_model_load_duration_seconds', '模型加载耗时（秒）', ('backend',), buckets=LOAD_BUCKETS)
+
+
+def observe_model_load(backend, seconds):
+    """模型注册表每次实际加载模型后调用"""
+    if METRICS_ENABLED:
+        MODEL_LOAD_SECONDS.observe(seconds, backend)
+
+
+def _start_timer():
+    """取得当前请求的计时器：Server-Timing 开启时由它的中间件创建，否则在这里创建"""
+    return current() if STAGE_TIMING else begin(force=True)
+
+
+def _finish(timer, method, endpoint, status):
+    REQUESTS.inc(method, endpoint, str(status))
+    if timer is None:
+        return
+    REQUEST_SECONDS.observe(timer.total(), method, endpoint)
+    for name, seconds in timer.stages.items():
+        STAGE_SECONDS.observe(seconds, endpoint, name)
+
+
+@metrics.collector
+def process_metrics():
+    """进程 CPU 时间和常驻内存"""
+    times = os.times()
+    families = [('process_cpu_seconds_total', 'counter', '进程 CPU 时间（秒）',
+                 [({}, round(times.user + times.system, 3))])]
+    try:
+        with open('/proc/self/statm') as f:
+            rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        families.append(('process_resident_memory_bytes', 'gauge', '常驻内存（字节）', [({}, rss)]))
+    except (OSError, ValueError, AttributeError):
+        pass
+    return families
+
+
+def model_cache_metrics(registry):
+    """模型注册表的加载、命中、淘汰次数和占用"""
+    def collect():
+        stats = registry.stats()
+        return [
+            ('yolo_model_loads_total', 'counter', '模型实际加载次数', [({}, stats['loads'])]),
+            ('yolo_model_cache_hits_total', 'counter', '模型缓存命中次数', [({}, stats['hits'])]),
+            ('yolo_model_cache_evictions_total', 'counter', '模型缓存淘汰次数', [({}, stats['evictions'])]),
+            ('yolo_model_cache_models', 'gauge', '已加载的模型（副本）数', [({}, stats['models'])]),
+            ('yolo_model_cache_memory_bytes', 'gauge', '已加载模型的估算内存（字节）',
+             [({}, int(stats['memory_mb'] * 1024 * 1024))]),
+        ]
+    return collect
+
+
+def result_cache_metrics(cache):
+    """检测结果缓存的命中、未命中次数和条目数"""
+    def collect():
+        stats = cache.stats()
+        return [
+            ('yolo_result_cache_hits_total', 'counter', '结果缓存命中次数',
+             [({'tier': 'memory'}, stats['hits']), ({'tier': 'disk'}, stats['disk_hits'])]),
+            ('yolo_result_cache_misses_total', 'counter', '结果缓存未命中次数', [({}, stats['misses'])]),
+            ('yolo_result_cache_entries', 'gauge', '结果缓存条目数', [({}, stats['entries'])]),
+        ]
+    return collect
+
+
+def queue_metrics(queues):
+    """排队深度，queues 为 {队列名: 返回当前深度的函数}"""
+    def collect():
+        return [('yolo_queue_depth', 'gauge', '排队等待处理的请求或任务数',
+                 [({'queue': name}, fn()) for name, fn in queues.items()])]
+    return collect
+
+
+def _asgi_endpoint(scope):
+    """路由模板（如 /detect），未匹配的路径统一记为 <unmatched>，避免标签无限增长"""
+    route = scope.get('route')
+    if route is not None and getattr(route, 'path', None):
+        return route.path
+    endpoint = scope.get('endpoint')
+    return getattr(endpoint, '__name__', '<unmatched>')
+
+
+class MetricsMiddleware:
+    """
+    ASGI 中间件（FastAPI）：记录请求数、耗时、进行中的请求数和各阶段耗时
+
+    需在 ServerTimingMiddleware 之前添加（即位于其内层），以便共用同一个计时器
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        timer = _start_timer()
+        status = [500]
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            IN_FLIGHT.dec()
+            _finish(timer, scope['method'], _asgi_endpoint(scope), status[0])
+
+
+def install_fastapi(app, collectors=()):
+    """FastAPI：添加中间件和 GET /metrics（需在添加 ServerTimingMiddleware 之前调用）"""
+    if not METRICS_ENABLED:
+        return
+    from starlette.responses import Response
+
+    for fn in collectors:
+        metrics.collector(fn)
+    app.add_middleware(MetricsMiddleware)
+
+    async def metrics_endpoint():
+        return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+    app.add_api_route('/metrics', metrics_endpoint, methods=['GET'], include_in_schema=False)
+
+
+def install_flask(app, collectors=()):
+    """
+    Flask：before_request / teardown_request 记录请求，并添加 GET /metrics
+
+    需在 stage_timing.install_flask 之后调用；teardown 在流式响应结束后才执行，耗时包含整个响应
+    """
+    if not METRICS_ENABLED:
+        return
+    from flask import Response, g, request
+
+    for fn in collectors:
+        metrics.collector(fn)
+
+    @app.before_request
+    def _begin_metrics():
+        g.metrics_timer = _start_timer()
+        g.metrics_status = 500
+        IN_FLIGHT.inc()
+
+    @app.after_request
+    def _record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish_metrics(exc):
+        if 'metrics_timer' not in g:
+            return
+        IN_FLIGHT.dec()
+        endpoint = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        _finish(g.pop('metrics_timer'), request.method, endpoint, g.metrics_status)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        return Response(metrics.render(), content_type=CONTENT_TYPE)
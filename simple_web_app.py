@@ -4,25 +4,38 @@
 上传图片 → 检测 → 显示结果
 """
 from flask import Flask, render_template, request, send_file
-from ultralytics import YOLO
-from PIL import Image
 import io
 import base64
 from werkzeug.utils import secure_filename
 import os
+from model_registry import registry, get_model
+from inference_backends import resolve_model
+from stage_timing import install_flask, stage, elapsed
+from image_decode import decode_image, restore_results
+from image_render import render_results, RENDER_MEDIA_TYPE
+import service_metrics
+from runtime_config import apply_runtime, print_runtime_report
+
+# 运行时配置（同一时刻只有一个请求使用模型）
+apply_runtime(workers=1)
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB 限制
+# 分阶段计时（响应头 Server-Timing）
+install_flask(app)
+# Prometheus 指标（GET /metrics），与 Server-Timing 共用计时器
+service_metrics.install_flask(app, collectors=(service_metrics.model_cache_metrics(registry),))
 
-# 加载模型
-model = None
+# 检测模型（由模型注册表缓存）
+MODEL_PATH = 'yolov8n.pt'
 
 def load_model_once():
-    global model
-    if model is None:
-        print("正在加载检测模型...")
-        model = YOLO('yolov8n.pt')
-        print("✓ 模型加载完成")
+    global MODEL_PATH
+    print("正在加载检测模型...")
+    # YOLO_INFER_BACKEND 为 onnx / openvino 时改用导出的模型
+    MODEL_PATH = resolve_model(MODEL_PATH)
+    model = get_model(MODEL_PATH)
+    print("✓ 模型加载完成")
     return model
 
 @app.route('/')
@@ -310,24 +323,22 @@ def detect():
         return '没有选择文件', 400
 
     try:
-        # 读取图片
-        image = Image.open(file.stream).convert('RGB')
-
-        # 加载模型
-        model = load_model_once()
+        # 读取图片（上传表单在访问 request.files 时已接收和解析完毕）
+        elapsed('read')
+        with stage('read'):
+            contents = file.read()
+        # 大图按缩小尺寸解码
+        with stage('decode'):
+            image = decode_image(contents)
 
-        # 检测
-        results = model.predict(image, conf=0.25, verbose=False)[0]
+        # 检测（同一模型实例在请求线程间独占使用）
+        with stage('predict'), registry.using(MODEL_PATH) as model:
+            results = restore_results(model.predict(image.array, conf=0.25, verbose=False)[0], image)
 
-        # 绘制结果
-        import cv2
-        annotated_img = results.plot()
+        # 在解码后的图片上直接绘制结果并编码（render_results 内部分别计入 plot / encode 阶段，与检测 API 一致）
+        img_bytes = io.BytesIO(render_results(results))
 
-        # 转换为 bytes
-        _, buffer = cv2.imencode('.jpg', annotated_img)
-        img_bytes = io.BytesIO(buffer.tobytes())
-
-        return send_file(img_bytes, mimetype='image/jpeg')
+        return send_file(img_bytes, mimetype=RENDER_MEDIA_TYPE)
 
     except Exception as e:
         print(f"错误: {e}")
@@ -343,6 +354,8 @@ if __name__ == '__main__':
     print("\n✓ 服务器启动成功")
     print("\n浏览器访问: http://localhost:7863")
     print("\n按 Ctrl+C 停止服务")
-    print("="*70 + "\n")
+    print("="*70)
+    print_runtime_report()
+    print()
 
     app.run(host='0.0.0.0', port=7863, debug=False)
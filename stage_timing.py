@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+请求分阶段计时
+记录每个请求在上传读取、解码、推理、序列化、编码等阶段的耗时，通过标准的 Server-Timing 响应头返回
+（浏览器开发者工具和 benchmark.py 都能直接读取）。计时器放在 contextvars 中，
+处理函数里用 with stage('decode'): ... 标记阶段即可，无需层层传递
+"""
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+
+# 是否记录并返回 Server-Timing（可通过环境变量关闭）
+STAGE_TIMING = os.environ.get('YOLO_STAGE_TIMING', '1') != '0'
+
+# 各服务使用的阶段名
+STAGES = ('read', 'decode', 'cache', 'predict', 'serialize', 'plot', 'encode')
+
+_current = contextvars.ContextVar('stage_timer', default=None)
+
+
+class StageTimer:
+    """一个请求的各阶段耗时（秒，同名阶段累加）"""
+
+    __slots__ = ('start', 'stages')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def header_value(self):
+        """Server-Timing 头：read;dur=1.20, decode;dur=3.41, ..., total;dur=58.02（毫秒）"""
+        parts = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in self.stages.items()]
+        parts.append(f'total;dur={self.total() * 1000:.2f}')
+        return ', '.join(parts)
+
+
+def begin(force=False):
+    """开始一个请求的计时（关闭时返回 None；force=True 时即使不返回 Server-Timing 也计时，供 service_metrics 使用）"""
+    if not (STAGE_TIMING or force):
+        return None
+    timer = StageTimer()
+    _current.set(timer)
+    return timer
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def stage(name):
+    """计时 with 块（run_in_threadpool 会复制上下文，线程池中的代码同样计入当前请求）"""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - start)
+
+
+def elapsed(name):
+    """把请求开始到现在的时间记为一个阶段（例如处理函数开始前接收和解析上传表单的时间）"""
+    timer = _current.get()
+    if timer is not None:
+        timer.add(name, time.perf_counter() - timer.start)
+
+
+def parse_server_timing(value):
+    """解析 Server-Timing 头为 {阶段: 毫秒}"""
+    stages = {}
+    for part in (value or '').split(','):
+        name, _, params = part.strip().partition(';')
+        for param in params.split(';'):
+            key, _, number = param.strip().partition('=')
+            if key == 'dur' and name:
+                stages[name] = stages.get(name, 0.0) + float(number)
+    return stages
+
+
+class ServerTimingMiddleware:
+    """ASGI 中间件（FastAPI）：每个 HTTP 请求开始计时，在响应头中加入 Server-Timing"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not STAGE_TIMING:
+            await self.app(scope, receive, send)
+            return
+        timer = begin()
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                headers = list(message.get('headers', []))
+                headers.append((b'server-timing', timer.header_value().encode('latin-1')))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_timing)
+
+
+def install_flask(app):
+    """Flask：before_request 开始计时，after_request 写入 Server-Timing"""
+    if not STAGE_TIMING:
+        return
+
+    @app.before_request
+    def _begin_stage_timer():
+        begin()
+
+    @app.after_request
+    def _add_server_timing(response):
+        timer = _current.get()
+        if timer is not None:
+            response.headers['Server-Timing'] = timer.header_value()
+        return response
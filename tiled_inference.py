@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+切片推理（SAHI 风格）
+整张图直接缩到模型输入尺寸时，8K 航拍、巡检图片中的小目标只剩几个像素而漏检。
+切片模式把原图按 tile_size 切成相互重叠的小块（加上一次整图推理保留大目标），
+各小块按批送入模型，检测框平移回原图坐标后用 NMS 或 WBF 全局合并
+"""
+import os
+
+import numpy as np
+
+from inference_backends import nms
+
+# 默认配置（可通过环境变量覆盖）
+TILE_SIZE = int(os.environ.get('YOLO_TILE_SIZE', 640))  # 切片边长，与模型输入尺寸一致时不再缩放
+TILE_OVERLAP = float(os.environ.get('YOLO_TILE_OVERLAP', 0.2))  # 相邻切片的重叠比例
+TILE_MERGE = os.environ.get('YOLO_TILE_MERGE', 'nms')  # nms | wbf
+TILE_MERGE_IOU = float(os.environ.get('YOLO_TILE_MERGE_IOU', 0.5))  # 合并重复框的 IoU 阈值
+TILE_FULL_IMAGE = os.environ.get('YOLO_TILE_FULL_IMAGE', '1') != '0'  # 是否额外做一次整图推理
+TILE_BATCH = int(os.environ.get('YOLO_TILE_BATCH', 4))  # 同步推理时每批切片数（CPU 上 4 左右吞吐量最好）
+TILE_MAX_DET = int(os.environ.get('YOLO_TILE_MAX_DET', 1000))  # 合并后最多保留的检测框
+
+MERGE_METHODS = ('nms', 'wbf')
+
+
+class Tiling:
+    """切片参数"""
+
+    __slots__ = ('size', 'overlap', 'merge', 'full_image')
+
+    def __init__(self, size=TILE_SIZE, overlap=TILE_OVERLAP, merge=TILE_MERGE, full_image=TILE_FULL_IMAGE):
+        size, overlap = int(size), float(overlap)
+        if size < 32:
+            raise ValueError(f'tile_size 过小: {size}（至少 32）')
+        if not 0 <= overlap < 1:
+            raise ValueError(f'tile_overlap 应在 [0, 1) 之间: {overlap}')
+        if merge not in MERGE_METHODS:
+            raise ValueError(f"不支持的合并方式: {merge}（可选 {' / '.join(MERGE_METHODS)}）")
+        self.size = size
+        self.overlap = overlap
+        self.merge = merge
+        self.full_image = bool(full_image)
+
+    @property
+    def key(self):
+        """结果缓存键的一部分"""
+        return f'tile{self.size}o{self.overlap:.3f}{self.merge}{int(self.full_image)}'
+
+    def to_dict(self):
+        return {'tile_size': self.size, 'tile_overlap': self.overlap, 'merge': self.merge, 'full_image': self.full_image}
+
+
+def _starts(length, size, stride):
+    """一个方向上的切片起点，最后一块贴齐边缘"""
+    if length <= size:
+        return [0]
+    starts = list(range(0, length - size, stride))
+    starts.append(length - size)
+    return starts
+
+
+def tile_windows(width, height, tiling):
+    """切片窗口列表 [(x1, y1, x2, y2)]；开启整图推理时第一个窗口为整图"""
+    size = tiling.size
+    stride = max(1, int(size * (1 - tiling.overlap)))
+    windows = [
+        (x, y, min(x + size, width), min(y + size, height))
+        for y in _starts(height, size, stride)
+        for x in _starts(width, size, stride)
+    ]
+    if tiling.full_image and windows != [(0, 0, width, height)]:
+        windows.insert(0, (0, 0, width, height))
+    return windows
+
+
+def tile_images(image, windows):
+    """按窗口切出小块（BGR 数组，连续内存的副本，便于跨进程传递和批量预处理）"""
+    return [np.ascontiguousarray(image[y1:y2, x1:x2]) for x1, y1, x2, y2 in windows]
+
+
+def _detections(results, window):
+    """单个切片的检测框平移回原图坐标，(n, 6) [x1, y1, x2, y2, conf, cls]"""
+    data = results.boxes.data
+    if hasattr(data, 'cpu'):
+        data = data.cpu().numpy()
+    data = np.asarray(data, dtype=np.float32)
+    # boxes.data 的列: x1, y1, x2, y2, [track_id], conf, cls
+    det = np.concatenate([data[:, :4], data[:, -2:]], axis=1)
+    det[:, [0, 2]] += window[0]
+    det[:, [1, 3]] += window[1]
+    return det
+
+
+def merge_nms(det, iou_threshold):
+    """
+    按类别 NMS：重叠切片中的重复框只保留分数最高的一个
+
+    检测框是原图坐标（8K 等大图可能超过 ultralytics 的 MAX_WH），
+    类别偏移量按本图最大坐标取值，不同类别的框平移后不会重叠
+    """
+    boxes = det[:, :4].astype(np.float64)
+    offsets = det[:, 5:6].astype(np.float64) * (boxes.max(initial=0) + 1)
+    return det[nms(boxes + offsets, det[:, 4], iou_threshold)]
+
+
+def _wbf_class(det, iou_threshold):
+    """单个类别的 WBF，det 已按分数从高到低排序"""
+    n = len(det)
+    fused = np.empty((n, 4), dtype=np.float64)  # 各簇当前的融合框
+    weighted = np.empty((n, 4), dtype=np.float64)  # 各簇的 Σ 分数 × 坐标
+    weights = np.empty(n, dtype=np.float64)  # 各簇的 Σ 分数
+    scores = np.empty(n, dtype=np.float32)  # 各簇的最高分数
+    k = 0
+    for box, score in zip(det[:, :4].astype(np.float64), det[:, 4].astype(np.float64)):
+        if k:
+            current = fused[:k]
+            w = (np.minimum(box[2], current[:, 2]) - np.maximum(box[0], current[:, 0])).clip(0)
+            h = (np.minimum(box[3], current[:, 3]) - np.maximum(box[1], current[:, 1])).clip(0)
+            inter = w * h
+            area = (box[2] - box[0]) * (box[3] - box[1])
+            areas = (current[:, 2] - current[:, 0]) * (current[:, 3] - current[:, 1])
+            ious = inter / (area + areas - inter + 1e-7)
+            best = int(ious.argmax())
+            if ious[best] > iou_threshold:
+                weighted[best] += box * score
+                weights[best] += score
+                fused[best] = weighted[best] / weights[best]
+                continue
+        fused[k], weighted[k], weights[k], scores[k] = box, box * score, score, score
+        k += 1
+    out = np.empty((k, 6), dtype=np.float32)
+    out[:, :4], out[:, 4], out[:, 5] = fused[:k], scores[:k], det[0, 5]
+    return out
+
+
+def merge_wbf(det, iou_threshold):
+    """
+    加权框融合（WBF）：同类别、IoU 超过阈值的框按分数加权平均坐标，分数取簇内最大值
+
+    被切片边缘截断的框与完整的框融合后位置更稳定。按类别分别融合，
+    簇的加权和增量更新，每个框只与同类别已有的簇做一次向量化的 IoU 计算
+    """
+    det = det[det[:, 4].argsort()[::-1]]
+    parts = [_wbf_class(det[det[:, 5] == c], iou_threshold) for c in np.unique(det[:, 5])]
+    return np.concatenate(parts) if parts else np.zeros((0, 6), dtype=np.float32)
+
+
+def merge_detections(results_list, windows, tiling, iou_threshold=TILE_MERGE_IOU, max_det=TILE_MAX_DET):
+    """各切片的检测结果合并为原图坐标下的 (n, 6) 数组，按分数从高到低"""
+    parts = [_detections(results, window) for results, window in zip(results_list, windows)]
+    det = np.concatenate(parts) if parts else np.zeros((0, 6), dtype=np.float32)
+    if len(det):
+        det = merge_wbf(det, iou_threshold) if tiling.merge == 'wbf' else merge_nms(det, iou_threshold)
+        det = det[det[:, 4].argsort()[::-1]][:max_det]
+    return det
+
+
+def build_results(image, det, names):
+    """合并后的检测框包装为 ultralytics Results（orig_img 为整张原图）"""
+    from ultralytics.engine.results import Results
+    return Results(image, path='', names=names, boxes=det)
+
+
+def predict_tiled(model, image, conf, iou, tiling, batch=TILE_BATCH):
+    """同步切片推理（模型直接在当前线程中运行，例如训练系统的模型测试）"""
+    windows = tile_windows(image.shape[1], image.shape[0], tiling)
+    tiles = tile_images(image, windows)
+    results_list = []
+    for i in range(0, len(tiles), max(1, batch)):
+        results_list.extend(model.predict(tiles[i:i + batch], conf=conf, iou=iou, verbose=False))
+    det = merge_detections(results_list, windows, tiling)
+    return build_results(image, det, results_list[0].names)
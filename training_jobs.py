@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+后台训练任务管理
+训练在独立进程中运行并按队列调度，逐轮指标以事件形式推送（供 SSE 使用）
+"""
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+# 同时运行的训练任务数（可通过环境变量覆盖）
+MAX_CONCURRENT_JOBS = int(os.environ.get('YOLO_TRAIN_CONCURRENCY', 1))
+
+FINISHED_STATES = ('completed', 'failed', 'cancelled')
+
+
+def _round(value, digits=5):
+    try:
+        return round(float(value), digits)
+    except (TypeError, ValueError):
+        return None
+
+
+def epoch_metrics(trainer):
+    """从 ultralytics trainer 中提取一轮训练的指标"""
+    losses = {}
+    if getattr(trainer, 'tloss', None) is not None:
+        for k, v in trainer.label_loss_items(trainer.tloss, prefix='train').items():
+            losses[k.split('/', 1)[-1]] = _round(v)
+    metrics = {k: _round(v) for k, v in (getattr(trainer, 'metrics', None) or {}).items()}
+
+    epoch_time = getattr(trainer, 'epoch_time', None)
+    try:
+        num_images = len(trainer.train_loader.dataset)
+    except Exception:
+        num_images = None
+
+    return {
+        'epoch': trainer.epoch + 1,
+        'epochs': trainer.epochs,
+        'loss': losses,
+        'metrics': metrics,
+        'mAP50': metrics.get('metrics/mAP50(B)'),
+        'mAP50_95': metrics.get('metrics/mAP50-95(B)'),
+        'epoch_time': _round(epoch_time, 2),
+        'imgs_per_sec': _round(num_images / epoch_time, 2) if epoch_time and num_images else None
+    }
+
+
+def run_training(model_path, train_args, events, threads=None):
+    """
+    子进程入口：执行训练，并把进度放入 events 队列
+
+    threads 指定本进程的 torch 线程数（多个训练同时运行时避免争抢 CPU 核）
+    """
+    try:
+        from runtime_config import apply_runtime
+        apply_runtime(threads=threads)
+
+        from ultralytics import YOLO
+
+        model = YOLO(model_path)
+        model.add_callback('on_train_start', lambda trainer: events.put(('running', {'save_dir': str(trainer.save_dir)})))
+
+        def on_fit_epoch_end(trainer):
+            metrics = epoch_metrics(trainer)
+            # 训练结束后对 best.pt 的最终验证也会触发该回调
+            events.put(('epoch' if metrics['epoch'] <= metrics['epochs'] else 'validated', metrics))
+
+        model.add_callback('on_fit_epoch_end', on_fit_epoch_end)
+        model.train(**train_args)
+
+        best = getattr(model.trainer, 'best', None)
+        events.put(('completed', {'model_path': str(best) if best else None}))
+    except Exception as e:
+        events.put(('failed', {'error': str(e)}))
+
+
+class TrainingJob:
+    """单个训练任务的状态"""
+
+    def __init__(self, name, model_path, train_args, threads=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.model_path = model_path
+        self.train_args = train_args
+        self.threads = threads
+        self.status = 'queued'
+        self.created_at = datetime.now().isoformat(timespec='seconds')
+        self.started_at = None
+        self.finished_at = None
+        self.result = {}
+        self.epochs = []
+        self.events = []
+        self.process = None
+
+    def to_dict(self, with_epochs=True):
+        data = {
+            'id': self.id,
+            'name': self.name,
+            'model': self.model_path,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'epoch': self.epochs[-1]['epoch'] if self.epochs else 0,
+            'epochs': self.train_args.get('epochs'),
+            'latest': self.epochs[-1] if self.epochs else None,
+            **self.result
+        }
+        if with_epochs:
+            data['history'] = self.epochs
+        return data
+
+
+class TrainingJobManager:
+    """
+    训练任务管理器
+
+    submit() 立即返回任务，任务按提交顺序排队，最多同时运行
+    max_concurrent 个，每个任务在独立进程（spawn）中执行。
+    listener(job, event, data) 在每个事件记录后调用（持有锁），
+    cond 可传入与调用方共用的 Condition
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_JOBS, listener=None, cond=None):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.listener = listener
+        self._jobs = OrderedDict()
+        self._cond = cond or threading.Condition()
+        self._ctx = multiprocessing.get_context('spawn')
+
+    def submit(self, name, model_path, train_args, threads=None):
+        """提交训练任务"""
+        job = TrainingJob(name, model_path, train_args, threads)
+        with self._cond:
+            self._jobs[job.id] = job
+            self._emit(job, 'queued', message=f'任务已加入队列: {name}')
+            self._schedule()
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def list(self):
+        with self._cond:
+            return [job.to_dict(with_epochs=False) for job in reversed(self._jobs.values())]
+
+    def cancel(self, job_id):
+        """取消任务：排队中的直接移除，运行中的终止训练进程"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED_STATES:
+                return False
+            if job.status == 'queued':
+                self._finish(job, 'cancelled', message='任务已取消')
+                return True
+            job.status = 'cancelling'
+            process = job.process
+        if process is not None:
+            process.terminate()
+        return True
+
+    def _schedule(self):
+        """启动排队中的任务（调用方需持有锁）"""
+        running = sum(1 for job in self._jobs.values() if job.status in ('starting', 'running', 'cancelling'))
+        for job in self._jobs.values():
+            if running >= self.max_concurrent:
+                break
+            if job.status == 'queued':
+                self._start(job)
+                running += 1
+
+    def _start(self, job):
+        events = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=run_training,
+            args=(job.model_path, job.train_args, events, job.threads),
+            name=f'train-{job.id}'
+        )
+        process.start()
+        job.process = process
+        job.status = 'starting'
+        job.started_at = datetime.now().isoformat(timespec='seconds')
+        threading.Thread(target=self._monitor, args=(job, process, events), daemon=True).start()
+
+    def _monitor(self, job, process, events):
+        """读取子进程事件并更新任务状态"""
+        finished = False
+        while not finished:
+            try:
+                event, data = events.get(timeout=1)
+            except queue.Empty:
+                if process.is_alive():
+                    continue
+                # 进程已退出且没有结束事件：被终止或异常崩溃
+                with self._cond:
+                    if job.status == 'cancelling':
+                        self._finish(job, 'cancelled', message='训练已取消')
+                    else:
+                        self._finish(job, 'failed', {'error': f'训练进程异常退出 (exit code {process.exitcode})'})
+                break
+
+            with self._cond:
+                if event == 'epoch':
+                    job.epochs.append(data)
+                    self._emit(job, 'epoch', data)
+                elif event == 'validated':
+                    job.result['final_metrics'] = data['metrics']
+                    self._emit(job, 'validated', data, message='最佳模型验证完成')
+                elif event == 'running':
+                    if job.status == 'starting':
+                        job.status = 'running'
+                    self._emit(job, 'running', data, message='训练已开始')
+                elif event == 'completed':
+                    self._finish(job, 'completed', data, message=f"训练完成！\n模型保存在: {data.get('model_path')}")
+                    finished = True
+                elif event == 'failed':
+                    self._finish(job, 'failed', data, message=f"训练失败: {data.get('error')}")
+                    finished = True
+
+        process.join()
+
+    def _finish(self, job, status, data=None, message=None):
+        """结束任务并调度下一个（调用方需持有锁）"""
+        job.status = status
+        job.finished_at = datetime.now().isoformat(timespec='seconds')
+        job.result.update(data or {})
+        job.process = None
+        self._emit(job, status, data, message=message)
+        self._schedule()
+
+    def _emit(self, job, event, data=None, message=None):
+        """记录事件并唤醒订阅者（调用方需持有锁）"""
+        job.events.append({
+            'seq': len(job.events),
+            'event': event,
+            'status': job.status,
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'message': message,
+            'data': data or {}
+        })
+        if self.listener is not None:
+            self.listener(job, event, data or {})
+        self._cond.notify_all()
+
+    def stream(self, job_id, heartbeat=15):
+        """以 Server-Sent Events 格式持续输出任务事件"""
+        return stream_events(self._cond, self._jobs[job_id], heartbeat)
+
+
+def stream_events(cond, job, heartbeat=15, finished_states=FINISHED_STATES):
+    """
+    以 Server-Sent Events 格式持续输出任务事件
+
+    job 需有 events 列表和 status；事件追加后应在 cond 上 notify_all。
+    先补发历史事件，任务结束后停止；空闲时定期发送注释行保持连接
+    """
+    index = 0
+    while True:
+        with cond:
+            if index >= len(job.events) and job.status not in finished_states:
+                cond.wait(timeout=heartbeat)
+            new_events = job.events[index:]
+            index += len(new_events)
+            done = job.status in finished_states
+
+        if not new_events and not done:
+            yield ': keep-alive\n\n'
+        for event in new_events:
+            yield f'data: {json.dumps(event, ensure_ascii=False)}\n\n'
+        if done:
+            return
@@ -3,23 +3,46 @@
 YOLOv8 完整训练系统 V2 - 包含标注、训练、测试功能
 新增：模型选择、更多训练参数
 """
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from werkzeug.utils import secure_filename
 import os
 import json
-import glob
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
 import yaml
-from PIL import Image
 import io
-from ultralytics import YOLO
-import cv2
+from ultralytics.utils.files import increment_path
 import numpy as np
 from datetime import datetime
+from model_registry import registry
+from result_cache import ResultCache, CachedDetections
+from dataset_catalog import DatasetCatalog, SPLITS, IMAGE_EXTENSIONS
+from dataset_files import materialize_file, write_text_atomic
+from dataset_compile import DatasetCompiler
+from dataset_split import DatasetSplitter, SPLIT_VAL_RATIO, SPLIT_SEED
+from image_preview import PreviewCache, PREVIEW_MAX_SIZE, guess_mimetype
+from prelabel_jobs import PrelabelJobManager, PRELABEL_WORKERS
+from inference_executor import INFER_MODE
+from training_jobs import TrainingJobManager, MAX_CONCURRENT_JOBS
+from runtime_config import apply_runtime, resolve_device, threads_per_worker, runtime_report, print_runtime_report
+from hparam_sweep import SweepManager
+from inference_backends import resolve_model, backend_available, INFER_BACKEND, BACKENDS
+from model_optimize import OptimizeJobManager, list_variants, variant_label, training_data, PRECISIONS
+from stage_timing import install_flask, stage, elapsed
+from image_decode import decode_image, restore_results, FAST_DECODE
+from tiled_inference import Tiling, predict_tiled, TILE_SIZE, TILE_OVERLAP, TILE_MERGE, MERGE_METHODS
+from image_render import render_results, RENDER_MEDIA_TYPE
+import service_metrics
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB限制
 
+# 运行时配置：本进程内的推理（模型测试、线程模式的批量预标注）共享 CPU 核，训练在子进程中单独设置
+apply_runtime(workers=PRELABEL_WORKERS if INFER_MODE == 'thread' else 1)
+
 # 工作目录
 WORKSPACE = Path('yolo_workspace')
 WORKSPACE.mkdir(exist_ok=True)
@@ -27,6 +50,9 @@ WORKSPACE.mkdir(exist_ok=True)
 # 数据集配置文件
 DATASET_CONFIG_FILE = WORKSPACE / 'dataset_config.json'
 
+# 测试结果缓存：同一图片用同一模型和阈值重复测试时不再推理
+result_cache = ResultCache()
+
 def load_dataset_config():
     """加载数据集配置"""
     if DATASET_CONFIG_FILE.exists():
@@ -55,10 +81,19 @@ def ensure_dataset_structure(dataset_dir):
 
 ensure_dataset_structure(DATASET_DIR)
 
+# 批量保存标注时并发写文件的线程数
+BULK_SAVE_WORKERS = int(os.environ.get('YOLO_BULK_SAVE_WORKERS', 8))
+
 # 训练模型保存目录
 MODELS_DIR = WORKSPACE / 'models'
 MODELS_DIR.mkdir(exist_ok=True)
 
+# 图片、标注和模型权重的索引，列表查询不再每次遍历目录
+catalog = DatasetCatalog()
+
+# 标注页面使用的缩小预览图（磁盘缓存）
+previews = PreviewCache()
+
 # 加载类别配置
 CLASSES_FILE = WORKSPACE / 'classes.json'
 
@@ -87,37 +122,184 @@ def get_available_models():
                 'name': f'预训练-{model}',
                 'type': 'pretrained'
             })
+            models.extend(optimized_models(model, f'预训练-{model}'))
 
-    # 自定义训练的模型
-    custom_models = glob.glob(str(MODELS_DIR / '**' / 'weights' / '*.pt'), recursive=True)
-    for model_path in custom_models:
-        rel_path = Path(model_path).relative_to(MODELS_DIR.parent)
-        model_name = Path(model_path).parent.parent.name
+    # 自定义训练的模型（从索引读取，只检查有变化的 weights 目录）
+    catalog.scan_checkpoints(MODELS_DIR)
+    for checkpoint in catalog.list_checkpoints(MODELS_DIR):
         models.append({
-            'path': str(model_path),
-            'name': f'自定义-{model_name}',
+            'path': checkpoint['path'],
+            'name': f"自定义-{checkpoint['run']}",
             'type': 'custom'
         })
+        models.extend(optimized_models(checkpoint['path'], f"自定义-{checkpoint['run']}"))
 
     return models
 
+def optimized_models(weights, name):
+    """权重的量化 / 导出版本（来自优化报告）"""
+    return [{
+        'path': variant['path'],
+        'name': f'{name}（{variant_label(variant)}）',
+        'type': 'optimized',
+        'backend': variant['backend'],
+        'precision': variant['precision']
+    } for variant in list_variants(weights)]
+
+# 后台训练任务管理器
+training_jobs = TrainingJobManager()
+
+# 超参数搜索（试验使用独立的训练队列，并发数按 CPU 核数分配）
+sweeps = SweepManager()
+
+# 模型优化（量化版本的生成和评估，后台依次执行）
+optimize_jobs = OptimizeJobManager()
+
+def folder_image_paths(folder):
+    """文件夹中按名称排序的图片路径（使用索引）"""
+    catalog.scan_folder(folder)
+    return [image['path'] for image in catalog.list_images(folder)]
+
+# 数据集编译（训练前校验、标注缓存和统计报告），结果在 yolo_dataset/.compiled
+dataset_compiler = DatasetCompiler(DATASET_DIR)
+
+# 训练集 / 验证集自动分层划分，硬链接目录在 yolo_dataset/.compiled/split
+dataset_splitter = DatasetSplitter(dataset_compiler.out_dir / 'split')
+
+# 批量预标注任务管理器，建议标注写入 yolo_workspace/prelabels/<任务ID>/labels
+prelabel_jobs = PrelabelJobManager(list_images=folder_image_paths)
+
+def queued_jobs(manager):
+    """排队中（尚未开始）的后台任务数"""
+    return sum(1 for job in manager.list() if job['status'] == 'queued')
+
+# 分阶段计时（响应头 Server-Timing）和 Prometheus 指标（GET /metrics）
+install_flask(app)
+service_metrics.install_flask(app, collectors=(
+    service_metrics.model_cache_metrics(registry),
+    service_metrics.result_cache_metrics(result_cache),
+    service_metrics.queue_metrics({
+        'training': lambda: queued_jobs(training_jobs),
+        'prelabel': lambda: queued_jobs(prelabel_jobs),
+        'optimize': lambda: queued_jobs(optimize_jobs)
+    }),
+))
+
+def read_yolo_label(path):
+    """读取 YOLO 格式标注文件，返回归一化的框列表"""
+    boxes = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 5:
+                boxes.append({
+                    'classId': int(float(parts[0])),
+                    'x_center': float(parts[1]),
+                    'y_center': float(parts[2]),
+                    'width': float(parts[3]),
+                    'height': float(parts[4])
+                })
+    return boxes
+
+def write_data_yaml(train='images/train', val='images/val', data_yaml_path=None):
+    """
+    根据当前类别和数据集目录生成 data.yaml（默认写到数据集目录下）
+
+    train / val 可以是图片目录（数据集内或自动划分生成），也可以是数据集编译生成的图片清单文件
+    """
+    classes = load_classes()
+
+    data_yaml = {
+        'path': str(DATASET_DIR.absolute()),
+        'train': str(train),
+        'val': str(val),
+        'nc': len(classes),
+        'names': classes
+    }
+
+    data_yaml_path = Path(data_yaml_path or DATASET_DIR / 'data.yaml')
+    data_yaml_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(data_yaml_path, 'w', encoding='utf-8') as f:
+        yaml.dump(data_yaml, f, allow_unicode=True)
+    return data_yaml_path
+
+# 训练参数默认值（与训练页面一致），超参数搜索的基础参数未给出时使用
+TRAIN_DEFAULTS = {
+    'model': 'yolov8n.pt', 'epochs': 100, 'batch': 16, 'imgsz': 640, 'lr': 0.01, 'momentum': 0.937,
+    'weight_decay': 0.0005, 'warmup_epochs': 3, 'hsv_h': 0.015, 'hsv_s': 0.7, 'hsv_v': 0.4, 'degrees': 0,
+    'fliplr': 0.5, 'mosaic': 1.0, 'patience': 50, 'conf': 0.25, 'iou': 0.7, 'workers': 8, 'name': 'custom_model'
+}
+
+class DatasetNotReady(ValueError):
+    """数据集没有可用的已标注图片，report 为编译报告"""
+
+    def __init__(self, message, report):
+        super().__init__(message)
+        self.report = report
+
+def prepare_dataset(params, work_dir=None):
+    """
+    训练前准备数据集：编译（只重新校验改动过的文件），val_ratio > 0 时重新分层划分，
+    然后生成 data.yaml。返回 (data.yaml 路径, 编译报告)；没有可用的已标注图片时抛出 DatasetNotReady
+
+    work_dir 给出时（超参数搜索）划分目录和 data.yaml 放在该目录下，
+    之后的训练或其他搜索重新划分不会改动仍在运行的试验所用的数据
+    """
+    classes = load_classes()
+    report = dataset_compiler.compile(classes)
+    val_ratio = float(params.get('val_ratio') or 0)
+    splitter = DatasetSplitter(Path(work_dir) / 'split') if work_dir else dataset_splitter
+    if val_ratio > 0:
+        # 对所有已标注图片重新分层划分（硬链接到独立目录，不移动原文件）
+        split = splitter.split(dataset_compiler.labeled_pool(), classes, val_ratio,
+                                       int(params.get('split_seed', SPLIT_SEED)))
+        if not split['train']['images']:
+            raise DatasetNotReady('没有可用的已标注图片', report)
+        train, val = splitter.images_dir('train'), splitter.images_dir('val')
+    else:
+        # 使用标注时选择的 train / val
+        if not report['splits']['train']['labeled']:
+            raise DatasetNotReady('训练集没有可用的已标注图片', report)
+        train, val = dataset_compiler.image_list('train'), dataset_compiler.image_list('val')
+    return write_data_yaml(train, val, Path(work_dir) / 'data.yaml' if work_dir else None), report
+
+def build_train_args(params, data_yaml_path):
+    """把前端提交的训练参数转换为 model.train 的参数"""
+    return dict(
+        data=str(data_yaml_path),
+        epochs=params['epochs'],
+        batch=params['batch'],
+        imgsz=params['imgsz'],
+        lr0=params['lr'],
+        momentum=params['momentum'],
+        weight_decay=params['weight_decay'],
+        warmup_epochs=params['warmup_epochs'],
+        hsv_h=params['hsv_h'],
+        hsv_s=params['hsv_s'],
+        hsv_v=params['hsv_v'],
+        degrees=params['degrees'],
+        fliplr=params['fliplr'],
+        mosaic=params['mosaic'],
+        patience=params['patience'],
+        conf=params['conf'],
+        iou=params['iou'],
+        workers=params['workers'],
+        name=params['name'],
+        save=True,
+        device=resolve_device(),
+        project=str(MODELS_DIR.absolute())
+    )
+
 @app.route('/')
 def index():
     """主页"""
     classes = load_classes()
 
     # 统计数据
-    train_images = list((DATASET_DIR / 'images' / 'train').glob('*.*'))
-    val_images = list((DATASET_DIR / 'images' / 'val').glob('*.*'))
-    train_labels = list((DATASET_DIR / 'labels' / 'train').glob('*.txt'))
-    val_labels = list((DATASET_DIR / 'labels' / 'val').glob('*.txt'))
-
+    catalog.scan_dataset(DATASET_DIR)
     stats = {
         'classes': len(classes),
-        'train_images': len(train_images),
-        'train_labeled': len(train_labels),
-        'val_images': len(val_images),
-        'val_labeled': len(val_labels)
+        **catalog.dataset_stats(DATASET_DIR)
     }
 
     available_models = get_available_models()
@@ -507,6 +689,20 @@ def index():
                         <input type="file" id="imageUpload" accept="image/*" onchange="loadSingleImage()">
                     </div>
                 </div>
+                <div class="form-row">
+                    <div class="form-group">
+                        <label>🤖 批量预标注（用模型为上面的文件夹生成建议标注，再逐张检查修正）</label>
+                        <select id="prelabelModel">
+                            {''.join([f'<option value="{m["path"]}">{m["name"]}</option>' for m in available_models])}
+                        </select>
+                        <div style="display: flex; gap: 10px; margin-top: 10px;">
+                            <input type="number" id="prelabelConf" value="0.25" step="0.05" min="0.05" max="0.95" style="width: 100px;">
+                            <button class="btn btn-secondary" onclick="startPrelabel()">开始预标注</button>
+                            <button class="btn btn-secondary" id="cancelPrelabelBtn" onclick="cancelPrelabel()" style="display: none;">⏹ 停止</button>
+                        </div>
+                        <div class="help-text" id="prelabelStatus">建议标注保存在暂存区，保存标注后才会写入数据集</div>
+                    </div>
+                </div>
                 <div id="imageListContainer" style="display: none; margin: 20px 0;">
                     <div class="section-title">图片列表 (<span id="imageCount">0</span> 张)</div>
                     <div style="display: flex; gap: 10px; margin-bottom: 10px;">
@@ -688,10 +884,23 @@ def index():
                         </div>
                     </div>
 
+                    <div class="form-row">
+                        <div class="form-group">
+                            <label>自动划分验证集比例</label>
+                            <input type="number" id="valRatio" value="0.2" min="0" max="0.9" step="0.05">
+                            <div class="help-text">训练前对所有已标注图片按类别分层重新划分，0表示使用标注时选择的 train/val</div>
+                        </div>
+                        <div class="form-group">
+                            <label>划分随机种子</label>
+                            <input type="number" id="splitSeed" value="0" min="0">
+                            <div class="help-text">种子相同则划分结果相同</div>
+                        </div>
+                    </div>
+
                     <div class="form-group">
                         <label>实验名称</label>
                         <input type="text" id="projectName" value="custom_model" placeholder="给你的模型起个名字">
-                        <div class="help-text">模型将保存在: models/runs/detect/实验名称/</div>
+                        <div class="help-text">模型将保存在: models/实验名称/（重名时自动加序号）</div>
                     </div>
                 </div>
 
@@ -703,9 +912,13 @@ def index():
                     训练日志将显示在这里...
                 </div>
 
+                <button class="btn" id="cancelTrainingBtn" onclick="cancelTraining()" style="display:none; width: 100%; margin-top: 10px; background: #e74c3c;">
+                    ⏹ 取消训练
+                </button>
+
                 <div class="path-box">
                     <strong>💾 模型保存位置:</strong><br>
-                    {MODELS_DIR.absolute()}/runs/detect/[实验名称]/weights/best.pt
+                    {MODELS_DIR.absolute()}/[实验名称]/weights/best.pt
                 </div>
             </div>
         </div>
@@ -746,6 +959,21 @@ def index():
                         <input type="number" id="testIou" value="0.45" min="0" max="1" step="0.05">
                         <div class="help-text">去重时的IoU阈值</div>
                     </div>
+                    <div class="form-group">
+                        <label>切片推理</label>
+                        <select id="testTiled">
+                            <option value="">关闭</option>
+                            {''.join([f'<option value="{m}">开启（{m.upper()} 合并）</option>' for m in MERGE_METHODS])}
+                        </select>
+                        <div class="help-text">超大图片（航拍、巡检）切成 {TILE_SIZE}px 重叠小块分别检测，小目标不再漏检，耗时随切片数增加</div>
+                    </div>
+                    <div class="form-group">
+                        <label>推理后端</label>
+                        <select id="testBackend">
+                            {''.join([f'<option value="{b}"{" selected" if b == INFER_BACKEND else ""}{"" if backend_available(b) else " disabled"}>{b}</option>' for b in BACKENDS])}
+                        </select>
+                        <div class="help-text">onnx / openvino 首次使用时自动导出，产物保存在权重文件旁</div>
+                    </div>
                 </div>
 
                 <button class="btn" onclick="testModel()" style="width: 100%;">🔍 开始检测</button>
@@ -753,10 +981,17 @@ def index():
                 <div id="testResult" style="margin-top: 20px;"></div>
                 <div id="testInfo" style="margin-top: 10px;"></div>
 
+                <div class="form-group" style="margin-top: 20px;">
+                    <label>模型优化（CPU 部署）</label>
+                    <div class="help-text">为所选的 .pt 模型生成 ONNX FP32 / FP16 / INT8（用验证集校准）版本，并在验证集上测量 mAP 和单张延迟；完成后各版本出现在模型列表中</div>
+                    <button class="btn" onclick="optimizeModel()" style="width: 100%; margin-top: 10px;">⚡ 生成优化版本</button>
+                    <pre id="optimizeOutput" style="display: none; margin-top: 10px; white-space: pre-wrap;"></pre>
+                </div>
+
                 <div class="path-box">
                     <strong>📂 可用模型位置:</strong><br>
                     • 预训练模型: 当前目录/yolov8*.pt<br>
-                    • 自定义模型: {MODELS_DIR.absolute()}/runs/detect/*/weights/*.pt
+                    • 自定义模型: {MODELS_DIR.absolute()}/*/weights/*.pt
                 </div>
             </div>
         </div>
@@ -770,9 +1005,15 @@ def index():
         let currentImage = null;
         let isDrawing = false;
         let startX, startY;
-        let imageList = [];
-        let currentImageIdx = -1;
+        // 文件夹模式只保留当前一页图片，翻页和跳转由服务端游标分页完成
+        const PAGE_SIZE = 200;
+        const PREVIEW_SIZE = 1280;
+        let imagePage = [];
+        let nextCursor = null;
+        let prevCursor = null;
+        let currentImageInfo = null;
         let isFolderMode = false;
+        let currentPrelabelJob = null;
 
         function switchTab(tabName) {{
             document.querySelectorAll('.tab-content').forEach(t => t.classList.remove('active'));
@@ -831,45 +1072,59 @@ def index():
             }}
         }}
 
+        async function folderRequest(url, params) {{
+            const response = await fetch(url, {{
+                method: 'POST',
+                headers: {{'Content-Type': 'application/json'}},
+                body: JSON.stringify({{
+                    folder_path: document.getElementById('folderPath').value.trim(),
+                    dataset_type: document.getElementById('datasetType').value,
+                    limit: PAGE_SIZE,
+                    ...params
+                }})
+            }});
+            if (!response.ok) {{
+                throw new Error((await response.json()).error || response.statusText);
+            }}
+            return response.json();
+        }}
+
+        function setImagePage(data) {{
+            imagePage = data.images;
+            nextCursor = data.next_cursor;
+            prevCursor = data.prev_cursor;
+            document.getElementById('imageCount').textContent = data.total;
+            document.getElementById('totalImages').textContent = data.total;
+        }}
+
         async function loadFolderImages() {{
             const folderPath = document.getElementById('folderPath').value.trim();
             if (!folderPath) {{
                 alert('请输入文件夹路径');
                 return;
             }}
-            const datasetType = document.getElementById('datasetType').value;
-            const response = await fetch('/api/folder-images', {{
-                method: 'POST',
-                headers: {{'Content-Type': 'application/json'}},
-                body: JSON.stringify({{
-                    folder_path: folderPath,
-                    dataset_type: datasetType
-                }})
-            }});
-            if (response.ok) {{
-                const data = await response.json();
-                imageList = data.images;
+            try {{
+                // 自动跳转到第一张未标注的图片，全部已标注时从第一张开始
+                let data = await folderRequest('/api/folder-images/next-unlabeled', {{}});
+                if (!data.found) {{
+                    data = await folderRequest('/api/folder-images', {{}});
+                }}
+                setImagePage(data);
                 isFolderMode = true;
                 document.getElementById('imageListContainer').style.display = 'block';
-                document.getElementById('imageCount').textContent = data.total;
-                document.getElementById('totalImages').textContent = data.total;
-
-                // 自动跳转到第一张未标注的图片
-                const firstUnlabeled = imageList.findIndex(img => !img.labeled);
-                currentImageIdx = firstUnlabeled >= 0 ? firstUnlabeled : 0;
-                loadImageAtIndex(currentImageIdx);
-            }} else {{
-                alert('加载文件夹失败');
+                if (imagePage.length > 0) {{
+                    loadImageInfo(imagePage[0]);
+                }}
+            }} catch (err) {{
+                alert('加载文件夹失败: ' + err.message);
             }}
         }}
 
-        function loadImageAtIndex(idx) {{
-            if (idx < 0 || idx >= imageList.length) return;
-            currentImageIdx = idx;
-            const imageInfo = imageList[idx];
+        function loadImageInfo(imageInfo) {{
+            currentImageInfo = imageInfo;
 
             // 更新UI
-            document.getElementById('currentImageIndex').textContent = idx + 1;
+            document.getElementById('currentImageIndex').textContent = imageInfo.index + 1;
             const statusEl = document.getElementById('labeledStatus');
             if (imageInfo.labeled) {{
                 statusEl.innerHTML = '<span style="color: green;">✓ 已标注</span>';
@@ -877,61 +1132,153 @@ def index():
                 statusEl.innerHTML = '<span style="color: orange;">⚠ 未标注</span>';
             }}
 
-            // 通过 API 加载图片
-            fetch('/api/load-image', {{
+            // 加载服务端缩小后的预览图（保持原图宽高比，标注按画布尺寸归一化）
+            const img = new Image();
+            img.onload = function() {{
+                if (currentImageInfo !== imageInfo) return;
+                canvas = document.getElementById('annotationCanvas');
+                ctx = canvas.getContext('2d');
+                const maxWidth = 800;
+                const maxHeight = 600;
+                let width = img.width;
+                let height = img.height;
+                if (width > maxWidth) {{
+                    height = height * (maxWidth / width);
+                    width = maxWidth;
+                }}
+                if (height > maxHeight) {{
+                    width = width * (maxHeight / height);
+                    height = maxHeight;
+                }}
+                canvas.width = width;
+                canvas.height = height;
+                ctx.drawImage(img, 0, 0, width, height);
+                currentImage = img;
+                annotations = [];
+                canvas.onmousedown = startDrawing;
+                canvas.onmousemove = draw;
+                canvas.onmouseup = stopDrawing;
+                loadExistingAnnotations(imageInfo);
+            }};
+            img.onerror = function() {{
+                alert('加载图片失败: ' + imageInfo.name);
+            }};
+            img.src = previewUrl(imageInfo);
+            prefetchNeighbours(imageInfo);
+        }}
+
+        async function loadExistingAnnotations(imageInfo) {{
+            // 显示已保存的标注；未标注时显示预标注建议，修正后保存即写入数据集
+            const params = new URLSearchParams({{
+                path: imageInfo.path,
+                dataset_type: document.getElementById('datasetType').value
+            }});
+            if (currentPrelabelJob) params.set('prelabel_job', currentPrelabelJob);
+            const data = await (await fetch('/api/annotations?' + params)).json();
+            if (currentImageInfo !== imageInfo || !data.boxes || data.boxes.length === 0) return;
+            annotations = data.boxes.map(b => ({{
+                classId: b.classId,
+                x: (b.x_center - b.width / 2) * canvas.width,
+                y: (b.y_center - b.height / 2) * canvas.height,
+                width: b.width * canvas.width,
+                height: b.height * canvas.height
+            }}));
+            drawAllAnnotations();
+            if (data.source === 'prelabel') {{
+                document.getElementById('labeledStatus').innerHTML =
+                    '<span style="color: #3498db;">🤖 预标注建议 ' + annotations.length + ' 个框，请检查后保存</span>';
+            }}
+        }}
+
+        async function startPrelabel() {{
+            const folderPath = document.getElementById('folderPath').value.trim();
+            if (!folderPath) {{
+                alert('请先输入图片文件夹路径');
+                return;
+            }}
+            const response = await fetch('/api/prelabel', {{
                 method: 'POST',
                 headers: {{'Content-Type': 'application/json'}},
-                body: JSON.stringify({{path: imageInfo.path}})
-            }})
-                .then(res => res.blob())
-                .then(blob => {{
-                    const reader = new FileReader();
-                    reader.onload = function(e) {{
-                        const img = new Image();
-                        img.onload = function() {{
-                            canvas = document.getElementById('annotationCanvas');
-                            ctx = canvas.getContext('2d');
-                            const maxWidth = 800;
-                            const maxHeight = 600;
-                            let width = img.width;
-                            let height = img.height;
-                            if (width > maxWidth) {{
-                                height = height * (maxWidth / width);
-                                width = maxWidth;
-                            }}
-                            if (height > maxHeight) {{
-                                width = width * (maxHeight / height);
-                                height = maxHeight;
-                            }}
-                            canvas.width = width;
-                            canvas.height = height;
-                            ctx.drawImage(img, 0, 0, width, height);
-                            currentImage = img;
-                            annotations = [];
-                            canvas.onmousedown = startDrawing;
-                            canvas.onmousemove = draw;
-                            canvas.onmouseup = stopDrawing;
-                        }};
-                        img.src = e.target.result;
-                    }};
-                    reader.readAsDataURL(blob);
+                body: JSON.stringify({{
+                    folder_path: folderPath,
+                    model_path: document.getElementById('prelabelModel').value,
+                    conf: parseFloat(document.getElementById('prelabelConf').value)
                 }})
-                .catch(err => {{
-                    alert('加载图片失败: ' + err);
-                }});
+            }});
+            const data = await response.json();
+            if (!data.success) {{
+                alert('预标注失败: ' + data.error);
+                return;
+            }}
+            watchPrelabelJob(data.job_id);
+        }}
+
+        function watchPrelabelJob(jobId) {{
+            const status = document.getElementById('prelabelStatus');
+            const cancelBtn = document.getElementById('cancelPrelabelBtn');
+            currentPrelabelJob = jobId;
+            cancelBtn.style.display = 'inline-block';
+
+            const source = new EventSource('/api/prelabel/jobs/' + jobId + '/events');
+            source.onmessage = function(e) {{
+                const ev = JSON.parse(e.data);
+                if (ev.event === 'progress') {{
+                    const p = ev.data;
+                    status.textContent = '预标注进度: ' + p.done + '/' + p.total + '，' + p.boxes + ' 个框' +
+                        (p.imgs_per_sec ? '，' + p.imgs_per_sec + ' 张/秒' : '') +
+                        (p.errors ? '，' + p.errors + ' 张失败' : '');
+                }} else if (ev.message) {{
+                    status.textContent = ev.message;
+                }}
+                if (['completed', 'failed', 'cancelled', 'interrupted'].includes(ev.status)) {{
+                    source.close();
+                    cancelBtn.style.display = 'none';
+                    // 刷新当前图片以显示建议标注
+                    if (isFolderMode && currentImageInfo) loadExistingAnnotations(currentImageInfo);
+                }}
+            }};
         }}
 
-        function nextImage() {{
-            if (currentImageIdx < imageList.length - 1) {{
-                loadImageAtIndex(currentImageIdx + 1);
+        async function cancelPrelabel() {{
+            if (!currentPrelabelJob) return;
+            await fetch('/api/prelabel/jobs/' + currentPrelabelJob + '/cancel', {{method: 'POST'}});
+        }}
+
+        function previewUrl(imageInfo) {{
+            return '/api/preview?path=' + encodeURIComponent(imageInfo.path) +
+                '&max=' + PREVIEW_SIZE + '&v=' + imageInfo.mtime;
+        }}
+
+        function prefetchNeighbours(imageInfo) {{
+            // 预取前后相邻图片的预览，翻页时直接从浏览器缓存读取
+            const pos = imagePage.indexOf(imageInfo);
+            for (const offset of [1, -1, 2]) {{
+                const neighbour = imagePage[pos + offset];
+                if (pos >= 0 && neighbour) {{
+                    new Image().src = previewUrl(neighbour);
+                }}
+            }}
+        }}
+
+        async function nextImage() {{
+            const pos = imagePage.indexOf(currentImageInfo);
+            if (pos >= 0 && pos < imagePage.length - 1) {{
+                loadImageInfo(imagePage[pos + 1]);
+            }} else if (nextCursor) {{
+                setImagePage(await folderRequest('/api/folder-images', {{cursor: nextCursor}}));
+                loadImageInfo(imagePage[0]);
             }} else {{
                 alert('已经是最后一张图片了');
             }}
         }}
 
-        function previousImage() {{
-            if (currentImageIdx > 0) {{
-                loadImageAtIndex(currentImageIdx - 1);
+        async function previousImage() {{
+            const pos = imagePage.indexOf(currentImageInfo);
+            if (pos > 0) {{
+                loadImageInfo(imagePage[pos - 1]);
+            }} else if (prevCursor) {{
+                setImagePage(await folderRequest('/api/folder-images', {{cursor: prevCursor, direction: 'prev'}}));
+                loadImageInfo(imagePage[imagePage.length - 1]);
             }} else {{
                 alert('已经是第一张图片了');
             }}
@@ -1044,67 +1391,54 @@ def index():
             }}
 
             const datasetType = document.getElementById('datasetType').value;
-            const formData = new FormData();
+            let saveResponse;
 
             if (isFolderMode) {{
-                // 文件夹模式：通过 API 读取文件
-                const currentImageInfo = imageList[currentImageIdx];
-                const response = await fetch('/api/load-image', {{
+                // 文件夹模式：图片已在服务器上，只提交路径和标注
+                saveResponse = await fetch('/api/save-annotation', {{
                     method: 'POST',
                     headers: {{'Content-Type': 'application/json'}},
-                    body: JSON.stringify({{path: currentImageInfo.path}})
+                    body: JSON.stringify({{
+                        source_path: currentImageInfo.path,
+                        dataset_type: datasetType,
+                        annotations: annotations,
+                        image_width: canvas.width,
+                        image_height: canvas.height
+                    }})
                 }});
-                const blob = await response.blob();
-                formData.append('image', blob, currentImageInfo.name);
             }} else {{
                 // 单文件模式
-                const file = document.getElementById('imageUpload').files[0];
-                formData.append('image', file);
+                const formData = new FormData();
+                formData.append('image', document.getElementById('imageUpload').files[0]);
+                formData.append('dataset_type', datasetType);
+                formData.append('annotations', JSON.stringify(annotations));
+                formData.append('image_width', canvas.width);
+                formData.append('image_height', canvas.height);
+                saveResponse = await fetch('/api/save-annotation', {{
+                    method: 'POST',
+                    body: formData
+                }});
             }}
 
-            formData.append('dataset_type', datasetType);
-            formData.append('annotations', JSON.stringify(annotations));
-            formData.append('image_width', canvas.width);
-            formData.append('image_height', canvas.height);
-
-            const saveResponse = await fetch('/api/save-annotation', {{
-                method: 'POST',
-                body: formData
-            }});
-
             if (saveResponse.ok) {{
                 alert('标注保存成功！');
                 annotations = [];
 
                 if (isFolderMode) {{
                     // 更新当前图片的标注状态
-                    imageList[currentImageIdx].labeled = true;
-
-                    // 自动跳转到下一张未标注的图片
-                    let nextUnlabeledIdx = -1;
-                    for (let i = currentImageIdx + 1; i < imageList.length; i++) {{
-                        if (!imageList[i].labeled) {{
-                            nextUnlabeledIdx = i;
-                            break;
-                        }}
-                    }}
-
-                    if (nextUnlabeledIdx === -1) {{
-                        // 如果后面没有未标注的，从头找
-                        for (let i = 0; i < currentImageIdx; i++) {{
-                            if (!imageList[i].labeled) {{
-                                nextUnlabeledIdx = i;
-                                break;
-                            }}
-                        }}
-                    }}
-
-                    if (nextUnlabeledIdx !== -1) {{
-                        loadImageAtIndex(nextUnlabeledIdx);
+                    currentImageInfo.labeled = true;
+
+                    // 自动跳转到下一张未标注的图片（后面没有时服务端从头查找）
+                    const data = await folderRequest('/api/folder-images/next-unlabeled', {{
+                        cursor: currentImageInfo.cursor
+                    }});
+                    if (data.found) {{
+                        setImagePage(data);
+                        loadImageInfo(imagePage[0]);
                     }} else {{
                         alert('恭喜！所有图片都已标注完成！');
                         // 重新加载当前图片以显示已标注状态
-                        loadImageAtIndex(currentImageIdx);
+                        loadImageInfo(currentImageInfo);
                     }}
                 }} else {{
                     location.reload();
@@ -1140,6 +1474,8 @@ def index():
                 conf: parseFloat(document.getElementById('confThresh').value),
                 iou: parseFloat(document.getElementById('iouThresh').value),
                 workers: parseInt(document.getElementById('workers').value),
+                val_ratio: parseFloat(document.getElementById('valRatio').value) || 0,
+                split_seed: parseInt(document.getElementById('splitSeed').value) || 0,
                 name: document.getElementById('projectName').value || 'custom_model'
             }};
 
@@ -1155,11 +1491,79 @@ def index():
             if (response.ok) {{
                 const data = await response.json();
                 document.getElementById('trainingOutput').textContent += '\\n\\n' + data.message;
+                watchTrainingJob(data.job_id);
             }} else {{
                 document.getElementById('trainingOutput').textContent += '\\n\\n训练失败！';
             }}
         }}
 
+        let currentTrainingJob = null;
+
+        function watchTrainingJob(jobId) {{
+            const output = document.getElementById('trainingOutput');
+            const cancelBtn = document.getElementById('cancelTrainingBtn');
+            currentTrainingJob = jobId;
+            cancelBtn.style.display = 'block';
+
+            const source = new EventSource('/api/train/jobs/' + jobId + '/events');
+            source.onmessage = function(e) {{
+                const ev = JSON.parse(e.data);
+                if (ev.event === 'epoch') {{
+                    const m = ev.data;
+                    const loss = Object.entries(m.loss).map(([k, v]) => k + '=' + v).join(' ');
+                    output.textContent += '\\nEpoch ' + m.epoch + '/' + m.epochs + '  ' + loss +
+                        '  mAP50=' + m.mAP50 + '  mAP50-95=' + m.mAP50_95 +
+                        '  ' + m.epoch_time + 's  ' + m.imgs_per_sec + ' img/s';
+                }} else if (ev.message) {{
+                    output.textContent += '\\n[' + ev.event + '] ' + ev.message;
+                }}
+                output.scrollTop = output.scrollHeight;
+
+                if (['completed', 'failed', 'cancelled'].includes(ev.event)) {{
+                    source.close();
+                    cancelBtn.style.display = 'none';
+                    currentTrainingJob = null;
+                }}
+            }};
+        }}
+
+        async function optimizeModel() {{
+            const modelPath = document.getElementById('testModelSelect').value;
+            if (!modelPath || !modelPath.endsWith('.pt')) {{
+                alert('请选择一个 .pt 模型');
+                return;
+            }}
+            const output = document.getElementById('optimizeOutput');
+            output.style.display = 'block';
+            output.textContent = '提交优化任务...';
+
+            const response = await fetch('/api/models/optimize', {{
+                method: 'POST',
+                headers: {{'Content-Type': 'application/json'}},
+                body: JSON.stringify({{model_path: modelPath}})
+            }});
+            const result = await response.json();
+            if (!result.success) {{
+                output.textContent = '优化失败: ' + result.error;
+                return;
+            }}
+
+            const source = new EventSource('/api/models/optimize/' + result.job_id + '/events');
+            source.onmessage = function(e) {{
+                const ev = JSON.parse(e.data);
+                if (ev.message) output.textContent += '\\n[' + ev.event + '] ' + ev.message;
+                if (['completed', 'failed'].includes(ev.event)) {{
+                    source.close();
+                    if (ev.event === 'completed') output.textContent += '\\n刷新页面后可在模型列表中选择优化版本';
+                }}
+            }};
+        }}
+
+        async function cancelTraining() {{
+            if (!currentTrainingJob || !confirm('确定要取消当前训练吗？')) return;
+            await fetch('/api/train/jobs/' + currentTrainingJob + '/cancel', {{method: 'POST'}});
+        }}
+
         async function testModel() {{
             const modelPath = document.getElementById('testModelSelect').value;
             const file = document.getElementById('testImage').files[0];
@@ -1178,6 +1582,12 @@ def index():
             formData.append('model_path', modelPath);
             formData.append('conf', document.getElementById('testConf').value);
             formData.append('iou', document.getElementById('testIou').value);
+            formData.append('backend', document.getElementById('testBackend').value);
+            const tileMerge = document.getElementById('testTiled').value;
+            if (tileMerge) {{
+                formData.append('tiled', '1');
+                formData.append('tile_merge', tileMerge);
+            }}
 
             document.getElementById('testResult').innerHTML = '<p>检测中...</p>';
 
@@ -1217,91 +1627,445 @@ def add_class():
     save_classes(classes)
     return jsonify({'success': True, 'classes': classes})
 
+def annotation_lines(annotations, img_width, img_height):
+    """画布坐标的标注框（x, y, width, height）转为 YOLO 格式的标注行"""
+    lines = []
+    for ann in annotations:
+        x_center = (ann['x'] + ann['width'] / 2) / img_width
+        y_center = (ann['y'] + ann['height'] / 2) / img_height
+        width = ann['width'] / img_width
+        height = ann['height'] / img_height
+        lines.append(f"{ann['classId']} {x_center} {y_center} {width} {height}\n")
+    return lines
+
+def normalized_lines(boxes):
+    """归一化的标注框（x_center, y_center, width, height）转为 YOLO 格式的标注行"""
+    return [
+        f"{int(b['classId'])} {float(b['x_center'])} {float(b['y_center'])} {float(b['width'])} {float(b['height'])}\n"
+        for b in boxes
+    ]
+
+def write_label(image_filename, dataset_type, lines):
+    """原子写入图片对应的标注文件，返回标注文件路径"""
+    label_path = DATASET_DIR / 'labels' / dataset_type / (Path(image_filename).stem + '.txt')
+    write_text_atomic(label_path, ''.join(lines))
+    return label_path
+
+def save_annotation_item(item):
+    """
+    保存一条批量导入的标注
+
+    item: source_path、dataset_type，以及 boxes（归一化坐标）或
+    annotations + image_width + image_height（画布坐标，与单张保存相同）
+    返回 (图片路径, 标注路径, 状态)
+    """
+    dataset_type = item.get('dataset_type', 'train')
+    if dataset_type not in SPLITS:
+        raise ValueError(f'无效的数据集类型: {dataset_type}')
+    source = Path(item['source_path'])
+    if not source.is_file() or source.suffix.lower() not in IMAGE_EXTENSIONS:
+        raise FileNotFoundError(f'图片文件不存在: {source}')
+
+    if 'boxes' in item:
+        lines = normalized_lines(item['boxes'])
+    else:
+        lines = annotation_lines(item['annotations'], float(item['image_width']), float(item['image_height']))
+
+    filename = secure_filename(source.name)
+    img_path = DATASET_DIR / 'images' / dataset_type / filename
+    method = materialize_file(source, img_path)
+    label_path = write_label(filename, dataset_type, lines)
+    return img_path, label_path, {'image': filename, 'method': method, 'boxes': len(lines)}
+
 @app.route('/api/save-annotation', methods=['POST'])
 def save_annotation():
-    """保存标注"""
+    """
+    保存标注
+
+    两种方式：
+    - multipart 上传图片文件 image（单张上传模式）
+    - source_path 指定服务器上已有的图片（文件夹模式），可用 JSON 提交，
+      图片在服务器端以硬链接 / reflink / 复制放入数据集，无需重新上传
+    """
     try:
-        file = request.files['image']
-        dataset_type = request.form['dataset_type']
-        annotations = json.loads(request.form['annotations'])
-        img_width = float(request.form['image_width'])
-        img_height = float(request.form['image_height'])
-
-        filename = secure_filename(file.filename)
-        img_path = DATASET_DIR / 'images' / dataset_type / filename
-        file.save(str(img_path))
-
-        label_filename = Path(filename).stem + '.txt'
-        label_path = DATASET_DIR / 'labels' / dataset_type / label_filename
-
-        with open(label_path, 'w') as f:
-            for ann in annotations:
-                x_center = (ann['x'] + ann['width'] / 2) / img_width
-                y_center = (ann['y'] + ann['height'] / 2) / img_height
-                width = ann['width'] / img_width
-                height = ann['height'] / img_height
-                f.write(f"{ann['classId']} {x_center} {y_center} {width} {height}\n")
-
-        return jsonify({'success': True})
+        data = request.json if request.is_json else request.form
+        dataset_type = data['dataset_type']
+        if dataset_type not in SPLITS:
+            return jsonify({'success': False, 'error': f'无效的数据集类型: {dataset_type}'}), 400
+        annotations = data['annotations']
+        if isinstance(annotations, str):
+            annotations = json.loads(annotations)
+        img_width = float(data['image_width'])
+        img_height = float(data['image_height'])
+
+        method = 'upload'
+        source_path = data.get('source_path')
+        if source_path:
+            source = Path(source_path)
+            if not source.is_file() or source.suffix.lower() not in IMAGE_EXTENSIONS:
+                return jsonify({'success': False, 'error': '图片文件不存在'}), 400
+            filename = secure_filename(source.name)
+            img_path = DATASET_DIR / 'images' / dataset_type / filename
+            method = materialize_file(source, img_path)
+        else:
+            file = request.files['image']
+            filename = secure_filename(file.filename)
+            img_path = DATASET_DIR / 'images' / dataset_type / filename
+            file.save(str(img_path))
+
+        label_path = write_label(filename, dataset_type, annotation_lines(annotations, img_width, img_height))
+
+        catalog.record_image(img_path)
+        catalog.record_label(label_path)
+        dataset_compiler.invalidate([img_path])
+
+        return jsonify({'success': True, 'method': method})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/save-annotations/bulk', methods=['POST'])
+def save_annotations_bulk():
+    """
+    批量保存标注（NDJSON）
+
+    请求体每行一个 JSON 对象，字段同 save_annotation_item()；边读边处理，
+    多线程并发放置图片和原子写入标注文件。
+    返回 NDJSON 流：每行一条处理结果（line 为请求中的行号，按完成顺序），最后一行为汇总
+    """
+    def process(line):
+        try:
+            img_path, label_path, status = save_annotation_item(json.loads(line))
+            return img_path, label_path, {'success': True, **status}
+        except Exception as e:
+            return None, None, {'success': False, 'error': str(e)}
+
+    def generate():
+        started = time.time()
+        saved = failed = 0
+        images, labels = [], []
+        inflight = {}
+
+        def collect(futures):
+            nonlocal saved, failed
+            for future in futures:
+                line_no = inflight.pop(future)
+                img_path, label_path, status = future.result()
+                if status['success']:
+                    saved += 1
+                    images.append(img_path)
+                    labels.append(label_path)
+                else:
+                    failed += 1
+                yield json.dumps({'line': line_no, **status}, ensure_ascii=False) + '\n'
+            # 索引分批登记，每批一个事务
+            if len(labels) >= 500:
+                catalog.record_images(images)
+                catalog.record_labels(labels)
+                dataset_compiler.invalidate(images)
+                images.clear()
+                labels.clear()
+
+        with ThreadPoolExecutor(max_workers=BULK_SAVE_WORKERS, thread_name_prefix='bulk-save') as pool:
+            for line_no, line in enumerate(request.stream, 1):
+                if not line.strip():
+                    continue
+                inflight[pool.submit(process, line)] = line_no
+                # 限制排队数量，避免一次读入整个请求
+                if len(inflight) >= BULK_SAVE_WORKERS * 4:
+                    done, _ = wait(list(inflight), return_when=FIRST_COMPLETED)
+                    yield from collect(done)
+            yield from collect(list(inflight))
+
+        catalog.record_images(images)
+        catalog.record_labels(labels)
+        dataset_compiler.invalidate(images)
+        yield json.dumps({
+            'done': True,
+            'saved': saved,
+            'failed': failed,
+            'elapsed': round(time.time() - started, 3)
+        }, ensure_ascii=False) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/api/train', methods=['POST'])
 def train_model():
-    """开始训练"""
+    """提交训练任务（在后台进程中执行，立即返回任务ID）"""
     try:
         params = request.json
-        classes = load_classes()
-
-        data_yaml = {
-            'path': str(DATASET_DIR.absolute()),
-            'train': 'images/train',
-            'val': 'images/val',
-            'nc': len(classes),
-            'names': classes
-        }
-
-        data_yaml_path = DATASET_DIR / 'data.yaml'
-        with open(data_yaml_path, 'w', encoding='utf-8') as f:
-            yaml.dump(data_yaml, f, allow_unicode=True)
-
-        model = YOLO(params['model'])
-
-        # 使用所有参数进行训练
-        results = model.train(
-            data=str(data_yaml_path),
-            epochs=params['epochs'],
-            batch=params['batch'],
-            imgsz=params['imgsz'],
-            lr0=params['lr'],
-            momentum=params['momentum'],
-            weight_decay=params['weight_decay'],
-            warmup_epochs=params['warmup_epochs'],
-            hsv_h=params['hsv_h'],
-            hsv_s=params['hsv_s'],
-            hsv_v=params['hsv_v'],
-            degrees=params['degrees'],
-            fliplr=params['fliplr'],
-            mosaic=params['mosaic'],
-            patience=params['patience'],
-            conf=params['conf'],
-            iou=params['iou'],
-            workers=params['workers'],
-            name=params['name'],
-            save=True,
-            device='cpu',
-            project=str(MODELS_DIR)
-        )
-
-        model_path = MODELS_DIR / 'runs' / 'detect' / params['name'] / 'weights' / 'best.pt'
+        # 先准备数据集，问题在提交前暴露
+        try:
+            data_yaml_path, report = prepare_dataset(params)
+        except DatasetNotReady as e:
+            return jsonify({'success': False, 'error': str(e), 'dataset': e.report}), 400
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        # 提交时确定输出目录并保存 data.yaml 快照：之后的训练会改写数据集下的 data.yaml，
+        # 模型优化时的 INT8 校准和精度评估要用训练这份权重时的数据集
+        run_dir = increment_path(MODELS_DIR.absolute() / params['name'], mkdir=True)
+        data_yaml_path = Path(shutil.copy2(data_yaml_path, run_dir / 'data.yaml'))
+        train_args = {**build_train_args({**params, 'name': run_dir.name}, data_yaml_path), 'exist_ok': True}
+        job = training_jobs.submit(params['name'], params['model'], train_args,
+                                   threads=threads_per_worker(MAX_CONCURRENT_JOBS))
 
         return jsonify({
             'success': True,
-            'message': f'训练完成！\n模型保存在: {model_path}'
+            'job_id': job.id,
+            'status': job.status,
+            'message': f'训练任务已提交，任务ID: {job.id}',
+            'dataset_warnings': report['warnings']
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/train/jobs', methods=['GET'])
+def list_training_jobs():
+    """列出所有训练任务"""
+    return jsonify({'jobs': training_jobs.list()})
+
+@app.route('/api/train/jobs/<job_id>', methods=['GET'])
+def get_training_job(job_id):
+    """查询训练任务状态及逐轮指标"""
+    job = training_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': '任务不存在'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/train/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_training_job(job_id):
+    """取消训练任务"""
+    if training_jobs.get(job_id) is None:
+        return jsonify({'success': False, 'error': '任务不存在'}), 404
+    if not training_jobs.cancel(job_id):
+        return jsonify({'success': False, 'error': '任务已结束'}), 400
+    return jsonify({'success': True})
+
+@app.route('/api/train/jobs/<job_id>/events', methods=['GET'])
+def stream_training_job(job_id):
+    """以 Server-Sent Events 推送训练进度"""
+    if training_jobs.get(job_id) is None:
+        return jsonify({'success': False, 'error': '任务不存在'}), 404
+    return Response(
+        training_jobs.stream(job_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/sweeps', methods=['GET', 'POST'])
+def sweep_jobs():
+    """
+    提交超参数搜索（POST）或列出所有搜索（GET）
+
+    参数: name, params（基础训练参数，同 /api/train，缺省取页面默认值）,
+    space（{参数: {"values": [...]} 或 {"min", "max", "log", "type"}}）,
+    strategy（grid / random / asha）, max_trials, metric（mAP50_95 / mAP50）,
+    min_epochs, eta, early_stopping, seed
+    """
+    if request.method == 'GET':
+        return jsonify({'sweeps': sweeps.list(), 'concurrency': sweeps.concurrency,
+                        'threads_per_trial': sweeps.threads_per_trial})
+    try:
+        data = request.json
+        params = {**TRAIN_DEFAULTS, **data.get('params', {})}
+        name = data.get('name') or f"sweep_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        try:
+            # 每个搜索使用独立的划分目录和 data.yaml
+            work_dir = dataset_compiler.out_dir / 'sweeps' / f"{secure_filename(name) or 'sweep'}_{uuid.uuid4().hex[:8]}"
+            data_yaml_path, _ = prepare_dataset(params, work_dir)
+            sweep = sweeps.submit(
+                name,
+                params['model'],
+                build_train_args({**params, 'name': name}, data_yaml_path),
+                data['space'],
+                strategy=data.get('strategy', 'random'),
+                max_trials=int(data.get('max_trials', 8)),
+                metric=data.get('metric', 'mAP50_95'),
+                min_epochs=int(data.get('min_epochs', 1)),
+                eta=int(data.get('eta', 3)),
+                early_stopping=bool(data.get('early_stopping', True)),
+                seed=int(data.get('seed', 0))
+            )
+        except (KeyError, ValueError) as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        return jsonify({'success': True, 'sweep_id': sweep.id, 'sweep': sweep.to_dict()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/sweeps/<sweep_id>', methods=['GET'])
+def get_sweep(sweep_id):
+    """查询搜索状态和排行榜（按最佳指标排序，含各试验的权重路径）"""
+    sweep = sweeps.get(sweep_id)
+    if sweep is None:
+        return jsonify({'success': False, 'error': '搜索不存在'}), 404
+    return jsonify(sweep.to_dict())
+
+@app.route('/api/sweeps/<sweep_id>/cancel', methods=['POST'])
+def cancel_sweep(sweep_id):
+    """取消搜索（已完成的试验保留）"""
+    if sweeps.get(sweep_id) is None:
+        return jsonify({'success': False, 'error': '搜索不存在'}), 404
+    if not sweeps.cancel(sweep_id):
+        return jsonify({'success': False, 'error': '搜索已结束'}), 400
+    return jsonify({'success': True})
+
+@app.route('/api/sweeps/<sweep_id>/events', methods=['GET'])
+def stream_sweep(sweep_id):
+    """以 Server-Sent Events 推送搜索进度"""
+    if sweeps.get(sweep_id) is None:
+        return jsonify({'success': False, 'error': '搜索不存在'}), 404
+    return Response(
+        sweeps.stream(sweep_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/models/optimize', methods=['GET', 'POST'])
+def optimize_models():
+    """
+    提交模型优化（POST）或列出所有优化任务（GET）
+
+    参数: model_path（.pt 权重）, backends（默认 ["onnx"]，可选 openvino）,
+    precisions（默认 fp32 / fp16 / int8）, imgsz, data（data.yaml，缺省取训练时使用的数据集，
+    没有时使用当前数据集）
+    """
+    if request.method == 'GET':
+        return jsonify({'jobs': optimize_jobs.list()})
+    try:
+        data = request.json
+        model_path = data.get('model_path', '')
+        if model_path not in [m['path'] for m in get_available_models() if m['type'] != 'optimized']:
+            return jsonify({'success': False, 'error': f'模型不存在: {model_path}'}), 400
+        try:
+            data_yaml = data.get('data') or training_data(model_path)
+            if not data_yaml:
+                data_yaml, _ = prepare_dataset({})
+            job = optimize_jobs.submit(
+                model_path,
+                data_yaml,
+                backends=data.get('backends', ['onnx']),
+                precisions=data.get('precisions', list(PRECISIONS)),
+                imgsz=int(data.get('imgsz', 640))
+            )
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        return jsonify({'success': True, 'job_id': job.id, 'job': job.to_dict()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/models/optimize/<job_id>', methods=['GET'])
+def get_optimize_job(job_id):
+    """查询优化任务（完成后含精度 - 延迟报告）"""
+    job = optimize_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': '任务不存在'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/models/optimize/<job_id>/events', methods=['GET'])
+def stream_optimize_job(job_id):
+    """以 Server-Sent Events 推送优化进度（每完成一个版本一条事件）"""
+    if optimize_jobs.get(job_id) is None:
+        return jsonify({'success': False, 'error': '任务不存在'}), 404
+    return Response(
+        optimize_jobs.stream(job_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/prelabel', methods=['POST'])
+def start_prelabel():
+    """
+    提交批量预标注任务
+
+    参数: folder_path, model_path, conf, iou, batch_size
+    """
+    try:
+        data = request.json
+        folder_path = Path(data['folder_path'])
+        if not folder_path.is_dir():
+            return jsonify({'success': False, 'error': '文件夹不存在'}), 400
+        model_path = data.get('model_path', 'yolov8n.pt')
+        if model_path not in [m['path'] for m in get_available_models()]:
+            return jsonify({'success': False, 'error': f'模型不存在: {model_path}'}), 400
+
+        job = prelabel_jobs.submit(
+            folder_path.absolute(),
+            model_path,
+            conf=float(data.get('conf', 0.25)),
+            iou=float(data.get('iou', 0.45)),
+            batch_size=int(data.get('batch_size', 8))
+        )
+        return jsonify({'success': True, 'job_id': job.id, 'job': job.to_dict()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/prelabel/jobs', methods=['GET'])
+def list_prelabel_jobs():
+    """列出所有预标注任务"""
+    return jsonify({'jobs': prelabel_jobs.list()})
+
+@app.route('/api/prelabel/jobs/<job_id>', methods=['GET'])
+def get_prelabel_job(job_id):
+    """查询预标注任务进度"""
+    job = prelabel_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': '任务不存在'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/prelabel/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_prelabel_job(job_id):
+    """取消预标注任务（已生成的建议标注保留）"""
+    if prelabel_jobs.get(job_id) is None:
+        return jsonify({'success': False, 'error': '任务不存在'}), 404
+    if not prelabel_jobs.cancel(job_id):
+        return jsonify({'success': False, 'error': '任务已结束'}), 400
+    return jsonify({'success': True})
+
+@app.route('/api/prelabel/jobs/<job_id>/resume', methods=['POST'])
+def resume_prelabel_job(job_id):
+    """继续执行中断、取消或失败的预标注任务，跳过已处理的图片"""
+    if prelabel_jobs.get(job_id) is None:
+        return jsonify({'success': False, 'error': '任务不存在'}), 404
+    if not prelabel_jobs.resume(job_id):
+        return jsonify({'success': False, 'error': '任务正在运行或已完成'}), 400
+    return jsonify({'success': True})
+
+@app.route('/api/prelabel/jobs/<job_id>/events', methods=['GET'])
+def stream_prelabel_job(job_id):
+    """以 Server-Sent Events 推送预标注进度"""
+    if prelabel_jobs.get(job_id) is None:
+        return jsonify({'success': False, 'error': '任务不存在'}), 404
+    return Response(
+        prelabel_jobs.stream(job_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/annotations', methods=['GET'])
+def get_annotations():
+    """
+    读取图片已有的标注
+
+    优先返回数据集中已保存的标注；没有时返回预标注任务的建议标注
+    （prelabel_job 指定任务，默认使用该图片所在文件夹最近一次的任务）。
+    框坐标为归一化的中心点和宽高
+    """
+    image_path = Path(request.args.get('path', ''))
+    dataset_type = request.args.get('dataset_type', 'train')
+    if dataset_type not in SPLITS:
+        return jsonify({'success': False, 'error': f'无效的数据集类型: {dataset_type}'}), 400
+
+    label_path = DATASET_DIR / 'labels' / dataset_type / f'{image_path.stem}.txt'
+    if label_path.exists():
+        return jsonify({'success': True, 'source': 'dataset', 'boxes': read_yolo_label(label_path)})
+
+    job_id = request.args.get('prelabel_job')
+    job = prelabel_jobs.get(job_id) if job_id else prelabel_jobs.latest_for_folder(image_path.parent)
+    staged = job.label_path(image_path) if job else None
+    if staged is not None:
+        return jsonify({'success': True, 'source': 'prelabel', 'job_id': job.id, 'boxes': read_yolo_label(staged)})
+    return jsonify({'success': True, 'source': None, 'boxes': []})
+
 @app.route('/api/test', methods=['POST'])
 def test_model():
     """测试模型"""
@@ -1310,22 +2074,62 @@ def test_model():
         model_path = request.form.get('model_path', 'yolov8n.pt')
         conf = float(request.form.get('conf', 0.25))
         iou = float(request.form.get('iou', 0.45))
-
-        image = Image.open(file.stream).convert('RGB')
-
-        model = YOLO(model_path)
-        results = model.predict(image, conf=conf, iou=iou, verbose=False)[0]
+        backend = request.form.get('backend') or INFER_BACKEND
+        if backend not in BACKENDS:
+            return f"不支持的推理后端: {backend}", 400
+        # 切片推理：大图切成重叠小块分别检测后合并
+        tiling = None
+        if request.form.get('tiled', '').lower() in ('1', 'true', 'on'):
+            try:
+                tiling = Tiling(
+                    request.form.get('tile_size', TILE_SIZE),
+                    request.form.get('tile_overlap', TILE_OVERLAP),
+                    request.form.get('tile_merge', TILE_MERGE)
+                )
+            except ValueError as e:
+                return str(e), 400
+        # onnx / openvino 后端使用导出的模型（首次使用时导出）
+        model_path = resolve_model(model_path, backend)
+
+        elapsed('read')
+        with stage('read'):
+            contents = file.read()
+        with stage('cache'):
+            key = result_cache.make_key(contents, model_path, conf, iou, tiling and tiling.key)
+            entry = result_cache.get(key) if result_cache.enabled else None
+        cached = entry is not None
+
+        if entry is None:
+            # 大图按缩小尺寸解码，检测框换算回原图坐标（切片推理需要原尺寸）
+            with stage('decode'):
+                image = decode_image(contents, fast=FAST_DECODE and tiling is None)
+
+            # 从模型注册表获取已加载的模型，重复测试同一模型无需重新加载
+            with stage('predict'), registry.using(model_path) as model:
+                if tiling is not None:
+                    results = predict_tiled(model, image.array, conf, iou, tiling)
+                else:
+                    results = restore_results(model.predict(image.array, conf=conf, iou=iou, verbose=False)[0], image)
+            with stage('cache'):
+                entry = result_cache.put(key, CachedDetections.from_results(results))
+        else:
+            results = None
 
         # 统计检测结果
-        num_detections = len(results.boxes)
+        num_detections = len(entry.data)
         detection_info = f'检测到 {num_detections} 个物体'
 
-        annotated_img = results.plot()
-        _, buffer = cv2.imencode('.jpg', annotated_img)
-        img_bytes = io.BytesIO(buffer.tobytes())
+        if entry.annotated is None:
+            if results is None:
+                with stage('decode'):
+                    image = decode_image(contents)
+                results = entry.to_results(image.array)
+            result_cache.attach(entry, render_results(results))
+        img_bytes = io.BytesIO(entry.annotated)
 
-        response = send_file(img_bytes, mimetype='image/jpeg')
+        response = send_file(img_bytes, mimetype=RENDER_MEDIA_TYPE)
         response.headers['X-Detection-Info'] = detection_info
+        response.headers['X-Cache'] = 'HIT' if cached else 'MISS'
         return response
     except Exception as e:
         return str(e), 500
@@ -1335,6 +2139,20 @@ def list_models():
     """列出所有可用模型"""
     return jsonify({'models': get_available_models()})
 
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    """模型缓存、测试结果缓存和预览图缓存的统计信息"""
+    return jsonify({
+        'model_cache': registry.stats(),
+        'result_cache': result_cache.stats(),
+        'preview_cache': previews.stats()
+    })
+
+@app.route('/api/runtime', methods=['GET'])
+def get_runtime():
+    """当前进程实际生效的设备、线程数和 CPU 亲和性"""
+    return jsonify(runtime_report())
+
 @app.route('/api/dataset-path', methods=['GET'])
 def get_dataset_path():
     """获取当前数据集路径"""
@@ -1343,7 +2161,7 @@ def get_dataset_path():
 @app.route('/api/dataset-path', methods=['POST'])
 def set_dataset_path():
     """设置数据集路径"""
-    global DATASET_DIR
+    global DATASET_DIR, dataset_compiler, dataset_splitter
     try:
         data = request.json
         new_path = Path(data['path'])
@@ -1351,6 +2169,9 @@ def set_dataset_path():
         # 确保目录结构
         DATASET_DIR = ensure_dataset_structure(new_path)
         save_dataset_config(DATASET_DIR)
+        # 编译结果和自动划分跟随数据集目录，否则会继续编译和引用旧数据集的清单
+        dataset_compiler = DatasetCompiler(DATASET_DIR)
+        dataset_splitter = DatasetSplitter(dataset_compiler.out_dir / 'split')
 
         return jsonify({
             'success': True,
@@ -1359,37 +2180,196 @@ def set_dataset_path():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def folder_query(data):
+    """解析图片列表请求中的文件夹、排序和分页参数，并增量刷新索引"""
+    folder_path = Path(data['folder_path'])
+    if not folder_path.exists() or not folder_path.is_dir():
+        raise FileNotFoundError('文件夹不存在')
+    dataset_type = data.get('dataset_type', 'train')
+    if dataset_type not in SPLITS:
+        raise ValueError(f'无效的数据集类型: {dataset_type}')
+
+    # 目录未变化时直接使用索引，标注状态通过与标注目录的索引关联得到
+    label_folder = DATASET_DIR / 'labels' / dataset_type
+    catalog.scan_folder(folder_path)
+    catalog.scan_labels(label_folder)
+    return {
+        'folder': folder_path,
+        'label_folder': label_folder,
+        'sort': data.get('sort', 'name'),
+        'descending': bool(data.get('descending', False)),
+        'limit': min(1000, max(1, int(data.get('limit', 100))))
+    }
+
 @app.route('/api/folder-images', methods=['POST'])
 def load_folder_images():
-    """从文件夹加载图片列表"""
+    """
+    分页加载文件夹中的图片列表
+
+    参数: folder_path, dataset_type, sort (name/mtime/size), descending,
+    labeled (true/false，只看已标注/未标注), class_id, limit,
+    cursor + direction (next/prev) 按游标翻页，或 offset 跳转到指定序号
+    """
     try:
         data = request.json
-        folder_path = Path(data['folder_path'])
-        dataset_type = data.get('dataset_type', 'train')
+        query = folder_query(data)
+        labeled = data.get('labeled')
+        page = catalog.page_images(
+            query['folder'], query['label_folder'], query['sort'], query['descending'],
+            labeled=None if labeled is None else parse_flag(str(labeled)),
+            class_id=data.get('class_id'),
+            cursor=data.get('cursor'),
+            before=data.get('direction') == 'prev',
+            offset=data.get('offset'),
+            limit=query['limit']
+        )
+        return jsonify({
+            'success': True,
+            'unlabeled': catalog.count_images(query['folder'], query['label_folder'], labeled=False),
+            **page
+        })
+    except (FileNotFoundError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
 
-        if not folder_path.exists() or not folder_path.is_dir():
-            return jsonify({'success': False, 'error': '文件夹不存在'}), 400
+@app.route('/api/folder-images/next-unlabeled', methods=['POST'])
+def next_unlabeled_image():
+    """
+    查找下一张未标注的图片
 
-        # 支持的图片格式
-        image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tiff'}
-        images = []
+    参数: folder_path, dataset_type, sort, descending, limit,
+    cursor（当前图片的游标）或 after_index（当前图片的序号），wrap（之后没有时从头查找，默认 true）
+    返回: 从找到的图片开始的一页图片，found=false 表示全部已标注
+    """
+    try:
+        data = request.json
+        query = folder_query(data)
+        page = catalog.next_unlabeled(
+            query['folder'], query['label_folder'], query['sort'], query['descending'],
+            cursor=data.get('cursor'),
+            after_index=data.get('after_index'),
+            wrap=bool(data.get('wrap', True)),
+            limit=query['limit']
+        )
+        if page is None:
+            return jsonify({'success': True, 'found': False})
+        return jsonify({'success': True, 'found': True, **page})
+    except (FileNotFoundError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
 
-        for file in folder_path.iterdir():
-            if file.suffix.lower() in image_extensions:
-                images.append({
-                    'path': str(file.absolute()),
-                    'name': file.name,
-                    'labeled': (DATASET_DIR / 'labels' / dataset_type / f'{file.stem}.txt').exists()
-                })
+def parse_flag(value):
+    """解析查询参数中的布尔过滤条件，未指定时返回 None"""
+    if value in (None, ''):
+        return None
+    return value.lower() in ('1', 'true', 'yes')
+
+@app.route('/api/catalog/images', methods=['GET'])
+def catalog_images():
+    """
+    分页查询图片索引
 
+    参数: split (train/val), folder (默认为数据集的 images/<split>),
+    labeled (true/false), class_id, offset, limit
+    """
+    try:
+        split = request.args.get('split', 'train')
+        if split not in SPLITS:
+            return jsonify({'success': False, 'error': f'无效的 split: {split}'}), 400
+        folder = Path(request.args.get('folder') or DATASET_DIR / 'images' / split)
+        label_folder = DATASET_DIR / 'labels' / split
+        class_id = request.args.get('class_id', type=int)
+        labeled = parse_flag(request.args.get('labeled'))
+        offset = max(0, request.args.get('offset', 0, type=int))
+        limit = min(1000, max(1, request.args.get('limit', 100, type=int)))
+
+        catalog.scan_folder(folder)
+        catalog.scan_labels(label_folder)
         return jsonify({
             'success': True,
-            'images': sorted(images, key=lambda x: x['name']),
-            'total': len(images)
+            'images': catalog.list_images(folder, label_folder, labeled, class_id, offset, limit),
+            'total': catalog.count_images(folder, label_folder, labeled, class_id),
+            'offset': offset,
+            'limit': limit
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/catalog/stats', methods=['GET'])
+def catalog_stats():
+    """数据集统计（图片数、已标注数、标注框数）"""
+    catalog.scan_dataset(DATASET_DIR)
+    return jsonify({'success': True, 'dataset_path': str(DATASET_DIR.absolute()), **catalog.dataset_stats(DATASET_DIR)})
+
+@app.route('/api/catalog/rescan', methods=['POST'])
+def catalog_rescan():
+    """
+    强制重新扫描数据集和模型目录
+
+    目录外部修改了已有文件（例如直接编辑标注文件）时使用；folder 可指定额外的图片目录
+    """
+    try:
+        data = request.json or {}
+        catalog.scan_dataset(DATASET_DIR, force=True)
+        catalog.scan_checkpoints(MODELS_DIR, force=True)
+        if data.get('folder'):
+            catalog.scan_folder(data['folder'], force=True)
+        return jsonify({'success': True, **catalog.dataset_stats(DATASET_DIR)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/dataset/compile', methods=['POST'])
+def compile_dataset():
+    """
+    编译数据集：并发校验图片和标注，生成训练清单和统计报告
+
+    参数: force（忽略缓存全部重新校验）
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        report = dataset_compiler.compile(load_classes(), force=bool(data.get('force', False)))
+        return jsonify({'success': True, **report})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/dataset/report', methods=['GET'])
+def dataset_report():
+    """最近一次数据集编译的统计报告"""
+    report = dataset_compiler.report()
+    if report is None:
+        return jsonify({'success': False, 'error': '数据集尚未编译'}), 404
+    return jsonify({'success': True, **report})
+
+@app.route('/api/dataset/split', methods=['GET', 'POST'])
+def dataset_split():
+    """
+    按类别分层划分训练集 / 验证集（POST），或查询当前划分（GET）
+
+    参数: val_ratio（默认 0.2）, seed（默认 0）；划分对象为所有已标注图片，以硬链接生成，不移动原文件
+    """
+    if request.method == 'GET':
+        summary = dataset_splitter.current()
+        if summary is None:
+            return jsonify({'success': False, 'error': '尚未划分'}), 404
+        return jsonify({'success': True, **summary})
+    try:
+        data = request.get_json(silent=True) or {}
+        classes = load_classes()
+        dataset_compiler.compile(classes)
+        summary = dataset_splitter.split(
+            dataset_compiler.labeled_pool(),
+            classes,
+            float(data.get('val_ratio', SPLIT_VAL_RATIO)),
+            int(data.get('seed', SPLIT_SEED))
+        )
+        return jsonify({'success': True, **summary})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/load-image', methods=['POST'])
 def load_image_file():
     """从本地文件系统读取图片"""
@@ -1400,11 +2380,52 @@ def load_image_file():
         if not image_path.exists() or not image_path.is_file():
             return jsonify({'success': False, 'error': '图片文件不存在'}), 400
 
-        return send_file(str(image_path), mimetype='image/jpeg')
+        return send_file(str(image_path), mimetype=guess_mimetype(image_path), conditional=True)
     except Exception as e:
         return str(e), 500
 
+@app.route('/api/preview', methods=['GET'])
+def image_preview():
+    """
+    缩小的图片预览（JPEG）
+
+    参数: path 图片路径, max 最大边长（默认 YOLO_PREVIEW_MAX_SIZE）,
+    v 版本号（通常为文件修改时间，带上时允许浏览器长期缓存）
+    支持 If-None-Match / If-Modified-Since 条件请求
+    """
+    try:
+        image_path = Path(request.args.get('path', ''))
+        if not image_path.is_file() or image_path.suffix.lower() not in IMAGE_EXTENSIONS:
+            return jsonify({'success': False, 'error': '图片文件不存在'}), 400
+        max_size = request.args.get('max', PREVIEW_MAX_SIZE, type=int)
+        cache_seconds = 86400 if request.args.get('v') else 0
+
+        # 浏览器已有同一版本的预览时无需生成
+        etag = previews.etag(image_path, max_size)
+        if etag in request.if_none_match:
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+
+        cached, etag = previews.get(image_path, max_size)
+        response = send_file(
+            str(cached),
+            mimetype='image/jpeg',
+            etag=etag,
+            last_modified=image_path.stat().st_mtime,
+            max_age=cache_seconds,
+            conditional=True
+        )
+        if not cache_seconds:
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 if __name__ == '__main__':
+    import multiprocessing
+    multiprocessing.freeze_support()
+
     print("\n" + "=" * 70)
     print("🎯 YOLOv8 训练系统 V2 - 专业版")
     print("=" * 70)
@@ -1418,6 +2439,8 @@ if __name__ == '__main__':
     print("\n数据集位置:")
     print(f"  {DATASET_DIR.absolute()}")
     print("\n按 Ctrl+C 停止服务")
-    print("=" * 70 + "\n")
+    print("=" * 70)
+    print_runtime_report()
+    print()
 
     app.run(host='0.0.0.0', port=7865, debug=False)